@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "base"
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        from . import metrics
+
+        if settings.METRICS_ENABLED:
+            connection_created.connect(metrics.install_db_execute_wrapper)
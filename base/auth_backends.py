@@ -0,0 +1,13 @@
+from django.contrib.auth.backends import ModelBackend
+
+from . import user_cache
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Like ModelBackend but the user object of the session is taken from the user cache (see `user_cache.py`).
+    """
+
+    def get_user(self, user_id):
+        # note: the loader returns None for inactive users
+        return user_cache.get_user(user_id, loader=super().get_user)
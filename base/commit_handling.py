@@ -0,0 +1,367 @@
+"""
+This module contains the repo-mutating part of the contribution handling (i.e. committing contributions from
+the database to the debate repo) and the commit queue.
+
+Committing spawns git processes and writes to disk. Every commit request is stored as `CommitJob` (see
+`enqueue(...)`). If `settings.COMMIT_QUEUE` is True, the views return immediately and the jobs are
+processed by a separate worker process (`python manage.py runcommitworker`). Otherwise the request commits
+itself (see `commit_now(...)`). Jobs for the same debate are processed in the order of their creation and
+never concurrently.
+
+Jobs are processed in batches: all pending jobs of a debate are committed together (one git commit per
+author role) and the database changes of a batch are one transaction. The worker waits until the oldest job
+is `settings.COMMIT_BATCH_WINDOW` seconds old before it starts a batch. Without the queue the requests which
+wait for the repo lock form the batch: the request which gets the lock commits the jobs of the others, too
+(group commit).
+"""
+
+import time
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.template import loader
+
+import fair_debate_md as fdmd
+
+from .models import Debate, Contribution, CommitJob, DebateUser
+from . import render_cache, repo_lock, response_cache, metrics
+
+logger = logging.getLogger("fair-debate")
+
+# seconds between two calls of `recover_interrupted_jobs` and `prune_finished_jobs` in the worker loop
+PRUNE_INTERVAL = 60
+
+
+def get_default_repo_files(context: dict = None) -> dict:
+
+    tmpl_path = "repo-default-files/README.md"
+    if context is None:
+        context = {}
+    res = {}
+
+    # TODO: iterate over templates
+    content = loader.render_to_string(tmpl_path, context, request=None)
+
+    res["README.md"] = content
+    return res
+
+
+class CommitError(RuntimeError):
+    """
+    The commit of a job failed (raised in requests whose job was committed by another request).
+    """
+
+    pass
+
+
+def commit_contributions(debate_obj: Debate, ctb_objs: QuerySet | list[Contribution]):
+    """
+    Commit the given (database) contributions to the repo of the debate and remove them from the database.
+
+    The whole operation is performed while holding the repo lock of the debate (see `repo_lock.py`).
+    Contributions which have been committed by a concurrent request in the meantime are skipped.
+    """
+
+    pk_list = [ctb_obj.pk for ctb_obj in ctb_objs]
+    with repo_lock.debate_lock(debate_obj.debate_key):
+        _commit_locked(debate_obj, pk_list)
+
+
+def _commit_locked(debate_obj: Debate, pk_list: list[int], jobs: list[CommitJob] = None):
+    """
+    Commit the contributions with the given primary keys (the caller holds the repo lock). Contributions
+    with different author roles are committed separately (`fdmd.commit_ctb_list` uses one author).
+
+    The deletion of the contributions, the counter and the state of `jobs` (-> done) are changed in one
+    transaction. The caches are purged after that transaction.
+    """
+
+    debate_key = debate_obj.debate_key
+
+    # reload inside the lock (the objects might have been committed (and deleted) in the meantime)
+    ctb_objs = Contribution.objects.filter(pk__in=pk_list).order_by("pk")
+
+    ctb_lists = {}
+    ctb_obj: Contribution
+    for ctb_obj in ctb_objs:
+        ctb = fdmd.DBContribution(ctb_key=ctb_obj.contribution_key, body=ctb_obj.body)
+        ctb_lists.setdefault(ctb_obj.contribution_key[-1], []).append(ctb)
+
+    if ctb_lists:
+        if "a" in [ctb.ctb_key for ctb in ctb_lists.get("a", [])]:
+            # This is the first contribution of a new debate
+            # -> a new repo has to be created
+            default_repo_files = get_default_repo_files(
+                context={
+                    "debate_slug": debate_key,
+                    "debate_url": "debate_url",
+                    "background_url": "background_url",
+                }
+            )
+            with metrics.timer("commit"):
+                fdmd.repo_handling.create_repo(
+                    settings.REPO_HOST_DIR, debate_key, initial_files=default_repo_files
+                )
+
+        for ctb_list in ctb_lists.values():
+            with metrics.timer("commit"):
+                fdmd.commit_ctb_list(settings.REPO_HOST_DIR, debate_key, ctb_list)
+
+    try:
+        with transaction.atomic():
+            if ctb_lists:
+                # only delete the committed objects (not those which might have been created in the meantime)
+                ctb_objs.delete()
+                n_committed = sum(len(ctb_list) for ctb_list in ctb_lists.values())
+                debate_obj.add_committed_contributions(n_committed, settings.REPO_HOST_DIR)
+            if jobs:
+                CommitJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                    state=CommitJob.State.DONE, update_date=timezone.now()
+                )
+                for job in jobs:
+                    job.state = CommitJob.State.DONE
+    finally:
+        if ctb_lists:
+            # only after the database changes: a request in between would cache the old debate and feed data
+            # (the repo has changed in any case)
+            render_cache.invalidate(debate_key)
+            response_cache.purge_debate(debate_key)
+
+
+# #################################################################################################
+
+# commit queue
+
+# #################################################################################################
+
+
+def enqueue(debate_obj: Debate, author: DebateUser, action: str, contribution_key: str = "") -> CommitJob:
+    action = CommitJob.Action(action)
+    job = CommitJob(debate=debate_obj, author=author, action=action, contribution_key=contribution_key)
+    job.save()
+    logger.debug(f"enqueued {job}")
+    return job
+
+
+def claim_next_job() -> CommitJob | None:
+    """
+    Return the oldest pending job whose debate has no running job (after marking it as running).
+    """
+
+    while True:
+        running_debates = CommitJob.objects.filter(state=CommitJob.State.RUNNING).values("debate_id")
+        job = (
+            CommitJob.objects.filter(state=CommitJob.State.PENDING)
+            .exclude(debate_id__in=running_debates)
+            .order_by("pk")
+            .first()
+        )
+        if job is None:
+            return None
+
+        # atomic state change (prevents that two workers process the same job)
+        # (`update` does not set `update_date` automatically, it is the start of the lease)
+        n = CommitJob.objects.filter(pk=job.pk, state=CommitJob.State.PENDING).update(
+            state=CommitJob.State.RUNNING, update_date=timezone.now()
+        )
+        if n == 1:
+            job.state = CommitJob.State.RUNNING
+            return job
+
+
+def claim_pending_jobs(debate_obj: Debate) -> list[CommitJob]:
+    """
+    Mark all pending jobs of the debate as running and return them (the caller holds the repo lock).
+    """
+
+    jobs = []
+    for job in CommitJob.objects.filter(debate=debate_obj, state=CommitJob.State.PENDING).order_by("pk"):
+        # atomic state change (a worker which does not hold the repo lock might claim the job, too)
+        n = CommitJob.objects.filter(pk=job.pk, state=CommitJob.State.PENDING).update(
+            state=CommitJob.State.RUNNING, update_date=timezone.now()
+        )
+        if n == 1:
+            job.state = CommitJob.State.RUNNING
+            jobs.append(job)
+    return jobs
+
+
+def get_job_contributions(job: CommitJob) -> list[Contribution]:
+    debate_obj = job.debate
+    if job.action == CommitJob.Action.COMMIT:
+        ctb_objs = list(debate_obj.contribution_set.filter(contribution_key=job.contribution_key))
+        if len(ctb_objs) != 1:
+            msg = (
+                f"Unexpected number of contribution objects ({len(ctb_objs)}) for "
+                f"{debate_obj.debate_key} ctb {job.contribution_key}"
+            )
+            raise ValueError(msg)
+        return ctb_objs
+    return list(debate_obj.contribution_set.all())
+
+
+def commit_job_batch(debate_obj: Debate, jobs: list[CommitJob]):
+    """
+    Commit the contributions of the given (running) jobs of one debate together and set the state of the
+    jobs (the caller holds the repo lock). Jobs whose contributions are missing fail individually. If the
+    commit fails, all remaining jobs fail and the exception is raised.
+    """
+
+    pk_list = []
+    valid_jobs = []
+    for job in jobs:
+        try:
+            ctb_objs = get_job_contributions(job)
+        except ValueError as ex:
+            logger.warning(f"{job} failed: {ex!r}")
+            job.state = CommitJob.State.FAILED
+            job.error_msg = repr(ex)
+            job.save()
+            continue
+        pk_list.extend(ctb_obj.pk for ctb_obj in ctb_objs if ctb_obj.pk not in pk_list)
+        valid_jobs.append(job)
+
+    if not valid_jobs:
+        return
+
+    try:
+        _commit_locked(debate_obj, pk_list, jobs=valid_jobs)
+    except Exception as ex:
+        logger.warning(f"batch of {len(valid_jobs)} job(s) for {debate_obj} failed: {ex!r}")
+        CommitJob.objects.filter(pk__in=[job.pk for job in valid_jobs]).update(
+            state=CommitJob.State.FAILED, error_msg=repr(ex), update_date=timezone.now()
+        )
+        for job in valid_jobs:
+            job.state = CommitJob.State.FAILED
+            job.error_msg = repr(ex)
+        raise
+    logger.debug(f"committed batch of {len(valid_jobs)} job(s) for {debate_obj}")
+
+
+def process_job(job: CommitJob) -> int:
+    """
+    Process the (running) job together with all other pending jobs of its debate. Return the number of
+    processed jobs.
+    """
+
+    debate_obj = job.debate
+
+    # wait a little for further jobs (e.g. a user who commits several contributions in a row)
+    age = (timezone.now() - job.create_date).total_seconds()
+    if age < settings.COMMIT_BATCH_WINDOW:
+        time.sleep(settings.COMMIT_BATCH_WINDOW - age)
+
+    jobs = [job]
+    try:
+        with repo_lock.debate_lock(debate_obj.debate_key):
+            jobs.extend(claim_pending_jobs(debate_obj))
+            commit_job_batch(debate_obj, jobs)
+    except repo_lock.RepoLockTimeout as ex:
+        # the repo is busy (e.g. by a commit of a web worker) -> try again later
+        logger.warning(f"{job}: {ex}")
+        job.state = CommitJob.State.PENDING
+        job.save()
+    except Exception:
+        # the state of the jobs has already been set (see `commit_job_batch`)
+        pass
+    return len(jobs)
+
+
+def commit_now(debate_obj: Debate, author: DebateUser | None, action: str, contribution_key: str = ""):
+    """
+    Perform the commit inside the request (`settings.COMMIT_QUEUE` is False).
+
+    The commit is stored as job before the repo lock is acquired. Thus, if several requests for the same
+    debate arrive while a commit is running, the first of them which gets the lock commits the jobs of the
+    others, too (they only have to check the state of their job).
+
+    Raise `repo_lock.RepoLockTimeout` if the debate is busy and `CommitError` if the job failed in the batch
+    of another request.
+    """
+
+    job = enqueue(debate_obj, author, action, contribution_key)
+    try:
+        try:
+            with repo_lock.debate_lock(debate_obj.debate_key):
+                job.refresh_from_db(fields=["state", "error_msg"])
+                if job.state in (CommitJob.State.PENDING, CommitJob.State.RUNNING):
+                    # (running: the request which claimed the job has died while holding the lock)
+                    CommitJob.objects.filter(pk=job.pk).update(
+                        state=CommitJob.State.RUNNING, update_date=timezone.now()
+                    )
+                    job.state = CommitJob.State.RUNNING
+                    commit_job_batch(debate_obj, [job] + claim_pending_jobs(debate_obj))
+        except repo_lock.RepoLockTimeout:
+            # another request might have committed the job while this one was waiting
+            job.refresh_from_db(fields=["state", "error_msg"])
+            if job.state not in (CommitJob.State.DONE, CommitJob.State.FAILED):
+                raise
+
+        if job.state == CommitJob.State.FAILED:
+            raise CommitError(f"commit failed: {job.error_msg}")
+    finally:
+        # the jobs of synchronous commits are not polled by the js api (a pending job is withdrawn)
+        CommitJob.objects.filter(pk=job.pk).delete()
+
+
+def prune_finished_jobs(max_age: float = None) -> int:
+    """
+    Delete done and failed jobs which are older than `max_age` seconds (default:
+    `settings.COMMIT_JOB_RETENTION`). Return the number of deleted jobs.
+    """
+    if max_age is None:
+        max_age = settings.COMMIT_JOB_RETENTION
+    n, _ = CommitJob.objects.filter(
+        state__in=[CommitJob.State.DONE, CommitJob.State.FAILED],
+        update_date__lt=timezone.now() - timedelta(seconds=max_age),
+    ).delete()
+    return n
+
+
+def process_pending_jobs() -> int:
+    """
+    Process jobs until the queue is empty. Return the number of processed jobs.
+    """
+    n = 0
+    while job := claim_next_job():
+        n += process_job(job)
+        if job.state == CommitJob.State.PENDING:
+            # the job was postponed -> don't retry it immediately
+            break
+    return n
+
+
+def recover_interrupted_jobs(lease: float = None) -> int:
+    """
+    Reset jobs which are marked as running for more than `lease` seconds (default:
+    `settings.COMMIT_JOB_LEASE`), e.g. because the worker was killed. Jobs of other workers which are
+    still running are not affected (the lease is longer than any regular commit). Return the number of reset
+    jobs.
+    """
+    if lease is None:
+        lease = settings.COMMIT_JOB_LEASE
+    return CommitJob.objects.filter(
+        state=CommitJob.State.RUNNING,
+        update_date__lt=timezone.now() - timedelta(seconds=lease),
+    ).update(state=CommitJob.State.PENDING, update_date=timezone.now())
+
+
+def run_worker(poll_interval: float = 0.5):
+    logger.info("commit worker started")
+    last_prune_time = 0
+    while True:
+        if time.monotonic() - last_prune_time > PRUNE_INTERVAL:
+            # (jobs of workers which died while processing them)
+            if n := recover_interrupted_jobs():
+                logger.warning(f"reset {n} interrupted job(s)")
+            # (the finished jobs are only needed for the status requests of the js api)
+            prune_finished_jobs()
+            last_prune_time = time.monotonic()
+        if process_pending_jobs() == 0:
+            time.sleep(poll_interval)
+        # (repo lock and database lock statistics of the worker)
+        metrics.maybe_write_snapshot()
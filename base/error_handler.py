@@ -1,30 +1,53 @@
 import logging
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import HttpResponse
 from django.conf import settings
 
-import ipydex
-
-from .views import error_page
 from .utils import UsageError
 
 logger = logging.getLogger("fair-debate")
 
 
+def error_page(request, **kwargs):
+    # lazy import: the middleware is instantiated at startup and the views module pulls in the whole
+    # rendering stack (fair_debate_md, git, bleach, ...) which is loaded by the first request (or preloaded)
+    from .views import error_page as views_error_page
+
+    return views_error_page(request, **kwargs)
+
+
 class ErrorHandlerMiddleware:
+    # supporting both modes prevents that django runs the async views (SERVER_MODE = "asgi") in a thread
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
         if response.status_code == 404 and settings.CATCH_EXCEPTIONS:
-            msg = f"Page <tt>{request.get_full_path()}</tt> could not be found. <!-- utc_404_error -->"
-            err_page = error_page(request, title="404 not found", msg=msg, status=404)
-            return err_page
+            return self._get_404_page(request)
 
         return response
 
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.status_code == 404 and settings.CATCH_EXCEPTIONS:
+            return await sync_to_async(self._get_404_page)(request)
+
+        return response
+
+    def _get_404_page(self, request):
+        msg = f"Page <tt>{request.get_full_path()}</tt> could not be found. <!-- utc_404_error -->"
+        err_page = error_page(request, title="404 not found", msg=msg, status=404)
+        return err_page
+
     def process_exception(self, request, exception):
         if settings.CATCH_EXCEPTIONS:
 
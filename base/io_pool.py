@@ -0,0 +1,36 @@
+"""
+This module provides a bounded thread pool for the slow (git and disk) operations of the async views
+(see `views.AsyncShowDebateView`).
+
+The event loop of an ASGI worker must not be blocked by such operations. The pool size
+(`settings.REPO_IO_THREADS`) limits the number of concurrent repo reads per worker process.
+"""
+
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_executor: ThreadPoolExecutor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.REPO_IO_THREADS, thread_name_prefix="repo_io")
+    return _executor
+
+
+async def run(func, *args, **kwargs):
+    """
+    Run `func(*args, **kwargs)` in the pool and return the result (exceptions are propagated).
+
+    Note: `func` must not access the database (the threads of the pool have their own connections which
+    are never closed).
+    """
+    loop = asyncio.get_running_loop()
+    # run in a copy of the current context (e.g. for the request metrics, see metrics.py)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
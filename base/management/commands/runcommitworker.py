@@ -0,0 +1,33 @@
+"""
+This module enables the command `python manage.py runcommitworker` which processes the commit queue
+(see `base/commit_handling.py`, only relevant if `COMMIT_QUEUE = true` in config.toml).
+"""
+
+from django.core.management.base import BaseCommand
+
+from base import commit_handling
+
+
+class Command(BaseCommand):
+    help = "Process the commit queue (run forever or only once with --once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="process all pending jobs and exit",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.5,
+            help="time (in seconds) to wait before checking an empty queue again",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            n = commit_handling.process_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"{n} job(s) processed"))
+            return
+
+        commit_handling.run_worker(poll_interval=options["poll_interval"])
@@ -15,9 +15,12 @@ from django.core.management.base import BaseCommand, CommandError
 from django.core.management import call_command
 from django.conf import settings
 
+from base.models import Debate
 
+
+# note: base.debatefeedentry is derived data (recreated when the debates are loaded)
 model_blacklist = ["contenttypes*", "sessions*", r"admin\.logentry",
-                   r"auth\.permission"]
+                   r"auth\.permission", r"base\.debatefeedentry"]
 
 
 class Command(BaseCommand):
@@ -41,6 +44,11 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        if duplicate_keys := Debate.get_duplicate_keys():
+            # such a backup could not be loaded (Debate.debate_key is unique)
+            msg = f"Duplicate debate keys found: {duplicate_keys}. Resolve them before creating a backup."
+            raise CommandError(msg)
+
         buf = StringIO()
         call_command("dumpdata", stdout=buf)
         buf.seek(0)
@@ -0,0 +1,38 @@
+"""
+This module enables the command `python manage.py updatedebatemetadata` which (re)computes the stored
+metadata (title, number of answers, deepest level) of all debates from their repos (e.g. after loading a
+backup which was created before these fields existed).
+"""
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from base.models import Debate, update_debate_feed
+from base import response_cache
+
+
+class Command(BaseCommand):
+    help = "Update the stored metadata of all debates from their repos."
+
+    def handle(self, *args, **options):
+        n_updated = 0
+        debate_obj: Debate
+        for debate_obj in Debate.objects.all():
+            try:
+                debate_obj.update_metadata_from_repo(settings.REPO_HOST_DIR)
+            except FileNotFoundError:
+                # debate without committed contributions
+                continue
+            # note: `.save()` would change update_date (auto_now)
+            # -> use `.update()` and update the feed explicitly
+            Debate.objects.filter(pk=debate_obj.pk).update(
+                repo_title=debate_obj.repo_title,
+                num_answers=debate_obj.num_answers,
+                deepest_level=debate_obj.deepest_level,
+            )
+            update_debate_feed(debate_obj)
+            n_updated += 1
+
+        # titles etc. are part of the cached pages
+        response_cache.purge_all()
+        self.stdout.write(self.style.SUCCESS(f"{n_updated} debate(s) updated"))
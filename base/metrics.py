@@ -0,0 +1,429 @@
+"""
+This module implements the request-level performance instrumentation.
+
+`MetricsMiddleware` measures the wall time of every request. During the request a `RequestMetrics` object
+(context variable) collects the time spent in database queries (execute wrapper of every connection),
+template rendering (`TimedDjangoTemplates`), `fdmd.load_repo` and committing (`timer(...)` at the call
+sites). The components may overlap (e.g. a lazy queryset which is evaluated in a template).
+
+After the response is created the numbers are added to the histograms of the url name (e.g. "show_debate")
+in `registry` (per process, like `repo_lock.stats`) and (if `settings.METRICS_LOG_REQUESTS`) written as one
+json line to the log.
+
+Every process regularly writes a snapshot of its registry to `settings.METRICS_DIR`. The metrics endpoint
+(see `views.metrics_view` and `prometheus.py`) serves the sum over all processes (see
+`get_aggregated_snapshot`).
+
+Note: for streaming responses the time for sending the content is not included.
+"""
+
+import os
+import copy
+import glob
+import json
+import time
+import fcntl
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError
+from django.template.backends.django import DjangoTemplates, Template as DjangoBackendTemplate
+
+from . import repo_lock
+
+logger = logging.getLogger("fair-debate.metrics")
+
+# components of the request time (see `timer`)
+COMPONENTS = ["db", "template", "load_repo", "commit"]
+
+# upper bounds (seconds) of the histogram buckets (the last bucket is "+Inf")
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# process wide counters (see `MetricsRegistry.increment`)
+COUNTERS = [
+    "render_cache_hits",
+    "render_cache_misses",
+    "response_cache_hits",
+    "response_cache_misses",
+    "db_transactions",
+    "db_lock_wait_seconds",
+    "db_locked_errors",
+]
+
+# url name for requests which could not be resolved (404)
+UNRESOLVED = "<unresolved>"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Accumulated durations (seconds) and the number of database queries of the current request.
+    """
+
+    def __init__(self):
+        self.durations = dict.fromkeys(COMPONENTS, 0.0)
+        self.n_queries = 0
+        self._active_components = set()
+
+
+@contextmanager
+def timer(component: str):
+    """
+    Add the duration of the block to `component` of the current request (no-op outside of a request).
+    Nested timers of the same component are only counted once.
+    """
+    request_metrics = _current.get()
+    if request_metrics is None or component in request_metrics._active_components:
+        yield
+        return
+
+    request_metrics._active_components.add(component)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.durations[component] += time.perf_counter() - t0
+        request_metrics._active_components.discard(component)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    request_metrics = _current.get()
+    is_begin = sql.startswith("BEGIN")
+    if request_metrics is None and not is_begin:
+        return execute(sql, params, many, context)
+
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as ex:
+        if "locked" in str(ex):
+            registry.increment("db_locked_errors")
+        raise
+    finally:
+        duration = time.perf_counter() - t0
+        if is_begin:
+            # sqlite (transaction_mode IMMEDIATE): this is where a writer waits for the database lock
+            registry.increment("db_transactions")
+            registry.increment("db_lock_wait_seconds", duration)
+        if request_metrics is not None:
+            request_metrics.durations["db"] += duration
+            request_metrics.n_queries += 1
+
+
+def install_db_execute_wrapper(sender, connection, **kwargs):
+    """
+    Receiver of the `connection_created` signal (connected in `apps.BaseConfig.ready`).
+    """
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # number of observations per bucket (not cumulative), the last entry is the "+Inf" bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class MetricsRegistry:
+    """
+    Simple (per process) histograms per url name and counters (e.g. cache hits, see `COUNTERS`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.views = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _new_view_entry(self) -> dict:
+        histograms = {"wall": Histogram(TIME_BUCKETS)}
+        for component in COMPONENTS:
+            histograms[component] = Histogram(TIME_BUCKETS)
+        histograms["n_queries"] = Histogram(QUERY_COUNT_BUCKETS)
+        return {"n_requests": 0, "n_errors": 0, "histograms": histograms}
+
+    def record(self, view_name: str, status_code: int, wall_time: float, request_metrics: RequestMetrics):
+        with self._lock:
+            view_entry = self.views.get(view_name)
+            if view_entry is None:
+                view_entry = self.views[view_name] = self._new_view_entry()
+
+            view_entry["n_requests"] += 1
+            if status_code >= 500:
+                view_entry["n_errors"] += 1
+            histograms = view_entry["histograms"]
+            histograms["wall"].observe(wall_time)
+            for component, duration in request_metrics.durations.items():
+                histograms[component].observe(duration)
+            histograms["n_queries"].observe(request_metrics.n_queries)
+
+    def as_dict(self) -> dict:
+        """
+        Return the data of all views (json serializable).
+        """
+        with self._lock:
+            return {
+                view_name: {
+                    "n_requests": view_entry["n_requests"],
+                    "n_errors": view_entry["n_errors"],
+                    "histograms": {name: hist.as_dict() for name, hist in view_entry["histograms"].items()},
+                }
+                for view_name, view_entry in self.views.items()
+            }
+
+
+registry = MetricsRegistry()
+
+
+def get_view_name(request) -> str:
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None:
+        return UNRESOLVED
+    return resolver_match.url_name or resolver_match.view_name
+
+
+class MetricsMiddleware:
+    # must be the first entry of settings.MIDDLEWARE (to include the time of the other middlewares)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        t0 = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - t0, request_metrics)
+        return response
+
+    async def __acall__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        t0 = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - t0, request_metrics)
+        return response
+
+    def _record(self, request, response, wall_time: float, request_metrics: RequestMetrics):
+        view_name = get_view_name(request)
+        registry.record(view_name, response.status_code, wall_time, request_metrics)
+        maybe_write_snapshot()
+
+        if settings.METRICS_LOG_REQUESTS:
+            data = {
+                "view": view_name,
+                "method": request.method,
+                "status": response.status_code,
+                "wall": round(wall_time, 6),
+                **{name: round(duration, 6) for name, duration in request_metrics.durations.items()},
+                "n_queries": request_metrics.n_queries,
+            }
+            logger.info(f"request_metrics {json.dumps(data)}")
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Template backend which adds the render time of the templates to the current request (see `timer`).
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class TimedTemplate(DjangoBackendTemplate):
+    def render(self, context=None, request=None):
+        with timer("template"):
+            return super().render(context, request)
+
+
+# #################################################################################################
+
+# aggregation over all processes
+
+# #################################################################################################
+
+# The snapshots are stored as `pid-<pid>.json`. Snapshots of terminated processes (e.g. workers which were
+# restarted because of `max_requests`) are merged into the archive such that the counters never decrease.
+ARCHIVE_FNAME = "archive.json"
+ARCHIVE_LOCK_FNAME = "archive.lock"
+
+_last_snapshot_time = 0.0
+
+
+def get_empty_snapshot() -> dict:
+    return {"views": {}, "counters": dict.fromkeys(COUNTERS, 0), "repo_lock": repo_lock.LockStats().as_dict()}
+
+
+def get_snapshot() -> dict:
+    """
+    Return the metrics of this process (json serializable).
+    """
+    with registry._lock:
+        counters = dict(registry.counters)
+    return {"views": registry.as_dict(), "counters": counters, "repo_lock": repo_lock.stats.as_dict()}
+
+
+def write_snapshot():
+    global _last_snapshot_time
+
+    metrics_dir = settings.METRICS_DIR
+    if not metrics_dir:
+        return
+    os.makedirs(metrics_dir, exist_ok=True)
+    _write_json(os.path.join(metrics_dir, f"pid-{os.getpid()}.json"), get_snapshot())
+    _last_snapshot_time = time.monotonic()
+
+
+def maybe_write_snapshot():
+    """
+    Write the snapshot of this process if the last one is older than `settings.METRICS_SNAPSHOT_INTERVAL`.
+    """
+    if time.monotonic() - _last_snapshot_time >= settings.METRICS_SNAPSHOT_INTERVAL:
+        write_snapshot()
+
+
+def merge_snapshots(snapshot1: dict, snapshot2: dict) -> dict:
+    res = copy.deepcopy(snapshot1)
+
+    for view_name, view_entry in snapshot2["views"].items():
+        target = res["views"].get(view_name)
+        if target is None:
+            res["views"][view_name] = copy.deepcopy(view_entry)
+            continue
+        target["n_requests"] += view_entry["n_requests"]
+        target["n_errors"] += view_entry["n_errors"]
+        for name, hist in view_entry["histograms"].items():
+            target_hist = target["histograms"].get(name)
+            if target_hist is None:
+                target["histograms"][name] = copy.deepcopy(hist)
+                continue
+            target_hist["counts"] = [n1 + n2 for n1, n2 in zip(target_hist["counts"], hist["counts"])]
+            target_hist["sum"] += hist["sum"]
+            target_hist["count"] += hist["count"]
+
+    for name, value in snapshot2["counters"].items():
+        res["counters"][name] = res["counters"].get(name, 0) + value
+
+    for name, value in snapshot2["repo_lock"].items():
+        if name.startswith("max_"):
+            res["repo_lock"][name] = max(res["repo_lock"].get(name, 0), value)
+        else:
+            res["repo_lock"][name] = res["repo_lock"].get(name, 0) + value
+
+    return res
+
+
+def get_aggregated_snapshot() -> dict:
+    """
+    Return the sum of the snapshots of all processes (only the current process if `settings.METRICS_DIR`
+    is empty).
+    """
+    metrics_dir = settings.METRICS_DIR
+    if not metrics_dir:
+        return get_snapshot()
+
+    write_snapshot()
+    archive_path = os.path.join(metrics_dir, ARCHIVE_FNAME)
+
+    # the lock prevents that two processes merge the same snapshot into the archive
+    with open(os.path.join(metrics_dir, ARCHIVE_LOCK_FNAME), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        archive = _read_json(archive_path) or get_empty_snapshot()
+        live_snapshots = []
+        terminated_fpaths = []
+        for fpath in glob.glob(os.path.join(metrics_dir, "pid-*.json")):
+            snapshot = _read_json(fpath)
+            if snapshot is None:
+                continue
+            pid = int(os.path.basename(fpath)[len("pid-") : -len(".json")])
+            if _process_exists(pid):
+                live_snapshots.append(snapshot)
+            else:
+                archive = merge_snapshots(archive, snapshot)
+                terminated_fpaths.append(fpath)
+
+        if terminated_fpaths:
+            _write_json(archive_path, archive)
+            for fpath in terminated_fpaths:
+                os.remove(fpath)
+
+    res = archive
+    for snapshot in live_snapshots:
+        res = merge_snapshots(res, snapshot)
+    return res
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        pass
+    return True
+
+
+def _write_json(fpath: str, data: dict):
+    # write to a temporary file first (the readers must never see a partially written file)
+    tmp_fpath = f"{fpath}.{threading.get_ident()}.tmp"
+    with open(tmp_fpath, "w") as fp:
+        json.dump(data, fp)
+    os.replace(tmp_fpath, fpath)
+
+
+def _read_json(fpath: str) -> dict | None:
+    try:
+        with open(fpath) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -1,6 +1,15 @@
+import base64
+import datetime
+
 from django.contrib import admin
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+
+from . import utils, user_cache
 
 
 class Repo(models.Model):
@@ -22,7 +31,7 @@ class Debate(models.Model):
         HIDDEN = "hidden", "Hidden"
         PRIVATE = "private", "Private"
 
-    debate_key = models.CharField(max_length=255)  # TODO: add unique=True
+    debate_key = models.CharField(max_length=255, unique=True)
     repo_a = models.ForeignKey(Repo, null=True, on_delete=models.SET_NULL, related_name="debate_a")
     repo_b = models.ForeignKey(Repo, null=True, on_delete=models.SET_NULL, related_name="debate_b")
 
@@ -43,6 +52,12 @@ class Debate(models.Model):
         max_length=20, choices=Discoverability.choices, default=Discoverability.PUBLIC
     )
 
+    # metadata of the committed state (stored at commit time, see `update_metadata_from_repo`)
+    # -> listings etc. do not need to access the repo
+    repo_title = models.CharField(max_length=1000, blank=True, default="")
+    num_answers = models.IntegerField(default=0)
+    deepest_level = models.IntegerField(default=0)
+
     # this field serves to introduce a database change to test/debug the effect of db changes in deployment
     # currently needed to reuse backups
     # irrelevant_attribute = models.IntegerField(default=0)
@@ -56,10 +71,38 @@ class Debate(models.Model):
         else:
             return None
 
-    # TODO: take this from metadata
     @property
     def title(self):
-        return self.debate_key
+        return self.repo_title or self.debate_key
+
+    def update_metadata_from_repo(self, repo_host_dir: str):
+        """
+        Set the metadata attributes from the working tree of the repo (the object is not saved).
+        """
+        metadata = utils.get_repo_metadata(repo_host_dir, self.debate_key)
+        self.repo_title = metadata["title"]
+        self.num_answers = metadata["num_answers"]
+        self.deepest_level = metadata["deepest_level"]
+
+    def add_committed_contributions(self, n: int, repo_host_dir: str):
+        """
+        Increment `n_committed_contributions` by `n` and store the metadata of the repo (and update_date).
+
+        The counter is incremented by the database (F expression), i.e. the value of this object does not
+        matter and concurrent increments are not lost (the new values are loaded afterwards). Because
+        `QuerySet.update` does not send post_save, the feed is updated explicitly (in the same transaction).
+        """
+        self.update_metadata_from_repo(repo_host_dir)
+        with transaction.atomic():
+            Debate.objects.filter(pk=self.pk).update(
+                n_committed_contributions=models.F("n_committed_contributions") + n,
+                repo_title=self.repo_title,
+                num_answers=self.num_answers,
+                deepest_level=self.deepest_level,
+                update_date=timezone.now(),
+            )
+            self.refresh_from_db(fields=["n_committed_contributions", "update_date"])
+            update_debate_feed(self)
 
     @staticmethod
     def get_for_user(user: DebateUser, role="all", limit: int = None) -> models.QuerySet:
@@ -75,7 +118,21 @@ class Debate(models.Model):
         if role == "all":
             res = set_a | set_b
 
-        return res.order_by("-update_date")[:limit]
+        return res.order_by("-update_date", "-id")[:limit]
+
+    @staticmethod
+    def get_duplicate_keys() -> list[str]:
+        """
+        Return those debate keys which occur more than once (this would violate the unique constraint,
+        e.g. when a backup from the time before the constraint is loaded).
+        """
+        res = (
+            Debate.objects.values("debate_key")
+            .annotate(n=models.Count("pk"))
+            .filter(n__gt=1)
+            .values_list("debate_key", flat=True)
+        )
+        return list(res)
 
     @staticmethod
     def get_all(limit: int = None, exclude_uncommitted=True) -> models.QuerySet:
@@ -83,14 +140,164 @@ class Debate(models.Model):
         result is sorted for "newest first"
         """
         if exclude_uncommitted:
-            return Debate.objects.filter(n_committed_contributions__gt=0).order_by("-update_date")[:limit]
+            res = Debate.objects.filter(n_committed_contributions__gt=0)
         else:
-            return Debate.objects.all().order_by("-update_date")[:limit]
+            res = Debate.objects.all()
+        # note: the id makes the order unique (same as in DebateFeedEntry.ORDERING)
+        return res.order_by("-update_date", "-id")[:limit]
 
     def __str__(self):
         return f"Debate<{self.debate_key}>"
 
 
+class DebateFeedEntry(models.Model):
+    """
+    Denormalized (precomputed) listing data of a debate. There is one global entry (user=None) per debate
+    and one entry for each participant. Thus the debate lists of the landing page are served by one
+    indexed range scan without touching the Debate table.
+
+    The entries are updated automatically whenever a Debate object is saved (see `update_debate_feed`)
+    and removed together with the debate (cascade).
+    """
+
+    debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name="feed_entries")
+    # None means: global entry
+    user = models.ForeignKey(DebateUser, null=True, on_delete=models.CASCADE)
+    # role of `user` in the debate ("a", "b" or "" for the global entry)
+    user_role = models.CharField(max_length=1, blank=True, default="")
+
+    debate_key = models.CharField(max_length=255)
+    title = models.CharField(max_length=1000)
+    num_answers = models.IntegerField(default=0)
+    n_committed_contributions = models.IntegerField(default=0)
+    discoverability = models.CharField(max_length=20, choices=Debate.Discoverability.choices)
+    update_date = models.DateTimeField()
+
+    # (update_date, debate_id) is unique within the global entries and within the entries of one user
+    # and thus serves as key for the pagination (see `get_page`)
+    ORDERING = ("-update_date", "-debate_id")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["discoverability", "-update_date", "-debate"],
+                condition=models.Q(user__isnull=True),
+                name="feed_discoverability_idx",
+            ),
+            models.Index(fields=["user", "-update_date", "-debate"], name="feed_user_idx"),
+        ]
+
+    @staticmethod
+    def get_public(limit: int = None, exclude_uncommitted=False) -> models.QuerySet:
+        """
+        result is sorted for "newest first"
+        """
+        res = DebateFeedEntry.objects.filter(user=None, discoverability=Debate.Discoverability.PUBLIC)
+        if exclude_uncommitted:
+            res = res.filter(n_committed_contributions__gt=0)
+        return res.order_by(*DebateFeedEntry.ORDERING)[:limit]
+
+    @staticmethod
+    def get_for_user(user: DebateUser, role="all", limit: int = None) -> models.QuerySet:
+        """
+        result is sorted for "newest first"
+        """
+        assert role in ("all", "a", "b")
+        res = DebateFeedEntry.objects.filter(user=user)
+        if role != "all":
+            res = res.filter(user_role=role)
+        return res.order_by(*DebateFeedEntry.ORDERING)[:limit]
+
+    @staticmethod
+    def get_page(
+        queryset: models.QuerySet, cursor: str = None, limit: int = 20
+    ) -> tuple[list["DebateFeedEntry"], str]:
+        """
+        Keyset pagination: return the next `limit` entries after `cursor` (sorted for "newest first") and
+        the cursor for the following page (None for the last page).
+
+        The cost of a page does not depend on its depth (no OFFSET).
+
+        :param queryset:    (unsliced) result of `get_public(...)` or `get_for_user(...)`
+        :param cursor:      value returned for the previous page (None for the first page)
+        """
+
+        if cursor is not None:
+            update_date, debate_id = DebateFeedEntry.decode_cursor(cursor)
+            queryset = queryset.filter(
+                models.Q(update_date__lt=update_date)
+                | models.Q(update_date=update_date, debate_id__lt=debate_id)
+            )
+
+        entries = list(queryset[: limit + 1])
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = DebateFeedEntry.encode_cursor(entries[-1])
+        else:
+            next_cursor = None
+        return entries, next_cursor
+
+    @staticmethod
+    def encode_cursor(entry: "DebateFeedEntry") -> str:
+        raw = f"{entry.update_date.isoformat()}|{entry.debate_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+        """
+        raise ValueError for invalid cursors
+        """
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            date_str, debate_id = raw.split("|")
+            return datetime.datetime.fromisoformat(date_str), int(debate_id)
+        except (ValueError, UnicodeError) as ex:
+            raise ValueError(f"invalid cursor: {cursor}") from ex
+
+    def __str__(self):
+        return f"DebateFeedEntry<{self.debate_key}, {self.user_id}>"
+
+
+def update_debate_feed(debate: Debate):
+    """
+    Replace the feed entries of the given debate by up-to-date ones.
+    """
+
+    common_data = dict(
+        debate_key=debate.debate_key,
+        title=debate.title,
+        num_answers=debate.num_answers,
+        n_committed_contributions=debate.n_committed_contributions,
+        discoverability=debate.discoverability,
+        update_date=debate.update_date,
+    )
+    entries = [DebateFeedEntry(debate_id=debate.pk, user_id=None, **common_data)]
+    for user_role, user_id in (("a", debate.user_a_id), ("b", debate.user_b_id)):
+        if user_id is not None and user_id not in [entry.user_id for entry in entries]:
+            entry = DebateFeedEntry(debate_id=debate.pk, user_id=user_id, user_role=user_role, **common_data)
+            entries.append(entry)
+
+    with transaction.atomic():
+        DebateFeedEntry.objects.filter(debate_id=debate.pk).delete()
+        DebateFeedEntry.objects.bulk_create(entries)
+
+
+@receiver([post_save, post_delete], sender=DebateUser)
+def _debate_user_changed(sender, instance: DebateUser, **kwargs):
+    # e.g. password change -> the cached object must not be used for the session verification anymore
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Debate)
+def _debate_saved(sender, instance: Debate, raw: bool, update_fields=None, **kwargs):
+    # note: this is also called for raw saves (loaddata) -> feed is also complete after loading a backup
+    if update_fields is not None and set(update_fields) == {"update_date"}:
+        # (e.g. deleted contribution) the other fields of `instance` might be stale
+        DebateFeedEntry.objects.filter(debate_id=instance.pk).update(update_date=instance.update_date)
+        return
+
+    # `instance` might be stale apart from the saved fields (e.g. the counter of a concurrent commit)
+    update_debate_feed(Debate.objects.get(pk=instance.pk))
 
 
 class DebateAsUserAInline(admin.TabularInline):
@@ -127,9 +334,73 @@ class Contribution(models.Model):
     contribution_key = models.CharField(max_length=255)
     body = models.TextField()  # store plain markdown source
 
+    class Meta:
+        constraints = [
+            # this also serves as index for lookups by (debate, contribution_key) (post, commit, delete)
+            models.UniqueConstraint(fields=["debate", "contribution_key"], name="unique_ctb_key_per_debate"),
+        ]
+        indexes = [
+            # lookup of the drafts of an author (every rendering of a debate)
+            models.Index(fields=["debate", "author"], name="ctb_debate_author_idx"),
+        ]
+
 
 class ContributionAdmin(admin.ModelAdmin):
     pass
 
 
 admin.site.register(Contribution, ContributionAdmin)
+
+
+class CommitJob(models.Model):
+    """
+    Entry of the commit queue (see commit_handling.py). Jobs are processed by a separate worker process
+    (`python manage.py runcommitworker`) in the order of their creation, separately for each debate.
+    Synchronous commits are stored as jobs, too (until they are done), such that concurrent commits to the
+    same debate can be batched.
+    """
+
+    class Action(models.TextChoices):
+        COMMIT = "commit", "Commit"
+        COMMIT_ALL = "commit_all", "Commit all"
+
+    class State(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    debate = models.ForeignKey(Debate, on_delete=models.CASCADE)
+    # user who triggered the commit
+    author = models.ForeignKey(DebateUser, null=True, on_delete=models.SET_NULL)
+    action = models.CharField(max_length=20, choices=Action.choices)
+
+    # only relevant for Action.COMMIT
+    contribution_key = models.CharField(max_length=255, blank=True, default="")
+
+    state = models.CharField(max_length=20, choices=State.choices, default=State.PENDING)
+    error_msg = models.TextField(blank=True, default="")
+
+    create_date = models.DateTimeField(auto_now_add=True)
+    update_date = models.DateTimeField(auto_now=True)
+
+    def get_status_dict(self) -> dict:
+        """
+        data for the js api
+        """
+        return {
+            "job_id": self.pk,
+            "state": self.state,
+            "error_msg": self.error_msg,
+            "status_url": reverse("commit_status", kwargs={"job_id": self.pk}),
+        }
+
+    def __str__(self):
+        return f"CommitJob<{self.pk}: {self.action} {self.debate_id} {self.contribution_key} ({self.state})>"
+
+
+class CommitJobAdmin(admin.ModelAdmin):
+    list_display = ["pk", "debate", "action", "contribution_key", "state", "create_date"]
+
+
+admin.site.register(CommitJob, CommitJobAdmin)
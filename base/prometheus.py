@@ -0,0 +1,190 @@
+"""
+This module renders the metrics endpoint (see `views.metrics_view`) in the Prometheus text format.
+
+The request metrics and the counters (caches, database and repo locks) are summed over all processes (see
+`metrics.get_aggregated_snapshot`). The health gauges (commit queue, uncommitted contributions, size and
+number of commits of the debate repos) are computed for each scrape. The repo numbers are stored in the
+shared cache and only recomputed if the HEAD commit of a repo has changed.
+"""
+
+import os
+import logging
+
+import git
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+
+from .models import Debate, Contribution, CommitJob
+from . import render_cache
+
+logger = logging.getLogger("fair-debate")
+
+PREFIX = "fair_debate"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# alias of the cache in settings.CACHES for the repo numbers
+REPO_STATS_CACHE_ALIAS = "shared"
+
+# metric names and help texts of the histograms of `metrics.MetricsRegistry`
+HISTOGRAMS = {
+    "wall": ("request_duration_seconds", "Wall time of the requests."),
+    "db": ("request_db_seconds", "Time spent in database queries per request."),
+    "template": ("request_template_seconds", "Template render time per request."),
+    "load_repo": ("request_load_repo_seconds", "Time spent in fdmd.load_repo per request."),
+    "commit": ("request_commit_seconds", "Time spent in git commits per request."),
+    "n_queries": ("request_db_queries", "Number of database queries per request."),
+}
+
+
+def get_repo_stats(repo_host_dir: str, debate_key: str) -> dict:
+    """
+    Return the size (bytes, including .git) and the number of commits of a debate repo.
+
+    Raise FileNotFoundError if the repo does not exist.
+    """
+    head_commit_id = render_cache.get_head_commit_id(repo_host_dir, debate_key)
+    cache = caches[REPO_STATS_CACHE_ALIAS]
+    cache_key = f"repo_stats:{debate_key}"
+
+    repo_stats = cache.get(cache_key)
+    if head_commit_id is not None and repo_stats is not None:
+        if repo_stats["head_commit_id"] == head_commit_id:
+            return repo_stats
+
+    repo_dir = os.path.join(repo_host_dir, debate_key)
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(repo_dir):
+        for fname in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, fname)).st_size
+            except FileNotFoundError:
+                # e.g. a git lock file which was removed in the meantime
+                pass
+
+    n_commits = 0
+    if head_commit_id is not None:
+        # one git process (`fdmd.utils.get_number_of_commits` would create a list of all commit objects)
+        n_commits = int(git.Repo(repo_dir).git.rev_list("--count", head_commit_id))
+
+    repo_stats = {"head_commit_id": head_commit_id, "size": size, "n_commits": n_commits}
+    cache.set(cache_key, repo_stats, timeout=None)
+    return repo_stats
+
+
+def get_health_gauges() -> dict:
+    n_jobs = dict.fromkeys(CommitJob.State.values, 0)
+    n_jobs.update(CommitJob.objects.values_list("state").annotate(n=Count("pk")).order_by())
+
+    repos = {}
+    for debate_key in Debate.objects.values_list("debate_key", flat=True):
+        try:
+            repos[debate_key] = get_repo_stats(settings.REPO_HOST_DIR, debate_key)
+        except (FileNotFoundError, git.GitCommandError) as ex:
+            logger.debug(f"no repo stats for {debate_key}: {ex!r}")
+
+    return {
+        "commit_jobs": n_jobs,
+        # all contributions in the database are uncommitted (see commit_handling.commit_contributions)
+        "uncommitted_contributions": Contribution.objects.count(),
+        "repos": repos,
+    }
+
+
+class TextRenderer:
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name: str, metric_type: str, help_text: str, samples: list[tuple]):
+        """
+        :param samples: list of tuples (suffix, labels, value)
+        """
+        full_name = f"{PREFIX}_{name}"
+        self.lines.append(f"# HELP {full_name} {help_text}")
+        self.lines.append(f"# TYPE {full_name} {metric_type}")
+        for suffix, labels, value in samples:
+            self.lines.append(f"{full_name}{suffix}{format_labels(labels)} {value}")
+
+    def get_text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def get_histogram_samples(labels: dict, hist: dict) -> list[tuple]:
+    samples = []
+    cumulative_count = 0
+    for upper_bound, n in zip(hist["buckets"] + ["+Inf"], hist["counts"]):
+        cumulative_count += n
+        samples.append(("_bucket", {**labels, "le": upper_bound}, cumulative_count))
+    samples.append(("_sum", labels, hist["sum"]))
+    samples.append(("_count", labels, hist["count"]))
+    return samples
+
+
+def render_text(snapshot: dict, health_gauges: dict) -> str:
+    renderer = TextRenderer()
+    views = snapshot["views"]
+    counters = snapshot["counters"]
+    lock_stats = snapshot["repo_lock"]
+
+    samples = [("", {"view": view_name}, entry["n_requests"]) for view_name, entry in views.items()]
+    renderer.add("requests_total", "counter", "Number of requests per url name.", samples)
+    samples = [("", {"view": view_name}, entry["n_errors"]) for view_name, entry in views.items()]
+    renderer.add("request_errors_total", "counter", "Number of requests with status >= 500.", samples)
+
+    for hist_name, (name, help_text) in HISTOGRAMS.items():
+        samples = []
+        for view_name, entry in views.items():
+            samples.extend(get_histogram_samples({"view": view_name}, entry["histograms"][hist_name]))
+        renderer.add(name, "histogram", help_text, samples)
+
+    samples = [
+        ("", {"cache": cache_name, "result": result}, counters[f"{cache_name}_cache_{counter_suffix}"])
+        for cache_name in ("render", "response")
+        for result, counter_suffix in (("hit", "hits"), ("miss", "misses"))
+    ]
+    renderer.add("cache_requests_total", "counter", "Lookups in the render and response cache.", samples)
+
+    # (name, value, help text)
+    scalar_counters = [
+        (
+            "db_transactions_total",
+            counters["db_transactions"],
+            "Number of database transactions (BEGIN statements, sqlite only).",
+        ),
+        (
+            "db_lock_wait_seconds_total",
+            counters["db_lock_wait_seconds"],
+            "Time spent waiting for the database write lock (BEGIN IMMEDIATE, sqlite only).",
+        ),
+        ("db_locked_errors_total", counters["db_locked_errors"], "Number of 'database is locked' errors."),
+        ("repo_lock_acquired_total", lock_stats["n_acquired"], "Number of acquired repo locks."),
+        ("repo_lock_contended_total", lock_stats["n_contended"], "Number of repo locks which had to wait."),
+        ("repo_lock_timeouts_total", lock_stats["n_timeouts"], "Number of repo lock timeouts."),
+        ("repo_lock_wait_seconds_total", lock_stats["total_wait_time"], "Time spent waiting for repo locks."),
+    ]
+    for name, value, help_text in scalar_counters:
+        renderer.add(name, "counter", help_text, [("", {}, value)])
+
+    samples = [("", {"state": state}, n) for state, n in health_gauges["commit_jobs"].items()]
+    renderer.add("commit_jobs", "gauge", "Number of commit jobs per state (commit queue).", samples)
+    samples = [("", {}, health_gauges["uncommitted_contributions"])]
+    renderer.add("uncommitted_contributions", "gauge", "Number of uncommitted contributions.", samples)
+
+    repos = health_gauges["repos"]
+    samples = [("", {"debate": key}, repo_stats["size"]) for key, repo_stats in repos.items()]
+    renderer.add("repo_size_bytes", "gauge", "Size of the debate repo (including .git).", samples)
+    samples = [("", {"debate": key}, repo_stats["n_commits"]) for key, repo_stats in repos.items()]
+    renderer.add("repo_commits", "gauge", "Number of commits of the debate repo.", samples)
+
+    return renderer.get_text()
@@ -0,0 +1,446 @@
+"""
+This module implements a cache for the committed part of a debate, i.e. for the result of
+`fdmd.load_repo(...)` without any uncommitted (database) contributions.
+
+A cache entry is only valid for the HEAD commit of the debate repo from which it was created. Thus every
+new commit implicitly invalidates the entry (this also covers changes of the repo which are not made by this
+app). Additionally, the entry is explicitly removed by `invalidate(...)` after every repo-mutating operation
+(see `views.ProcessContribution`).
+
+For logged-in authors the uncommitted contributions (drafts) are merged into the cached committed render
+(see `get_render_with_drafts(...)`) instead of rebuilding the whole debate. For this, the committed html
+is cached in (nested) parts, split at the parent elements of the segments.
+
+The sanitized (bleached) html is cached as well, keyed by the hash of the html and the hash of the bleach
+policy (see `get_sanitized_html(...)`).
+
+For big debates the page might only contain the first contribution levels (lazy loading). The deeper
+contribution subtrees are then replaced by empty placeholder divs and fetched by the js api when they are
+unfolded (see `get_lazy_initial_html(...)` and `get_lazy_fragments(...)`). Streamed pages contain all levels,
+but one after another (see `get_level_parts(...)`).
+"""
+
+import os
+import re
+import copy
+import json
+import hashlib
+import logging
+
+import git
+import bleach
+from bs4 import BeautifulSoup
+from django.core.cache import caches
+from django.utils.safestring import mark_safe, SafeString
+from django_bleach.utils import get_bleach_default_options
+
+import fair_debate_md as fdmd
+
+from . import metrics
+
+logger = logging.getLogger("fair-debate")
+
+# alias of the cache in settings.CACHES
+CACHE_ALIAS = "debate_render"
+
+# lazy loading: the initial page contains the contribution levels 0..LAZY_INITIAL_MAX_LEVEL
+LAZY_INITIAL_MAX_LEVEL = 1
+# css class of the placeholder divs (see core.js)
+LAZY_PLACEHOLDER_CLASS = "lazy_ctb"
+
+# placeholders for the parent elements of the segments in the committed html (see `_get_draft_slots`);
+# characters of the unicode private use area do not occur in the rendered markdown
+SLOT_MARKER = "\ue000{}\ue001"
+SLOT_MARKER_PATTERN = re.compile("\ue000(\\d+)\ue001")
+
+
+class CommittedRender:
+    """
+    Picklable snapshot of those attributes of a `fdmd.DebateDirLoader` object which are needed by the views.
+    """
+
+    def __init__(self, ddl: fdmd.DebateDirLoader, head_commit_id: str):
+        self.debate_key = ddl.debate_key
+        self.final_html = ddl.final_html
+        self.level_tree = ddl.level_tree
+        self.num_answers = ddl.num_answers
+        self.tree = ddl.tree
+        self.head_commit_id = head_commit_id
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_cache_key(debate_key: str) -> str:
+    return f"committed_render:{debate_key}"
+
+
+def get_head_commit_id(repo_host_dir: str, debate_key: str) -> str:
+    """
+    Return the hexsha of the HEAD commit of the debate repo (without spawning a git process).
+    """
+    repo_dir = os.path.join(repo_host_dir, debate_key)
+    if not os.path.isdir(repo_dir):
+        raise FileNotFoundError(f"directory: {repo_dir}")
+
+    try:
+        repo = git.Repo(repo_dir)
+    except git.InvalidGitRepositoryError:
+        # let `fdmd.load_repo` raise the appropriate exception
+        return None
+
+    return git.refs.SymbolicReference.dereference_recursive(repo, "HEAD")
+
+
+def get_committed_render(repo_host_dir: str, debate_key: str) -> CommittedRender:
+    """
+    Return the rendered committed state of a debate (from the cache if possible).
+    """
+
+    head_commit_id = get_head_commit_id(repo_host_dir, debate_key)
+    cache = get_cache()
+    cache_key = get_cache_key(debate_key)
+
+    if head_commit_id is not None:
+        cr: CommittedRender = cache.get(cache_key)
+        if cr is not None and cr.head_commit_id == head_commit_id:
+            metrics.registry.increment("render_cache_hits")
+            return cr
+
+    metrics.registry.increment("render_cache_misses")
+    with metrics.timer("load_repo"):
+        ddl = fdmd.load_repo(repo_host_dir, debate_key, ctb_list=None, new_debate=False)
+    cr = CommittedRender(ddl, head_commit_id)
+    cache.set(cache_key, cr)
+    return cr
+
+
+def get_render_with_drafts(
+    repo_host_dir: str, debate_key: str, ctb_list: list[fdmd.DBContribution]
+) -> CommittedRender:
+    """
+    Merge the uncommitted contributions of one author into (a copy of) the cached committed render.
+
+    Uncommitted contributions are always leaves of the contribution tree (the other party cannot see them
+    and thus cannot answer them). Therefore, only the draft contributions themselves have to be rendered.
+    The committed html is cached in parts (see `_get_draft_slots`); only the parent elements of the
+    reference segments of the drafts are processed by fdmd (`SpanAdder.add_contributions`), everything else
+    is joined unchanged. The result is equivalent to the html of `fdmd.load_repo(..., ctb_list)` (apart from
+    the indentation).
+
+    Return None if a draft could not be merged (the caller then has to fall back to `fdmd.load_repo`).
+    """
+
+    committed_render = get_committed_render(repo_host_dir, debate_key)
+    root_html, slot_htmls, slot_depths, segment_slots = _get_draft_slots(committed_render)
+
+    tree = dict(committed_render.tree)
+    level_tree = {level: list(keys) for level, keys in committed_render.level_tree.items()}
+
+    # slot index -> {segment key: mdp}
+    slot_contributions = {}
+    for ctb in sorted(ctb_list, key=lambda ctb: ctb.ctb_key):
+        segment_key = ctb.ctb_key[:-1]
+        if ctb.body == "" or ctb.ctb_key in tree or segment_key not in segment_slots:
+            # unexpected -> let fdmd handle this
+            return None
+
+        mdp = fdmd.MDProcessor(key_prefix=ctb.ctb_key, plain_md=ctb.body, db_ctb=True)
+        mdp.additional_css_classes.append("db_ctb")
+        mdp.add_plain_md_as_data = True
+        mdp.convert_plain_md_to_md_with_real_keys()
+        slot_contributions.setdefault(segment_slots[segment_key], {})[segment_key] = mdp
+
+        tree[ctb.ctb_key] = mdp
+        level = len(fdmd.decompose_key(ctb.ctb_key)) - 1
+        level_tree.setdefault(level, []).append(ctb.ctb_key)
+
+    slot_htmls = list(slot_htmls)
+    for slot_idx, contribution_childs in slot_contributions.items():
+        slot_html = slot_htmls[slot_idx]
+        span_adder = fdmd.SpanAdder(
+            parent_mdp=None, html_src=slot_html, key_prefix="", contribution_childs=contribution_childs
+        )
+        span_adder.add_contributions(slot_html)
+        slot_htmls[slot_idx] = _prettify_fragment(span_adder.soup, slot_depths[slot_idx])
+
+    res = copy.copy(committed_render)
+    res.final_html = _expand_slots(root_html, slot_htmls)
+    res.tree = tree
+    res.level_tree = level_tree
+    res.num_answers = len(tree) - 1  # don't count root contribution als answer
+    return res
+
+
+def _get_draft_slots(committed_render: CommittedRender) -> tuple[str, list[str], list[int], dict[str, int]]:
+    """
+    Split the committed html at the parent elements of the segment spans ("slots", answers are inserted
+    there; for headings fdmd also wraps the parent element). Return the html with a marker instead of each
+    top-level slot, the html of the slots (with markers for the nested slots), their depths in the document
+    and a dict which maps the segment keys to the slot indices. The result is cached for the HEAD commit.
+    """
+    cache_key = _get_draft_slots_cache_key(committed_render.debate_key)
+    if committed_render.head_commit_id is not None:
+        entry = get_cache().get(cache_key)
+        if entry is not None and entry[0] == committed_render.head_commit_id:
+            return entry[1]
+
+    soup = BeautifulSoup(committed_render.final_html, "html.parser")
+
+    # (bs4 elements compare equal if they have the same content -> use the identity)
+    slot_elements = []
+    slot_indices = {}
+    segment_slots = {}
+    for segment in soup.find_all("span", class_="segment"):
+        if id(segment.parent) not in slot_indices:
+            slot_indices[id(segment.parent)] = len(slot_elements)
+            slot_elements.append(segment.parent)
+        segment_slots[segment["id"]] = slot_indices[id(segment.parent)]
+
+    # number of enclosing tags (the indentation of `prettify`)
+    slot_depths = [len(list(slot_element.parents)) - 1 for slot_element in slot_elements]
+
+    slot_htmls = [None] * len(slot_elements)
+    # reversed document order -> nested slots are replaced before their ancestors are serialized
+    for slot_idx, slot_element in reversed(list(enumerate(slot_elements))):
+        slot_htmls[slot_idx] = str(slot_element)
+        slot_element.replace_with(SLOT_MARKER.format(slot_idx))
+
+    res = (str(soup), slot_htmls, slot_depths, segment_slots)
+    if committed_render.head_commit_id is not None:
+        get_cache().set(cache_key, (committed_render.head_commit_id, res))
+    return res
+
+
+def _prettify_fragment(soup: BeautifulSoup, depth: int) -> str:
+    """
+    Serialize a processed slot like `fdmd` serializes the whole document (`prettify`) but only for this slot.
+    The indentation before the first tag and the newline after the last tag are part of the enclosing html.
+    """
+    # the contribution soups inserted by fdmd do not preserve the whitespace of code elements -> parse again
+    soup = BeautifulSoup(str(soup), "html.parser", preserve_whitespace_tags=["pre", "code"])
+    html = "".join(child.decode(indent_level=depth) for child in soup.contents)
+    return html.strip(" ").removesuffix("\n")
+
+
+def _expand_slots(html: str, slot_htmls: list[str]) -> str:
+    parts = SLOT_MARKER_PATTERN.split(html)
+    # the slot indices are at the odd positions
+    for i in range(1, len(parts), 2):
+        parts[i] = _expand_slots(slot_htmls[int(parts[i])], slot_htmls)
+    return "".join(parts)
+
+
+def _get_draft_slots_cache_key(debate_key: str) -> str:
+    return f"draft_slots:{debate_key}"
+
+
+def invalidate(debate_key: str):
+    logger.debug(f"invalidate committed render cache for {debate_key}")
+    cache_keys = [
+        get_cache_key(debate_key),
+        _get_draft_slots_cache_key(debate_key),
+        _get_level_parts_cache_key(debate_key),
+    ]
+    get_cache().delete_many([*cache_keys, *_get_lazy_cache_keys(debate_key)])
+
+
+def get_bleach_policy_hash() -> str:
+    """
+    Return a hash of the bleach policy (BLEACH_* settings) -> changing the settings invalidates the cache.
+    """
+    options = get_bleach_default_options()
+    css_sanitizer = options.pop("css_sanitizer", None)
+    if css_sanitizer is not None:
+        options["css_properties"] = sorted(css_sanitizer.allowed_css_properties)
+    policy_str = json.dumps(options, sort_keys=True, default=repr)
+    return hashlib.sha256(policy_str.encode()).hexdigest()[:16]
+
+
+def get_sanitized_html(html: str) -> SafeString:
+    """
+    Return the result of `bleach.clean(html, ...)` (like the `bleach` template filter of django_bleach) from
+    the cache if possible.
+    """
+    html_hash = hashlib.sha256(html.encode()).hexdigest()
+    cache_key = f"sanitized_html:{get_bleach_policy_hash()}:{html_hash}"
+    cache = get_cache()
+
+    sanitized_html = cache.get(cache_key)
+    if sanitized_html is None:
+        sanitized_html = bleach.clean(html, **get_bleach_default_options())
+        # store as plain str
+        cache.set(cache_key, str(sanitized_html))
+    return mark_safe(sanitized_html)
+
+
+def _get_lazy_cache_keys(debate_key: str) -> tuple[str, str]:
+    return f"lazy_initial_html:{debate_key}", f"lazy_fragments:{debate_key}"
+
+
+def _get_lazy_version(committed_render: CommittedRender) -> str | None:
+    if committed_render.head_commit_id is None:
+        return None
+    return f"{committed_render.head_commit_id}:{get_bleach_policy_hash()}"
+
+
+def _get_lazy_entry(committed_render: CommittedRender, entry_type: str):
+    """
+    Return the cached initial html (entry_type "initial_html") or the fragment dict (entry_type "fragments")
+    for the given committed render. Both are created (and cached) together if necessary.
+    """
+    initial_key, fragments_key = _get_lazy_cache_keys(committed_render.debate_key)
+    cache_key = initial_key if entry_type == "initial_html" else fragments_key
+    version = _get_lazy_version(committed_render)
+
+    if version is not None:
+        entry = get_cache().get(cache_key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+    initial_html, fragments = _split_lazy_render(committed_render)
+    if version is not None:
+        get_cache().set_many({initial_key: (version, initial_html), fragments_key: (version, fragments)})
+    return initial_html if entry_type == "initial_html" else fragments
+
+
+def _split_lazy_render(committed_render: CommittedRender) -> tuple[str, dict[str, str]]:
+    """
+    Replace every contribution of level LAZY_INITIAL_MAX_LEVEL + 1 (together with its subtree) in the
+    sanitized html by an empty placeholder div. Return the remaining html and the removed subtrees.
+    """
+    sanitized_html = get_sanitized_html(committed_render.final_html)
+    soup = BeautifulSoup(sanitized_html, "html.parser")
+    level = LAZY_INITIAL_MAX_LEVEL + 1
+
+    fragments = {}
+    for contribution_div in soup.find_all("div", class_=f"level{level}"):
+        if "contribution" not in contribution_div["class"]:
+            continue
+        ctb_key = contribution_div["id"].removeprefix("contribution_")
+        fragments[ctb_key] = str(contribution_div)
+        _replace_by_placeholder(soup, contribution_div, level)
+
+    return str(soup), fragments
+
+
+def _replace_by_placeholder(soup: BeautifulSoup, contribution_div, level: int):
+    placeholder_attrs = {
+        "class": f"contribution level{level} {LAZY_PLACEHOLDER_CLASS}",
+        "id": contribution_div["id"],
+    }
+    contribution_div.replace_with(soup.new_tag("div", attrs=placeholder_attrs))
+
+
+def get_level_parts(
+    ddl: fdmd.DebateDirLoader | CommittedRender,
+) -> tuple[SafeString, list[dict[str, SafeString]]]:
+    """
+    Split the sanitized html of the debate into the root contribution (with placeholders for the
+    contributions of level 1) and one dict per level (1, 2, ..., see `ddl.level_tree`) which maps the
+    contribution keys to their html (with placeholders for the contributions of the next level). This is used
+    to send the debate level by level (see `views.ShowDebateView._render_streaming_response`).
+
+    The result is cached for committed renders (uncommitted contributions are never cached).
+    """
+    version = None
+    if isinstance(ddl, CommittedRender):
+        version = _get_lazy_version(ddl)
+        cache_key = _get_level_parts_cache_key(ddl.debate_key)
+    if version is not None:
+        entry = get_cache().get(cache_key)
+        if entry is not None and entry[0] == version:
+            root_html, levels = entry[1]
+            return mark_safe(root_html), [_mark_dict_safe(fragments) for fragments in levels]
+
+    soup = BeautifulSoup(get_sanitized_html(ddl.final_html), "html.parser")
+    levels = []
+    # deepest level first -> the fragments contain the placeholders of the next level
+    for level in range(len(ddl.level_tree) - 1, 0, -1):
+        fragments = {}
+        for contribution_div in soup.find_all("div", class_=f"level{level}"):
+            if "contribution" not in contribution_div["class"]:
+                continue
+            fragments[contribution_div["id"].removeprefix("contribution_")] = str(contribution_div)
+            _replace_by_placeholder(soup, contribution_div, level)
+        levels.insert(0, fragments)
+    root_html = str(soup)
+
+    if version is not None:
+        get_cache().set(cache_key, (version, (root_html, levels)))
+    # the html was already sanitized before the placeholders were inserted
+    return mark_safe(root_html), [_mark_dict_safe(fragments) for fragments in levels]
+
+
+def _mark_dict_safe(fragments: dict[str, str]) -> dict[str, SafeString]:
+    return {key: mark_safe(html) for key, html in fragments.items()}
+
+
+def _get_level_parts_cache_key(debate_key: str) -> str:
+    return f"level_parts:{debate_key}"
+
+
+def get_lazy_initial_html(committed_render: CommittedRender) -> SafeString:
+    """
+    Return the sanitized html of the committed render without the deeper contribution levels.
+    """
+    # the html was already sanitized before the placeholders were inserted
+    return mark_safe(_get_lazy_entry(committed_render, "initial_html"))
+
+
+def get_lazy_fragments(repo_host_dir: str, debate_key: str, ctb_keys: list[str]) -> dict[str, SafeString]:
+    """
+    Return a dict with the sanitized html of the given contributions (including all their answers). Unknown
+    contributions are omitted. This is used to load the placeholders of a whole contribution level with one
+    request. If the fragments are cached, the committed render itself is not loaded.
+    """
+    fragments: dict = _get_lazy_entry_for_head(repo_host_dir, debate_key, "fragments")
+    res = {}
+    for ctb_key in ctb_keys:
+        if ctb_key in fragments:
+            res[ctb_key] = mark_safe(fragments[ctb_key])
+            continue
+
+        # the contribution is part of a removed subtree (contribution keys end with "a" or "b" -> the key of
+        # every ancestor contribution is a prefix) or it is part of the initial html
+        candidates = [fragment for key, fragment in fragments.items() if ctb_key.startswith(key)]
+        candidates.append(_get_lazy_entry_for_head(repo_host_dir, debate_key, "initial_html"))
+        for html in candidates:
+            ctb_div = BeautifulSoup(html, "html.parser").find("div", id=f"contribution_{ctb_key}")
+            if ctb_div is not None and LAZY_PLACEHOLDER_CLASS not in ctb_div.get("class", []):
+                res[ctb_key] = mark_safe(str(ctb_div))
+                break
+    return res
+
+
+def get_lazy_fragment(repo_host_dir: str, debate_key: str, ctb_key: str) -> SafeString | None:
+    """
+    Return the sanitized html of the contribution `ctb_key` (including all its answers) or None if the
+    contribution does not exist.
+    """
+    return get_lazy_fragments(repo_host_dir, debate_key, [ctb_key]).get(ctb_key)
+
+
+def get_lazy_version(repo_host_dir: str, debate_key: str) -> str | None:
+    """
+    Return the version of the lazy loading entries (changes with the HEAD commit and the bleach policy). Raise
+    FileNotFoundError if the repo does not exist.
+    """
+    head_commit_id = get_head_commit_id(repo_host_dir, debate_key)
+    if head_commit_id is None:
+        return None
+    return f"{head_commit_id}:{get_bleach_policy_hash()}"
+
+
+def _get_lazy_entry_for_head(repo_host_dir: str, debate_key: str, entry_type: str):
+    """
+    Like `_get_lazy_entry` but the (big) committed render is only loaded if the entry is not cached.
+    """
+    version = get_lazy_version(repo_host_dir, debate_key)
+    if version is not None:
+        initial_key, fragments_key = _get_lazy_cache_keys(debate_key)
+        entry = get_cache().get(initial_key if entry_type == "initial_html" else fragments_key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+    return _get_lazy_entry(get_committed_render(repo_host_dir, debate_key), entry_type)
@@ -0,0 +1,115 @@
+"""
+This module implements a cross-process lock per debate repo.
+
+Several gunicorn workers (and the commit worker, see `commit_handling.py`) might want to mutate the same
+debate repo at the same time. Concurrent git processes in the same repo lead to corrupted index files or
+`index.lock` errors. Thus all repo-mutating operations must be wrapped by `debate_lock(...)`.
+
+The lock is an advisory file lock (`fcntl.flock`) on a lock file inside `<REPO_HOST_DIR>/.locks/`. Different
+debates use different lock files, i.e. commits to different debates run fully in parallel. The lock is
+released automatically by the OS if the process dies.
+"""
+
+import os
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger("fair-debate")
+
+LOCK_DIR_NAME = ".locks"
+
+
+class RepoLockTimeout(TimeoutError):
+    pass
+
+
+class LockStats:
+    """
+    Simple (per process) metrics about the lock usage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.n_acquired = 0
+        self.n_contended = 0
+        self.n_timeouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record(self, wait_time: float, contended: bool, acquired: bool):
+        with self._lock:
+            if acquired:
+                self.n_acquired += 1
+            else:
+                self.n_timeouts += 1
+            if contended:
+                self.n_contended += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "n_acquired": self.n_acquired,
+                "n_contended": self.n_contended,
+                "n_timeouts": self.n_timeouts,
+                "total_wait_time": self.total_wait_time,
+                "max_wait_time": self.max_wait_time,
+            }
+
+
+stats = LockStats()
+
+
+def get_lock_path(repo_host_dir: str, debate_key: str) -> str:
+    lock_dir = os.path.join(repo_host_dir, LOCK_DIR_NAME)
+    os.makedirs(lock_dir, exist_ok=True)
+    return os.path.join(lock_dir, f"{debate_key}.lock")
+
+
+@contextmanager
+def debate_lock(debate_key: str, repo_host_dir: str = None, timeout: float = None, poll_interval=0.05):
+    """
+    Context manager which holds the exclusive lock for the repo of the given debate.
+
+    :param timeout:     maximum waiting time in seconds (default: settings.REPO_LOCK_TIMEOUT);
+                        raise RepoLockTimeout if the lock could not be acquired in time
+    """
+    if repo_host_dir is None:
+        repo_host_dir = settings.REPO_HOST_DIR
+    if timeout is None:
+        timeout = settings.REPO_LOCK_TIMEOUT
+
+    t0 = time.monotonic()
+    contended = False
+    with open(get_lock_path(repo_host_dir, debate_key), "w") as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                contended = True
+                wait_time = time.monotonic() - t0
+                if wait_time >= timeout:
+                    stats.record(wait_time, contended, acquired=False)
+                    msg = f"Could not acquire repo lock for {debate_key} within {timeout}s"
+                    logger.warning(msg)
+                    raise RepoLockTimeout(msg)
+                time.sleep(poll_interval)
+
+        wait_time = time.monotonic() - t0
+        stats.record(wait_time, contended, acquired=True)
+        if contended:
+            logger.debug(f"repo lock for {debate_key} acquired after {wait_time:.3f}s")
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,187 @@
+"""
+This module implements a full-page cache for anonymous readers (see `cache_anonymous_response`).
+
+All anonymous visitors of a page get (almost) the same bytes. The only exception is the CSRF token (embedded
+in the forms and via `json_script` for the js api). Thus a page which is rendered for the cache contains a
+placeholder instead of the token (see `csrf_placeholder`) which is replaced by a valid token for the current
+request whenever the page is served (this also ensures that the CSRF cookie is set).
+
+The backend is configured by `settings.RESPONSE_CACHE_BACKEND` ("none", "locmem", "file" or "db"). The
+entries are keyed by the url path. They are purged explicitly after repo-mutating operations (see
+`purge_debate`) and expire after `settings.RESPONSE_CACHE_TIMEOUT` (relevant for changes of the repos which
+are not made by this app). The purge is performed by the committing process (a web worker or the commit
+worker), thus with several processes the backend must be shared by all of them ("file" or "db").
+"""
+
+import hashlib
+import logging
+import functools
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+
+from . import metrics
+
+logger = logging.getLogger("fair-debate")
+
+# alias of the cache in settings.CACHES
+CACHE_ALIAS = "response_cache"
+
+CSRF_PLACEHOLDER = "__CSRF_TOKEN_PLACEHOLDER__"
+
+# headers which are stored together with the content
+STORED_HEADERS = ["Content-Type", "Last-Modified"]
+
+
+def is_enabled() -> bool:
+    return settings.RESPONSE_CACHE_BACKEND != "none"
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_cache_key(path: str) -> str:
+    return f"response:{path}"
+
+
+def csrf_placeholder(request) -> dict:
+    """
+    Context processor: replace the CSRF token of pages which are rendered for the cache.
+    """
+    if getattr(request, "render_for_response_cache", False):
+        return {"csrf_token": CSRF_PLACEHOLDER}
+    return {}
+
+
+def cache_anonymous_response(view_func):
+    """
+    Decorator for views whose GET responses are identical for all anonymous users (sync or async views).
+    """
+
+    if iscoroutinefunction(view_func):
+        return _async_cache_anonymous_response(view_func)
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_enabled() or request.method != "GET" or request.GET or request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        cache = get_cache()
+        cache_key = get_cache_key(request.path)
+        entry = cache.get(cache_key)
+        metrics.registry.increment("response_cache_hits" if entry is not None else "response_cache_misses")
+        if entry is None:
+            request.render_for_response_cache = True
+            try:
+                response = view_func(request, *args, **kwargs)
+            finally:
+                request.render_for_response_cache = False
+
+            if not _is_cacheable(response):
+                return _replace_placeholder(request, response)
+
+            entry = _create_entry(response)
+            cache.set(cache_key, entry)
+
+        return _build_response(request, entry)
+
+    return wrapper
+
+
+def _async_cache_anonymous_response(view_func):
+
+    @functools.wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if not is_enabled() or request.method != "GET" or request.GET:
+            return await view_func(request, *args, **kwargs)
+        user = await request.auser()
+        if user.is_authenticated:
+            return await view_func(request, *args, **kwargs)
+
+        cache = get_cache()
+        cache_key = get_cache_key(request.path)
+        entry = await cache.aget(cache_key)
+        metrics.registry.increment("response_cache_hits" if entry is not None else "response_cache_misses")
+        if entry is None:
+            request.render_for_response_cache = True
+            try:
+                response = await view_func(request, *args, **kwargs)
+            finally:
+                request.render_for_response_cache = False
+
+            if not _is_cacheable(response):
+                return _replace_placeholder(request, response)
+
+            entry = _create_entry(response)
+            await cache.aset(cache_key, entry)
+
+        return _build_response(request, entry)
+
+    return wrapper
+
+
+def _replace_placeholder(request, response):
+    if CSRF_PLACEHOLDER.encode() in getattr(response, "content", b""):
+        response.content = response.content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+    return response
+
+
+def _create_entry(response) -> dict:
+    return {
+        "content": response.content,
+        "status": response.status_code,
+        "headers": {name: response[name] for name in STORED_HEADERS if response.has_header(name)},
+        "etag_base": hashlib.sha256(response.content).hexdigest(),
+    }
+
+
+def _is_cacheable(response) -> bool:
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    return "no-store" not in response.get("Cache-Control", "")
+
+
+def _build_response(request, entry: dict) -> HttpResponse:
+
+    # the page contains the CSRF token -> the ETag must depend on the CSRF cookie
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")
+    etag = quote_etag(hashlib.sha256(f"{entry['etag_base']}|{csrf_cookie}".encode()).hexdigest()[:32])
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        content = entry["content"]
+        if CSRF_PLACEHOLDER.encode() in content:
+            content = content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+        response = HttpResponse(content, status=entry["status"])
+
+    for name, value in entry["headers"].items():
+        response[name] = value
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def purge_debate(debate_key: str):
+    """
+    Remove the cached pages which depend on the given debate (debate page and listings).
+    """
+    if not is_enabled():
+        return
+    paths = [
+        reverse("show_debate", kwargs={"debate_key": debate_key}),
+        reverse("landing_page"),
+    ]
+    logger.debug(f"purge response cache for {debate_key}")
+    get_cache().delete_many([get_cache_key(path) for path in paths])
+
+
+def purge_all():
+    if is_enabled():
+        get_cache().clear()
@@ -2,6 +2,18 @@
 See `simple_page_interface.py` for a description of the simple_page-system.
 """
 
+import functools
+
+import markdown
+
+
+@functools.lru_cache(maxsize=512)
+def render_markdown(txt: str) -> str:
+    """
+    Memoized markdown conversion (the result only depends on the source text).
+    """
+    return markdown.markdown(txt)
+
 
 class SimplePage(object):
     def __init__(self, type, title, content, utc_comment="", lang=None):
@@ -12,5 +24,16 @@ class SimplePage(object):
         self.utc_comment = utc_comment
         self.lang = lang
 
-        # this will be set later by `get_sp`
+        # this will be set later by `simple_pages_interface.prepare_simple_pages`
         self.language_list = []
+
+        self._content_html = None
+
+    @property
+    def content_html(self) -> str:
+        """
+        rendered markdown content (only computed once per object)
+        """
+        if self._content_html is None:
+            self._content_html = render_markdown(self.content or "")
+        return self._content_html
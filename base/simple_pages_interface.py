@@ -14,7 +14,6 @@ The functions and datatypes live in `simple_pages_core.py`
 
 """
 
-from ipydex import IPS
 from collections import defaultdict
 from django.conf import settings
 from .simple_pages_core import SimplePage
@@ -67,16 +66,33 @@ def create_language_dict():
 language_dict = create_language_dict()
 
 
+def prepare_simple_pages():
+    """
+    Set the language list and pre-render the markdown content of all simple pages (once at startup).
+    """
+    for sp in [*sp_defdict.values(), sp_defdict.default_factory()]:
+        sp.language_list = language_dict[sp.type]
+        # trigger the (cached) rendering
+        sp.content_html
+
+
+prepare_simple_pages()
+
+
 def get_sp(pagetype, lang=None) -> SimplePage:
+    """
+    Return the (shared and pre-rendered) SimplePage object. The result must not be modified.
+    """
 
     desired_key = "{}__{}".format(pagetype, lang)
     if desired_key in sp_defdict:
         # return the corrcect language version if possible
         res = sp_defdict[desired_key]
-    else:
+    elif pagetype in sp_defdict:
         # return the only available version
         res = sp_defdict[pagetype]
-
-    res.language_list = language_dict[pagetype]
+    else:
+        # note: `sp_defdict[pagetype]` would insert a new key
+        res = sp_defdict.default_factory()
 
     return res
@@ -95,6 +95,9 @@ var modalWarningState = null;
 var activeSegmentToolbar = null;
 let currentLevel = 0;
 const deepestLevel = readJsonWithDefault("data-deepest_level", null);
+// if true, the deeper contribution levels are placeholders which are loaded on demand (see loadLazyContribution)
+const lazyLoading = readJsonWithDefault("data-lazy_loading", false);
+const lazyLoadingPromises = {};
 
 
 
@@ -312,6 +315,20 @@ function removeSegmentContributionFormContainer(){
     }
 }
 
+/**
+ * Streamed pages (see DEBATE_STREAMING_MIN_SIZE in config.toml) contain the contributions of each level in
+ * a template element (in level order). Insert them into the placeholders of the previous level.
+ */
+function insertStreamedLevels(){
+    const templates = Array.from(document.getElementsByClassName("streamed_level"));
+    templates.forEach(template => {
+        Array.from(template.content.children).forEach(contributionDiv => {
+            document.getElementById(contributionDiv.id)?.replaceWith(contributionDiv);
+        });
+        template.remove();
+    });
+}
+
 /**
  * Handle the case when the debate to be shown only consists of an uncommitted
  * a-contribution
@@ -332,6 +349,8 @@ function onLoadForShowDebatePage(){
 
     monkeyPatchConsoleLogging();
 
+    insertStreamedLevels();
+
     contributionObjects = Array.from(document.getElementsByClassName("contribution"));
     contributionObjects.forEach(ansDiv => {
         contributionMap[ansDiv.id] = ansDiv;
@@ -340,9 +359,30 @@ function onLoadForShowDebatePage(){
     handleRootContribution();
 
     segmentObjects = Array.from(document.getElementsByClassName("segment"));
+    initializeSegments(segmentObjects);
+
+    addMainClickEventListener();
+    unfoldAllUncommittedContributions();
+    unfoldAnchorLinkTarget().catch(reportError);
+
+    // that function should be called every time the hash-part of the url changes
+    window.addEventListener('hashchange', () => unfoldAnchorLinkTarget().catch(reportError));
+
+    connectCommitAllCtbsButton();
+    connectShowAllCtbsButton();
+    mwm.initializeModalWarningElement();
+    connectKeyboardKeys();
+}
+
+/**
+ * add event listeners and css classes to the given segments
+ * (called on load and for every lazily loaded contribution)
+ * @param {Array} segmentList
+ */
+function initializeSegments(segmentList) {
 
     // Add mouseover and mouseout event listeners to each span
-    segmentObjects.forEach(segment_span => {
+    segmentList.forEach(segment_span => {
         segment_span.addEventListener('mouseover', function() {
             // Display the id of the hovered span
             segIdDisplay.textContent = this.id;
@@ -355,7 +395,7 @@ function onLoadForShowDebatePage(){
     });
 
     // add square symbols and click-event-handler to those segments which have an answer-contribution
-    segmentObjects.forEach(segment_span => {
+    segmentList.forEach(segment_span => {
 
         const contributionKey = getContributionKey(segment_span.id);
         if (contributionKey in contributionMap) {
@@ -376,18 +416,106 @@ function onLoadForShowDebatePage(){
             }
         }
     });
+}
 
-    addMainClickEventListener();
-    unfoldAllUncommittedContributions();
-    unfoldAnchorLinkTarget();
+/**
+ * If the given contribution div is a placeholder (lazy loading): fetch the contribution (including its
+ * answers) and replace the placeholder. Return the (new) contribution div.
+ * @param {HTMLElement} contributionDiv
+ * @returns {Promise<HTMLElement>}
+ */
+async function loadLazyContribution(contributionDiv) {
+    if (!contributionDiv.classList.contains("lazy_ctb")) {
+        return contributionDiv
+    }
+    // prevent parallel requests for the same placeholder
+    if (!(contributionDiv.id in lazyLoadingPromises)) {
+        lazyLoadingPromises[contributionDiv.id] = replaceLazyPlaceholder(contributionDiv);
+    }
+    return await lazyLoadingPromises[contributionDiv.id];
+}
 
-    // that function should be called every time the hash-part of the url changes
-    window.addEventListener('hashchange', unfoldAnchorLinkTarget);
+/**
+ * Like loadLazyContribution but for a list of contribution divs (e.g. one level): all placeholders
+ * which are not yet loading are fetched with one request.
+ * @param {Array<HTMLElement>} contributionDivs
+ * @returns {Promise<Array<HTMLElement>>}
+ */
+async function loadLazyContributions(contributionDivs) {
+    const newPlaceholders = contributionDivs.filter(
+        div => div.classList.contains("lazy_ctb") && !(div.id in lazyLoadingPromises)
+    );
+    if (newPlaceholders.length > 0) {
+        const batchPromise = fetchLazyFragments(newPlaceholders);
+        newPlaceholders.forEach(placeholderDiv => {
+            lazyLoadingPromises[placeholderDiv.id] = batchPromise.then(fragments => {
+                const html = fragments[getLazyCtbKey(placeholderDiv)];
+                if (html === undefined) {
+                    delete lazyLoadingPromises[placeholderDiv.id];
+                    throw new Error(`Missing fragment for contribution ${getLazyCtbKey(placeholderDiv)}`);
+                }
+                return insertLazyFragment(placeholderDiv, html);
+            });
+        });
+    }
+    return await Promise.all(contributionDivs.map(loadLazyContribution));
+}
 
-    connectCommitAllCtbsButton();
-    connectShowAllCtbsButton();
-    mwm.initializeModalWarningElement();
-    connectKeyboardKeys();
+function getLazyCtbKey(placeholderDiv) {
+    return placeholderDiv.id.replace("contribution_", "");
+}
+
+async function fetchLazyFragments(placeholderDivs) {
+    const ctbKeys = placeholderDivs.map(getLazyCtbKey);
+    const response = await fetch(`${apiData.fragments_url}?keys=${ctbKeys.join(",")}`);
+    if (response.status != 200){
+        placeholderDivs.forEach(placeholderDiv => {
+            delete lazyLoadingPromises[placeholderDiv.id];
+        });
+        throw new Error(`Unexpected api status ${response.status} for contributions ${ctbKeys}`);
+    }
+    const data = await response.json();
+    return data.fragments
+}
+
+async function replaceLazyPlaceholder(placeholderDiv) {
+    const ctbKey = getLazyCtbKey(placeholderDiv);
+    const response = await fetch(apiData.fragment_url.replace("__ctb_key__", ctbKey));
+    if (response.status != 200){
+        delete lazyLoadingPromises[placeholderDiv.id];
+        throw new Error(`Unexpected api status ${response.status} for contribution ${ctbKey}`);
+    }
+    const data = await response.json();
+    return insertLazyFragment(placeholderDiv, data.html);
+}
+
+/**
+ * Replace the placeholder by the fetched html and initialize the new contributions.
+ * @param {HTMLElement} placeholderDiv
+ * @param {string} html
+ * @returns {HTMLElement}
+ */
+function insertLazyFragment(placeholderDiv, html) {
+    const template = document.createElement("template");
+    template.innerHTML = html;
+    const newDiv = template.content.firstElementChild;
+    newDiv.style.display = placeholderDiv.style.display;
+    placeholderDiv.replaceWith(newDiv);
+
+    const newContributions = [newDiv, ...newDiv.getElementsByClassName("contribution")];
+    newContributions.forEach(ansDiv => {
+        contributionMap[ansDiv.id] = ansDiv;
+    });
+    initializeSegments(Array.from(newDiv.getElementsByClassName("segment")));
+
+    // the level might have been unfolded while the request was pending
+    newContributions.forEach(ansDiv => {
+        const level = parseInt(Array.from(ansDiv.classList).find(cls => /^level\d+$/.test(cls)).slice(5));
+        if (level <= currentLevel) {
+            ansDiv.style.display = "block";
+        }
+    });
+    return newDiv
 }
 
 /**
@@ -505,6 +633,7 @@ class SegmentClickManager {
             this.clickCounter[segmentElement.id] = 2;
         } else if (state.clickCount == 0 && state.segmentHasAnswer && !state.answerIsVisible) {
             state.contributionDiv.style.display = "block";
+            loadLazyContribution(state.contributionDiv).catch(reportError);
             // answer is not visible -> show it
             this.clickCounter[segmentElement.id] = 1;
 
@@ -676,7 +805,7 @@ function segmentWithExistingContributionClicked(segmentSpan, contributionDiv) {
 }
 
 
-function unfoldAnchorLinkTarget(){
+async function unfoldAnchorLinkTarget(){
 
     console.log("unfold target 1");
     const anchorPart = window.location.hash.slice(1);
@@ -689,9 +818,15 @@ function unfoldAnchorLinkTarget(){
     const match = anchorPart.match(/^(.*?)(\d*)$/);
     const parentContributionKey = `contribution_${match[1]}`;
     console.log("unfold target 3", parentContributionKey);
-    if (!(parentContributionKey in contributionMap)) { return }
+    // (with lazy loading the contribution might not have been loaded yet)
+    if (!(parentContributionKey in contributionMap) && !lazyLoading) { return }
 
-    iterativelyUnfoldNestedSegments(parentContributionKey);
+    await iterativelyUnfoldNestedSegments(parentContributionKey);
+
+    if (lazyLoading) {
+        // the target did not exist when the browser evaluated the anchor
+        document.getElementById(anchorPart)?.scrollIntoView();
+    }
 }
 
 /**
@@ -712,9 +847,10 @@ function connectCommitAllCtbsButton() {
                 const response = await fetch(apiData.commit_all_url, generateRequestObjectForCtb(
                     apiData.debate_key
                 ));
+                await waitForQueuedCommit(response);
                 location.reload();
             } catch(err) {
-                console.error(err);
+                reportError(err);
             }
         }
         mwm.activateModalWarningIfNecessary(okFunc);
@@ -722,6 +858,50 @@ function connectCommitAllCtbsButton() {
 }
 
 
+/**
+ * If the commit was only enqueued (status 202, see COMMIT_QUEUE in config.toml):
+ * poll the status url until the commit worker has processed the job. The interval grows up to
+ * maxPollInterval; after maxWait milliseconds an error is thrown (e.g. if the worker is not running).
+ * @param {Response} response
+ */
+async function waitForQueuedCommit(response, pollInterval=500, maxPollInterval=5000, maxWait=120000) {
+    if (response.status != 202){
+        return
+    }
+    const data = await response.json();
+    const deadline = Date.now() + maxWait;
+    while (true) {
+        const statusResponse = await fetch(data.status_url);
+        if (statusResponse.status != 200){
+            throw new Error(`Unexpected api status ${statusResponse.status} for commit job ${data.job_id}`);
+        }
+        const status = await statusResponse.json();
+        if (status.state == "done") {
+            return
+        }
+        if (status.state == "failed") {
+            throw new Error(`commit job ${data.job_id} failed: ${status.error_msg}`);
+        }
+        if (Date.now() + pollInterval > deadline) {
+            throw new Error(
+                `commit job ${data.job_id} is still ${status.state} after ${maxWait / 1000} s, please reload the page later`
+            );
+        }
+        await new Promise(resolve => setTimeout(resolve, pollInterval));
+        pollInterval = Math.min(pollInterval * 1.5, maxPollInterval);
+    }
+}
+
+/**
+ * Log the error and show it to the user (for errors of actions which the user has triggered).
+ * @param {Error} err
+ */
+function reportError(err) {
+    console.error(err);
+    window.alert(`Error: ${err.message}`);
+}
+
+
 /**
  * The button related to (#i2), see todo_notes.md
  *
@@ -749,22 +929,29 @@ function unfoldAllUncommittedContributions() {
 
         // convert "contribution_a3b4a12b" to "a3b4a12"
         const key = ansDiv.id.replace("contribution_", "").slice(0, -1);
-        iterativelyUnfoldNestedSegments(key);
+        iterativelyUnfoldNestedSegments(key).catch(reportError);
     });
 
 }
 
-function iterativelyUnfoldNestedSegments(keyOfDeepestSegment) {
+async function iterativelyUnfoldNestedSegments(keyOfDeepestSegment) {
 
     let parts = keyOfDeepestSegment.match(/[ab]\d+/g);
     let cumKey = "";
-    parts.forEach(part => {
+    for (const part of parts) {
         cumKey += part;
         // create strings like "a3", "a3b4", "a3b4a12"
 
         // ensure element is visible
-        document.getElementById(getContributionKey(cumKey)).style.display = "block";
-    });
+        const contributionDiv = document.getElementById(getContributionKey(cumKey));
+        if (contributionDiv === null) {
+            // unknown contribution (e.g. invalid anchor)
+            return
+        }
+        contributionDiv.style.display = "block";
+        // this also loads all nested contributions (if necessary)
+        await loadLazyContribution(contributionDiv);
+    }
 
     currentLevel = Math.max(currentLevel, parts.length);
 }
@@ -907,14 +1094,15 @@ function getSeparatorDiv(segment_span, contributionDiv){
                 const response = await fetch(apiData.commit_url, generateRequestObjectForCtb(
                     apiData.debate_key, contributionKeyShort
                 ));
-                if (response.status != 200){
+                if (response.status != 200 && response.status != 202){
                     console.log(response);
                     console.log(response.body);
                     throw new Error(`Unexpected api status ${response.status} for commit of contribution ${contributionKeyShort} of debate ${apiData.debate_key}`);
                 }
+                await waitForQueuedCommit(response);
                 location.reload();
             } catch(err) {
-                console.error(err);
+                reportError(err);
             }
         }
         mwm.activateModalWarningIfNecessary(okFunc);
@@ -1028,7 +1216,9 @@ function showNextContributionLevel(){
         levelDiv.style.display = "block"
     }
 
-    processLevel(currentLevel, workerFunc);
+    const levelDivList = processLevel(currentLevel, workerFunc);
+    // load all placeholders of this level with one request
+    loadLazyContributions(levelDivList).catch(reportError);
 }
 
 function hideCurrentContributionLevel(){
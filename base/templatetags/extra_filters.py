@@ -1,6 +1,7 @@
 from django import template
 from django.conf import settings
-import markdown
+
+from base import simple_pages_core
 
 register = template.Library()
 
@@ -10,7 +11,8 @@ def render_markdown(txt):
 
     if txt is None:
         txt = ""
-    return markdown.markdown(txt)
+    # memoized (relevant for dynamic content like error messages)
+    return simple_pages_core.render_markdown(str(txt))
 
 
 # this filter takes two arguments. used like: {% if request.user|can_edit:entry %}
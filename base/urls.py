@@ -5,18 +5,34 @@ from django.shortcuts import redirect
 
 from . import views
 from . import utils
+from .response_cache import cache_anonymous_response
 
 
-main_view = views.MainView.as_view
+if settings.SERVER_MODE == "asgi":
+    # async read path (db via async ORM, repo access in a thread pool)
+    main_view_class = views.AsyncMainView
+    show_debate_view_class = views.AsyncShowDebateView
+    about_page = views.async_about_page
+else:
+    main_view_class = views.MainView
+    show_debate_view_class = views.ShowDebateView
+    about_page = views.about_page
+
+
+def main_view():
+    return cache_anonymous_response(main_view_class.as_view())
+
+
+show_debate_view = cache_anonymous_response(show_debate_view_class.as_view())
 
 urlpatterns = [
     path("", main_view(), name="landing_page"),
     path("new/", views.NewDebateView.as_view(), name="new_debate"),
     path("new/test", views.test_new_debate, name="test_new_debate"),
-    path("d/<slug:debate_key>", views.ShowDebateView.as_view(), name="show_debate"),
+    path("d/<slug:debate_key>", show_debate_view, name="show_debate"),
     path(
         "d/d1-lorem_ipsum",
-        views.ShowDebateView.as_view(),
+        show_debate_view,
         name="test_show_debate",
         kwargs={"debate_key": "d1-lorem_ipsum"},
     ),
@@ -38,9 +54,23 @@ urlpatterns = [
         name="delete_contribution",
         kwargs={"action": "delete"},
     ),
+    path("commit_status/<int:job_id>", views.commit_status, name="commit_status"),
+    path("debates/", views.debate_list, name="debate_list"),
+    path("api/debates/", views.debate_list, name="debate_list_json", kwargs={"as_json": True}),
+    path(
+        "api/debates/<slug:debate_key>/contributions/<slug:contribution_key>",
+        views.contribution_fragment,
+        name="contribution_fragment",
+    ),
+    path(
+        "api/debates/<slug:debate_key>/contributions",
+        views.contribution_fragments,
+        name="contribution_fragments",
+    ),
+    path("api/metrics", views.metrics_view, name="metrics"),
     path("menu/", views.menu_page, name="menu_page"),
     path("debug/", views.debug_page, name="debug_page"),
-    path(utils.ABOUT_PATH, views.about_page, name="about_page"),
+    path(utils.ABOUT_PATH, cache_anonymous_response(about_page), name="about_page"),
     # this is for testing the error handling
     path("error/", views.assertion_error_page, name="error_page"),
     path("error/js", views.js_error_page, name="trigger_js_error"),
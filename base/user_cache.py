@@ -0,0 +1,47 @@
+"""
+This module implements a cache for DebateUser objects (see `auth_backends.CachedModelBackend`).
+
+`AuthenticationMiddleware` fetches the user object of the session for every request of a logged-in user. The
+cache is shared by all worker processes (see `settings.CACHES["shared"]`). Entries are removed whenever a user
+object is saved or deleted (see the receivers in `models.py`, this includes password changes and loaddata).
+Thus the session verification of `django.contrib.auth.get_user` always uses the current password hash.
+"""
+
+import logging
+
+from django.core.cache import caches
+
+logger = logging.getLogger("fair-debate")
+
+# alias of the cache in settings.CACHES
+CACHE_ALIAS = "shared"
+
+# seconds; limits the lifetime of an entry which was stored during a concurrent change
+TIMEOUT = 600
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_cache_key(user_id) -> str:
+    return f"debate_user:{user_id}"
+
+
+def get_user(user_id, loader):
+    """
+    Return the user object from the cache or (on cache miss) from `loader(user_id)` (might return None).
+    """
+    cache = get_cache()
+    cache_key = get_cache_key(user_id)
+    user = cache.get(cache_key)
+    if user is None:
+        user = loader(user_id)
+        if user is not None:
+            cache.set(cache_key, user, timeout=TIMEOUT)
+    return user
+
+
+def invalidate(user_id):
+    logger.debug(f"invalidate user cache for {user_id}")
+    get_cache().delete(get_cache_key(user_id))
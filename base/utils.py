@@ -1,8 +1,11 @@
+import os
+import re
+import glob
+import tomllib
+
 from django.core.exceptions import ObjectDoesNotExist
 from slugify import slugify
 
-from ipydex import IPS
-
 
 def get_or_none(manager_obj, **kwargs):
     try:
@@ -51,6 +54,61 @@ def get_contribution_numbers():
     return res
 
 
+def get_repo_metadata(repo_host_dir: str, debate_key: str) -> dict:
+    """
+    Extract the listing metadata (title, num_answers, deepest_level) of a debate from the working tree of
+    its repo. This only reads the file names (and data.toml / README.md) and does not need git or the
+    rendering of the contributions.
+
+    Raise FileNotFoundError if the repo does not exist.
+    """
+
+    # imported here (not at module level) because this module is loaded by the models (i.e. by every
+    # `django.setup()`) while fair_debate_md is only needed for requests (see `project/gunicorn_conf.py`)
+    import fair_debate_md as fdmd
+
+    repo_dir = os.path.join(repo_host_dir, debate_key)
+    if not os.path.isdir(repo_dir):
+        raise FileNotFoundError(f"directory: {repo_dir}")
+
+    fpaths = glob.glob(os.path.join(repo_dir, "a", "*.md")) + glob.glob(os.path.join(repo_dir, "b", "*.md"))
+    ctb_keys = [os.path.splitext(os.path.basename(fpath))[0] for fpath in fpaths]
+
+    return {
+        "title": get_repo_title(repo_dir) or "",
+        # don't count the root contribution as answer (like `fdmd.DebateDirLoader.num_answers`)
+        "num_answers": max(len(ctb_keys) - 1, 0),
+        # start level counting at 0 (like in `views.ShowDebateView`)
+        "deepest_level": max([len(fdmd.decompose_key(key)) - 1 for key in ctb_keys], default=0),
+    }
+
+
+def get_repo_title(repo_dir: str) -> str | None:
+    """
+    Return the title from data.toml (key `title`) or from the heading of README.md (see
+    templates/repo-default-files/README.md) or None.
+    """
+
+    toml_path = os.path.join(repo_dir, "data.toml")
+    if os.path.isfile(toml_path):
+        with open(toml_path, "rb") as fp:
+            try:
+                title = tomllib.load(fp).get("title")
+            except tomllib.TOMLDecodeError:
+                title = None
+        if title:
+            return str(title)
+
+    readme_path = os.path.join(repo_dir, "README.md")
+    if os.path.isfile(readme_path):
+        with open(readme_path) as fp:
+            first_line = fp.readline().strip()
+        if match := re.match(r'^# Debate "(.+)"$', first_line):
+            return match.group(1)
+
+    return None
+
+
 def sanitize_slug(text):
 
     GERMAN_REPLACEMENTS = [
@@ -1,13 +1,28 @@
 import os
 import json
+import hmac
+import uuid
+import hashlib
+import functools
 from urllib.parse import urlencode
 import logging
 from datetime import datetime
 
 from django.conf import settings
 from django.views import View
-from django.http import HttpResponseRedirect, QueryDict
+from django.http import (
+    HttpResponse,
+    HttpResponseRedirect,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+    QueryDict,
+    JsonResponse,
+)
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.shortcuts import render, redirect
+from asgiref.sync import sync_to_async
+from django.template.loader import render_to_string
 from django.urls import reverse
 
 
@@ -18,29 +33,54 @@ from django.contrib.auth import authenticate, login, logout
 from django.db.models import QuerySet
 
 from .forms import SignupForm, LoginForm
-from .models import Debate, Contribution, DebateUser
+from .models import Debate, Contribution, DebateUser, CommitJob, DebateFeedEntry
 
 
 import fair_debate_md as fdmd
 
-from .simple_pages_interface import get_sp, new_sp
+from .simple_pages_interface import get_sp
+from .simple_pages_core import SimplePage
 from . import simple_pages_content_default as spc
 from . import utils
+from . import render_cache
+from . import commit_handling
+from . import repo_lock
+from . import response_cache
+from . import io_pool
+from . import metrics
+from . import prometheus
 
-from ipydex import IPS
 
 pjoin = os.path.join
 
 logger = logging.getLogger("fair-debate")
 logger.info("module views.py loaded")
 
+# page size for `debate_list`
+DEBATE_LIST_PAGE_SIZE = 20
+DEBATE_LIST_MAX_PAGE_SIZE = 100
+
+# placeholder at which the page template is split into header and trailer for streaming
+DEBATE_STREAMING_MARKER = "<!-- __DEBATE_STREAMING_MARKER__ -->"
+# css class of the template elements which contain the contributions of one level in a streamed page
+# (see core.js)
+STREAMED_LEVEL_CLASS = "streamed_level"
+
 
 class Container:
     pass
 
 
 class MainView(View):
+    template = "base/main_landing_page.html"
+
     def get(self, request):
+        return render(request, self.template, self.get_context(request))
+
+    def get_context(self, request) -> dict:
+        """
+        Note: the debate lists are (lazy) querysets.
+        """
         context = {
             # nested dict for easier debugging in the template
             "data": {
@@ -52,22 +92,35 @@ class MainView(View):
 
         if request.user.is_authenticated:
             user: DebateUser = request.user
-            context["data"]["recent_user_debate_list"] = Debate.get_for_user(user, limit=3)
-        context["data"]["recent_debate_list"] = Debate.objects.filter(
-            discoverability=Debate.Discoverability.PUBLIC
-        ).order_by("-update_date")[:3]
+            context["data"]["recent_user_debate_list"] = DebateFeedEntry.get_for_user(user, limit=3)
+        context["data"]["recent_debate_list"] = DebateFeedEntry.get_public(limit=3)
 
         context["data"]["sp"] = get_sp("landing")
-        # template = "base/main_simplepage.html"
-        template = "base/main_landing_page.html"
-
-        return render(request, template, context)
+        return context
 
     def post(self, request, **kwargs):
 
         raise NotImplementedError
 
 
+class AsyncMainView(MainView):
+    """
+    Async variant of MainView (used if settings.SERVER_MODE == "asgi").
+    """
+
+    async def get(self, request):
+        await preload_user(request)
+        context = self.get_context(request)
+        for key in ("recent_user_debate_list", "recent_debate_list"):
+            if key in context["data"]:
+                context["data"][key] = [entry async for entry in context["data"][key]]
+        return await sync_to_async(render)(request, self.template, context)
+
+    async def post(self, request, **kwargs):
+
+        raise NotImplementedError
+
+
 @method_decorator(login_required(login_url=f"/{settings.LOGIN_URL}"), name="dispatch")
 class NewDebateView(View):
     def get(self, request):
@@ -91,6 +144,8 @@ class NewDebateView(View):
         discoverability = Debate.Discoverability(discoverability)
 
         debate_obj = Debate(
+            # temporary unique key (the final key contains the primary key)
+            debate_key=f"__new__{uuid.uuid4().hex}",
             user_a=request.user,
             discoverability=discoverability,
         )
@@ -99,8 +154,9 @@ class NewDebateView(View):
         slug = utils.sanitize_slug(request.POST["debate_slug"])
         debate_obj.debate_key = f"d{debate_obj.pk}-{slug}"
         debate_obj.save()
+        response_cache.purge_debate(debate_obj.debate_key)
 
-        return ShowDebateView().post(request, debate_key=debate_obj.debate_key, contribution_key="a")
+        return ShowDebateView().post(request, debate_obj=debate_obj, contribution_key="a")
 
         # body_content = request.POST.get("body", "")
         # return self.render_result_from_md(request, body_content)
@@ -151,10 +207,24 @@ class ProcessContribution(View):
     def post(self, request, action=None):
         self._preprocess_post(request)
         debate_key = request.POST["debate_key"]
-        if action == "commit":
-            self.commit_contribution(request)
-        elif action == "commit_all":
-            self.commit_all_uc_contribution(request)
+        if action in ("commit", "commit_all") and settings.COMMIT_QUEUE:
+            # the commit will be performed by the worker process; js api polls the status url
+            job = self.enqueue_commit(request, action)
+            return JsonResponse(job.get_status_dict(), status=202)
+        elif action in ("commit", "commit_all"):
+            try:
+                if action == "commit":
+                    self.commit_contribution(request)
+                else:
+                    self.commit_all_uc_contribution(request)
+            except repo_lock.RepoLockTimeout:
+                msg = "The debate is currently busy (concurrent commit). Please try again later."
+                return error_page(request, title="Debate busy", msg=msg, status=503)
+            except commit_handling.CommitError as ex:
+                # the job failed in the batch of a concurrent request (see commit_handling.commit_now)
+                logger.warning(f"{debate_key}: {ex}")
+                msg = "The commit of a concurrent request to this debate failed. Please try again later."
+                return error_page(request, title="Commit failed", msg=msg, status=500)
         elif action == "delete":
             debate_deleted = self.delete_contribution(request)
 
@@ -172,7 +242,10 @@ class ProcessContribution(View):
 
     def _get_contribution_set_from_request(self, request, all=False):
         debate_key = request.POST["debate_key"]
-        debate_obj = Debate.objects.get(debate_key=debate_key)
+        debate_obj = get_debate_obj(debate_key)
+        if debate_obj is None:
+            msg = f"No debate with key `{debate_key}` could be found."
+            raise utils.UsageError(msg)
 
         ctb_objs: QuerySet
         if all:
@@ -193,73 +266,185 @@ class ProcessContribution(View):
         return res
 
     def commit_contribution(self, request):
-        c = self._get_contribution_set_from_request(request)
-
-        ctb = fdmd.DBContribution(c.ctb_objs[0].contribution_key, c.ctb_objs[0].body)
-
-        if ctb.ctb_key == "a":
-            # This is the first contribution of a new debate
-            # -> a new repo has to be created
-            default_repo_files = get_default_repo_files(
-                context={
-                    "debate_slug": c.debate_key,
-                    "debate_url": "debate_url",
-                    "background_url": "background_url",
-                }
-            )
-            fdmd.repo_handling.create_repo(
-                settings.REPO_HOST_DIR, c.debate_key, initial_files=default_repo_files
-            )
-        fdmd.commit_ctb(settings.REPO_HOST_DIR, c.debate_key, ctb)
-        c.ctb_objs[0].delete()
-
-        c.debate_obj.n_committed_contributions += 1
-        # c.debate_obj.update_date = datetime.utcnow()
-        c.debate_obj.save()
+        commit_handling.commit_now(*self._get_commit_job_args(request, "commit"))
 
     def commit_all_uc_contribution(self, request):
+        commit_handling.commit_now(*self._get_commit_job_args(request, "commit_all"))
 
-        c = self._get_contribution_set_from_request(request, all=True)
+    def enqueue_commit(self, request, action: str) -> CommitJob:
+        return commit_handling.enqueue(*self._get_commit_job_args(request, action))
 
-        ctb_list = []
-        ctb_obj: Contribution
-        for ctb_obj in c.ctb_objs:
-            ctb_list.append(fdmd.DBContribution(ctb_key=ctb_obj.contribution_key, body=ctb_obj.body))
-
-        fdmd.commit_ctb_list(settings.REPO_HOST_DIR, c.debate_key, ctb_list)
-        c.ctb_objs.delete()
-
-        c.debate_obj.n_committed_contributions += len(ctb_list)
-        # c.debate_obj.update_date = datetime.utcnow()
-        c.debate_obj.save()
+    def _get_commit_job_args(self, request, action: str) -> tuple:
+        # this also validates the request data
+        c = self._get_contribution_set_from_request(request, all=(action == "commit_all"))
+        author = request.user if request.user.is_authenticated else None
+        contribution_key = request.POST.get("contribution_key", "") if action == "commit" else ""
+        return c.debate_obj, author, action, contribution_key
 
     def delete_contribution(self, request) -> bool:
         c = self._get_contribution_set_from_request(request)
         if len(c.ctb_objs) >= 1 and c.ctb_objs[0].contribution_key == "a":
             # we want to delete the root contribution -> also delete the whole debate
             c.debate_obj.delete()
+            render_cache.invalidate(c.debate_key)
             debate_deleted = True
         else:
             c.ctb_objs.delete()
             debate_deleted = False
-            # trigger update_date (auto_now)
-            c.debate_obj.save()
+            # trigger update_date (auto_now); a full save could overwrite the counter of a concurrent commit
+            c.debate_obj.save(update_fields=["update_date"])
+        # the debate lists (update_date) have changed
+        response_cache.purge_debate(c.debate_key)
         return debate_deleted
 
 
-def get_default_repo_files(context: dict = None) -> dict:
-    from django.template import loader
+def commit_status(request, job_id: int):
+    """
+    Report the state of a CommitJob (polled by the js api if settings.COMMIT_QUEUE is True).
+    """
+    job = utils.get_or_none(CommitJob.objects, pk=job_id)
+    if job is None or (job.author is not None and job.author != request.user):
+        return JsonResponse({"job_id": job_id, "state": None}, status=404)
+    return JsonResponse(job.get_status_dict())
+
 
-    tmpl_path = "repo-default-files/README.md"
-    if context is None:
-        context = {}
-    res = {}
+def contribution_fragment(request, debate_key: str, contribution_key: str):
+    """
+    Return the sanitized html of one committed contribution (including its answers). This is used by the
+    js api to load deeper contribution levels of big debates (see settings.DEBATE_LAZY_LOADING_MIN_ANSWERS).
+    """
+    data = {"debate_key": debate_key, "contribution_key": contribution_key, "html": None}
 
-    # TODO: iterate over templates
-    content = loader.render_to_string(tmpl_path, context, request=None)
+    def get_data():
+        html = render_cache.get_lazy_fragment(settings.REPO_HOST_DIR, debate_key, contribution_key)
+        return {**data, "html": html}, html is not None
 
-    res["README.md"] = content
-    return res
+    return _fragment_response(request, debate_key, data, get_data)
+
+
+def contribution_fragments(request, debate_key: str):
+    """
+    Return the sanitized html of several committed contributions (`?keys=a2b1a,a4b3a`), e.g. of all
+    placeholders of one contribution level (one request instead of one request per placeholder). Unknown
+    contributions are omitted.
+    """
+    ctb_keys = [key for key in request.GET.get("keys", "").split(",") if key]
+    data = {"debate_key": debate_key, "fragments": {}}
+
+    def get_data():
+        fragments = render_cache.get_lazy_fragments(settings.REPO_HOST_DIR, debate_key, ctb_keys)
+        return {**data, "fragments": fragments}, True
+
+    return _fragment_response(request, debate_key, data, get_data)
+
+
+def _fragment_response(request, debate_key: str, data: dict, get_data) -> HttpResponse:
+    """
+    Common part of the fragment apis: 404 for unknown debates, 304 if the committed state (repo HEAD) has
+    not changed since the browser has fetched the response. `get_data()` returns the data and whether the
+    requested contribution(s) have been found.
+    """
+    if not Debate.objects.filter(debate_key=debate_key).exists():
+        return JsonResponse(data, status=404)
+    try:
+        version = render_cache.get_lazy_version(settings.REPO_HOST_DIR, debate_key)
+        etag = version and quote_etag(hashlib.sha256(version.encode()).hexdigest()[:32])
+        if etag and etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            data, found = get_data()
+            response = JsonResponse(data, status=200 if found else 404)
+    except FileNotFoundError as ex:
+        logger.info(ex)
+        return JsonResponse(data, status=404)
+
+    if etag and response.status_code in (200, 304):
+        response["ETag"] = etag
+        # the committed state is not user specific but might change with every commit -> always revalidate
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of all worker processes (see metrics.py) and the health gauges in the Prometheus text
+    format (see prometheus.py) or as json (`?format=json`).
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        return JsonResponse({"error": "not found"}, status=404)
+
+    snapshot = metrics.get_aggregated_snapshot()
+    health_gauges = prometheus.get_health_gauges()
+    if request.GET.get("format") == "json":
+        response = JsonResponse({**snapshot, "health": health_gauges})
+    else:
+        response = HttpResponse(
+            prometheus.render_text(snapshot, health_gauges), content_type=prometheus.CONTENT_TYPE
+        )
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+async def preload_user(request):
+    """
+    Load the user of the request in async views: the templates (and the sync code called via
+    `sync_to_async`) evaluate the lazy `request.user` synchronously, which is not allowed in the event loop.
+    """
+    request.user = await request.auser()
+
+
+def get_debate_obj(debate_key: str) -> Debate | None:
+    """
+    Fetch the debate (together with both users) in one query via the unique index of debate_key.
+    """
+    return utils.get_or_none(Debate.objects.select_related("user_a", "user_b"), debate_key=debate_key)
+
+
+@functools.cache
+def get_template_version() -> str:
+    """
+    Return a string which changes whenever the deployed code (or any template) changes.
+    """
+    template_dir = pjoin(os.path.dirname(os.path.abspath(__file__)), "templates")
+    mtimes = []
+    for dirpath, dirnames, filenames in os.walk(template_dir):
+        mtimes.extend(os.path.getmtime(pjoin(dirpath, fname)) for fname in filenames)
+    return f"{settings.VERSION}|{settings.DEPLOYMENT_DATE}|{fdmd.__version__}|{max(mtimes, default=0)}"
+
+
+def get_debate_etag(request, debate_obj: Debate, ctb_list: list[fdmd.DBContribution], head_commit_id) -> str:
+    """
+    Return a (strong) ETag for the rendered debate page. It covers everything the page depends on:
+    the committed state (repo HEAD), the uncommitted contributions of the viewer, the debate attributes,
+    the viewer (user and CSRF cookie, because the token is embedded in the page) and the code version.
+    """
+
+    draft_fingerprint = sorted((ctb.ctb_key, ctb.body) for ctb in ctb_list)
+    parts = [
+        head_commit_id,
+        json.dumps(draft_fingerprint),
+        debate_obj.debate_key,
+        debate_obj.discoverability,
+        debate_obj.user_a_id,
+        debate_obj.user_b_id,
+        debate_obj.update_date.isoformat(),
+        request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+        get_template_version(),
+        render_cache.get_bleach_policy_hash(),
+    ]
+    digest = hashlib.sha256("\n".join(str(part) for part in parts).encode()).hexdigest()
+    return quote_etag(digest[:32])
+
+
+def set_conditional_headers(response, etag: str, debate_obj: Debate):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(debate_obj.update_date.timestamp())
+    # always revalidate (the page is user specific)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
 
 
 class ShowDebateView(View):
@@ -267,7 +452,13 @@ class ShowDebateView(View):
 
         assert debate_key is not None
 
-        ctb_list = self._get_ctb_list_from_db(author=request.user, debate_obj_or_key=debate_key)
+        # the debate object is fetched only once per request and then passed around
+        debate_obj = get_debate_obj(debate_key)
+        if debate_obj is None:
+            msg = f"No debate with key `{debate_key}` could be found."
+            return error_page(request, title="Not Found", msg=msg, status=404)
+
+        ctb_list = self._get_ctb_list_from_db(author=request.user, debate_obj=debate_obj)
 
         if len(ctb_list) == 1 and ctb_list[0].ctb_key == "a":
             # create the first contribution of a new debate
@@ -275,16 +466,57 @@ class ShowDebateView(View):
         else:
             new_debate = False
 
+        # conditional GET: answer with 304 before loading the repo
+        # note: only If-None-Match is evaluated because Debate.update_date does not reflect every change
+        # (e.g. of the uncommitted contributions or of the repo); Last-Modified is only informative
+        head_commit_id = self._get_head_commit_id(debate_key)
+        etag = get_debate_etag(request, debate_obj, ctb_list, head_commit_id)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+            set_conditional_headers(response, etag, debate_obj)
+            return response
+
         try:
-            ddl = fdmd.load_repo(settings.REPO_HOST_DIR, debate_key, ctb_list=ctb_list, new_debate=new_debate)
+            ddl = self._load_debate(debate_key, ctb_list, new_debate)
         except FileNotFoundError as ex:
-            logger.info(ex)
-            if settings.CATCH_EXCEPTIONS:
-                msg = f"No debate with key `{debate_key}` could be found."
-                return error_page(request, title="Not Found", msg=msg, status=404)
-            else:
-                raise
-        return self.render_result_from_html(request, ddl)
+            return self._handle_missing_repo(request, debate_key, ex)
+        response = self.render_result_from_html(request, ddl, debate_obj, num_db_ctbs=len(ctb_list))
+        set_conditional_headers(response, etag, debate_obj)
+        return response
+
+    def _get_head_commit_id(self, debate_key: str) -> str | None:
+        try:
+            return render_cache.get_head_commit_id(settings.REPO_HOST_DIR, debate_key)
+        except FileNotFoundError:
+            return None
+
+    def _load_debate(
+        self, debate_key: str, ctb_list: list[fdmd.DBContribution], new_debate: bool
+    ) -> fdmd.DebateDirLoader | render_cache.CommittedRender:
+        """
+        Load the debate from the repo (or the render cache). Raise FileNotFoundError if the repo is missing.
+        """
+        if not ctb_list:
+            # no uncommitted contributions -> the committed state can be taken from the cache
+            return render_cache.get_committed_render(settings.REPO_HOST_DIR, debate_key)
+        if new_debate:
+            with metrics.timer("load_repo"):
+                return fdmd.load_repo(settings.REPO_HOST_DIR, debate_key, ctb_list=ctb_list, new_debate=True)
+
+        # merge the uncommitted contributions into the cached committed state
+        ddl = render_cache.get_render_with_drafts(settings.REPO_HOST_DIR, debate_key, ctb_list)
+        if ddl is None:
+            with metrics.timer("load_repo"):
+                ddl = fdmd.load_repo(settings.REPO_HOST_DIR, debate_key, ctb_list=ctb_list, new_debate=False)
+        return ddl
+
+    def _handle_missing_repo(self, request, debate_key: str, ex: FileNotFoundError):
+        logger.info(ex)
+        if settings.CATCH_EXCEPTIONS:
+            msg = f"No debate with key `{debate_key}` could be found."
+            return error_page(request, title="Not Found", msg=msg, status=404)
+        else:
+            raise ex
 
     @method_decorator(login_required(login_url=f"/{settings.LOGIN_URL}"))
     def post(self, request, **kwargs):
@@ -292,11 +524,14 @@ class ShowDebateView(View):
         Note: this method might be called explicitly with suitable keyword args from NewDebate.post(...).
         """
 
-        if debate_key := kwargs.get("debate_key"):
-            pass
+        if debate_obj := kwargs.get("debate_obj"):
+            debate_key = debate_obj.debate_key
         else:
-            debate_key = request.POST["debate_key"]
-        debate_obj = Debate.objects.get(debate_key=debate_key)
+            debate_key = kwargs.get("debate_key") or request.POST["debate_key"]
+            debate_obj = get_debate_obj(debate_key)
+            if debate_obj is None:
+                msg = f"No debate with key `{debate_key}` could be found."
+                return error_page(request, title="Not Found", msg=msg, status=404)
 
         if contribution_key := kwargs.get("contribution_key"):
             # This never happens but the negated condition would be harder to read
@@ -371,17 +606,11 @@ class ShowDebateView(View):
             )
             return error_page(request, title="Contribution Error", msg=msg, status=403)
 
-    def _get_ctb_list_from_db(self, author: DebateUser, debate_obj_or_key) -> list[fdmd.DBContribution]:
+    def _get_ctb_list_from_db(self, author: DebateUser, debate_obj: Debate) -> list[fdmd.DBContribution]:
 
         if not author.is_authenticated:
             return []
 
-        if isinstance(debate_obj_or_key, str):
-            debate_obj = Debate.objects.get(debate_key=debate_obj_or_key)
-        else:
-            debate_obj = debate_obj_or_key
-        assert isinstance(debate_obj, Debate)
-
         ctb_list = []
         ctb_obj: Contribution
         ctb_obj_set = debate_obj.contribution_set.filter(author=author)
@@ -390,15 +619,26 @@ class ShowDebateView(View):
 
         return ctb_list
 
-    def render_result_from_html(self, request, ddl: fdmd.DebateDirLoader):
-
-        body_content_html = ddl.final_html
-        debate_obj = Debate.objects.get(debate_key=ddl.debate_key)
-
-        if request.user.is_authenticated:
-            len_ctb_obj_set = len(debate_obj.contribution_set.filter(author=request.user))
+    def render_result_from_html(
+        self,
+        request,
+        ddl: fdmd.DebateDirLoader | render_cache.CommittedRender,
+        debate_obj: Debate,
+        num_db_ctbs: int,
+        async_streaming: bool = False,
+    ):
+
+        lazy_loading = self._use_lazy_loading(ddl, num_db_ctbs)
+        streaming = not lazy_loading and self._use_streaming(request, ddl)
+        if streaming:
+            # the debate html is generated while the response is sent
+            body_content_html = DEBATE_STREAMING_MARKER
+        elif lazy_loading:
+            # deeper levels are fetched via `contribution_fragment`
+            body_content_html = render_cache.get_lazy_initial_html(ddl)
         else:
-            len_ctb_obj_set = 0
+            # sanitize only once for each version of the html
+            body_content_html = render_cache.get_sanitized_html(ddl.final_html)
 
         if debate_obj.user_b is None:
             # we do not use `None` here to distinguish the "explicitly undefined"-case from
@@ -412,14 +652,15 @@ class ShowDebateView(View):
             "data": {
                 "utd_page_type": f"utd_show_debate",
                 "segmented_html": body_content_html,
-                "debate_title": debate_obj.debate_key,  # TODO: the title should come from metadata.toml
+                "debate_title": debate_obj.title,
                 "debate_key": debate_obj.debate_key,
                 "debate_discoverability": debate_obj.discoverability,
                 "user_role": debate_obj.get_user_role(request.user),
-                "num_db_ctbs": len_ctb_obj_set,
+                "num_db_ctbs": num_db_ctbs,
                 "num_answers": ddl.num_answers,
                 "user_b": user_b,
                 "deepest_level": len(ddl.level_tree) - 1,  # start level counting at 0
+                "lazy_loading": lazy_loading,
                 "server_status_code": 200,
                 # make some data available for js api
                 "api_data": json.dumps(
@@ -427,14 +668,136 @@ class ShowDebateView(View):
                         "delete_url": reverse("delete_contribution"),
                         "commit_url": reverse("commit_contribution"),
                         "commit_all_url": reverse("commit_all_contributions"),
+                        "fragment_url": reverse(
+                            "contribution_fragment",
+                            kwargs={"debate_key": debate_obj.debate_key, "contribution_key": "__ctb_key__"},
+                        ),
+                        "fragments_url": reverse(
+                            "contribution_fragments", kwargs={"debate_key": debate_obj.debate_key}
+                        ),
                         "debate_key": debate_obj.debate_key,
                     }
                 ),
             }
         }
         template = "base/main_show_debate.html"
+        if streaming:
+            return self._render_streaming_response(request, template, context, ddl, async_streaming)
         return render(request, template, context)
 
+    def _use_lazy_loading(self, ddl: fdmd.DebateDirLoader | render_cache.CommittedRender, num_db_ctbs: int):
+        min_answers = settings.DEBATE_LAZY_LOADING_MIN_ANSWERS
+        if not min_answers or num_db_ctbs or not isinstance(ddl, render_cache.CommittedRender):
+            # uncommitted contributions are always sent completely (they have to be unfolded on load)
+            return False
+        deepest_level = len(ddl.level_tree) - 1
+        return ddl.num_answers >= min_answers and deepest_level > render_cache.LAZY_INITIAL_MAX_LEVEL
+
+    def _use_streaming(self, request, ddl: fdmd.DebateDirLoader | render_cache.CommittedRender) -> bool:
+        min_size = settings.DEBATE_STREAMING_MIN_SIZE
+        if not min_size or len(ddl.final_html) < min_size:
+            return False
+        # pages for the response cache must be complete (and the cache replaces the CSRF placeholder)
+        return not getattr(request, "render_for_response_cache", False)
+
+    def _render_streaming_response(
+        self,
+        request,
+        template: str,
+        context: dict,
+        ddl: fdmd.DebateDirLoader | render_cache.CommittedRender,
+        async_streaming: bool = False,
+    ) -> StreamingHttpResponse:
+        """
+        Send the page header (title bar etc.) before the debate html is generated. Then send the root
+        contribution and the contributions of each level (as template elements which are inserted into the
+        placeholders of the previous level by core.js) and finally the trailer (data scripts and templates).
+
+        The repo has already been loaded (errors of the repo lead to normal error responses).
+
+        :param async_streaming:     use an async iterator (otherwise the ASGI handler would consume the whole
+                                    sync iterator before sending)
+        """
+        page = render_to_string(template, context, request=request)
+        header, trailer = page.split(DEBATE_STREAMING_MARKER, 1)
+
+        def generate_chunks():
+            yield header
+            root_html, levels = render_cache.get_level_parts(ddl)
+            yield root_html
+            for level, fragments in enumerate(levels, start=1):
+                yield f'<template class="{STREAMED_LEVEL_CLASS}" data-level="{level}">'
+                yield from fragments.values()
+                yield "</template>"
+            yield trailer
+
+        async def agenerate_chunks():
+            chunks = generate_chunks()
+            # the html processing must not block the event loop
+            while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+                yield chunk
+
+        chunks = agenerate_chunks() if async_streaming else generate_chunks()
+        return StreamingHttpResponse(chunks, content_type="text/html; charset=utf-8")
+
+
+class AsyncShowDebateView(ShowDebateView):
+    """
+    Async variant of ShowDebateView (used if settings.SERVER_MODE == "asgi").
+
+    The database is accessed via the async ORM, the repo (git and disk) via a bounded thread pool (see
+    `io_pool.py`). Thus a slow repo read does not block the other requests of the worker process.
+    """
+
+    async def get(self, request, debate_key=None):
+
+        assert debate_key is not None
+
+        await preload_user(request)
+
+        debate_qs = Debate.objects.select_related("user_a", "user_b").filter(debate_key=debate_key)
+        debate_obj = await debate_qs.afirst()
+        if debate_obj is None:
+            msg = f"No debate with key `{debate_key}` could be found."
+            return await sync_to_async(error_page)(request, title="Not Found", msg=msg, status=404)
+
+        ctb_list = await self._aget_ctb_list_from_db(author=request.user, debate_obj=debate_obj)
+        new_debate = len(ctb_list) == 1 and ctb_list[0].ctb_key == "a"
+
+        head_commit_id = await io_pool.run(self._get_head_commit_id, debate_key)
+        etag = get_debate_etag(request, debate_obj, ctb_list, head_commit_id)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+            set_conditional_headers(response, etag, debate_obj)
+            return response
+
+        try:
+            ddl = await io_pool.run(self._load_debate, debate_key, ctb_list, new_debate)
+        except FileNotFoundError as ex:
+            return await sync_to_async(self._handle_missing_repo)(request, debate_key, ex)
+
+        response = await sync_to_async(self.render_result_from_html)(
+            request, ddl, debate_obj, num_db_ctbs=len(ctb_list), async_streaming=True
+        )
+        set_conditional_headers(response, etag, debate_obj)
+        return response
+
+    async def post(self, request, **kwargs):
+        return await sync_to_async(super().post)(request, **kwargs)
+
+    async def _aget_ctb_list_from_db(
+        self, author: DebateUser, debate_obj: Debate
+    ) -> list[fdmd.DBContribution]:
+
+        if not author.is_authenticated:
+            return []
+
+        ctb_obj_set = debate_obj.contribution_set.filter(author=author)
+        return [
+            fdmd.DBContribution(ctb_key=ctb_obj.contribution_key, body=ctb_obj.body)
+            async for ctb_obj in ctb_obj_set
+        ]
+
 
 def assertion_error_page(request):
     # serve a page via get request to simplify the display of source code in browser
@@ -481,7 +844,8 @@ def js_error_page(request):
 
 def error_page(request, title, msg, status=500, extra_data: dict = None):
     sp_type = title.lower().replace(" ", "_")
-    sp = new_sp(
+    # note: `new_sp` would append the object to the global list of simple pages (for every error)
+    sp = SimplePage(
         type=sp_type,
         title=title,
         # TODO handle translation (we can not simple use
@@ -524,6 +888,11 @@ def about_page(request):
     return render(request, template, context)
 
 
+async def async_about_page(request):
+    await preload_user(request)
+    return await sync_to_async(about_page)(request)
+
+
 def menu_page(request):
     context = {
         "data": {
@@ -535,6 +904,82 @@ def menu_page(request):
     return render(request, template, context)
 
 
+def debate_list(request, as_json=False):
+    """
+    Paginated list of debates (newest first). Without `role` parameter: all public debates (with committed
+    contributions). With `role` ("all", "a" or "b"): the debates of the current user (optionally filtered by
+    `discoverability`). The `cursor` parameter is taken from the previous page.
+    """
+
+    role = request.GET.get("role")
+    discoverability = request.GET.get("discoverability")
+    cursor = request.GET.get("cursor")
+
+    def _error(msg, status):
+        if as_json:
+            return JsonResponse({"error": msg}, status=status)
+        return error_page(request, title="Invalid Request", msg=msg, status=status)
+
+    try:
+        limit = min(int(request.GET.get("limit", DEBATE_LIST_PAGE_SIZE)), DEBATE_LIST_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return _error("invalid limit", status=400)
+
+    if role is None:
+        queryset = DebateFeedEntry.get_public(exclude_uncommitted=True)
+    elif role not in ("all", "a", "b"):
+        return _error(f"invalid role: {role}", status=400)
+    elif not request.user.is_authenticated:
+        return _error("Listing own debates requires login.", status=403)
+    else:
+        queryset = DebateFeedEntry.get_for_user(request.user, role=role)
+        if discoverability is not None:
+            if discoverability not in Debate.Discoverability.values:
+                return _error(f"invalid discoverability: {discoverability}", status=400)
+            queryset = queryset.filter(discoverability=discoverability)
+
+    try:
+        entries, next_cursor = DebateFeedEntry.get_page(queryset, cursor=cursor, limit=limit)
+    except ValueError as ex:
+        return _error(str(ex), status=400)
+
+    if next_cursor is None:
+        next_url = None
+    else:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_url = f"{request.path}?{params.urlencode()}"
+
+    if as_json:
+        entry: DebateFeedEntry
+        debates = [
+            {
+                "debate_key": entry.debate_key,
+                "title": entry.title,
+                "url": reverse("show_debate", kwargs={"debate_key": entry.debate_key}),
+                "num_answers": entry.num_answers,
+                "discoverability": entry.discoverability,
+                "user_role": entry.user_role or None,
+                "update_date": entry.update_date.isoformat(),
+            }
+            for entry in entries
+        ]
+        return JsonResponse({"debates": debates, "next_cursor": next_cursor, "next_url": next_url})
+
+    context = {
+        "data": {
+            "utd_page_type": "utd_debate_list",
+            "server_status_code": 200,
+            "debate_list": entries,
+            "next_url": next_url,
+        }
+    }
+    template = "base/main_debate_list.html"
+    return render(request, template, context)
+
+
 # Source: https://medium.com/@devsumitg/django-auth-user-signup-and-login-7b424dae7fab
 
 
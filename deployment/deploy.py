@@ -234,6 +234,9 @@ class MainManager:
 
         print("\n", "install gunicorn", "\n")
         c.run(f"pip install gunicorn")
+        if config("SERVER_MODE", ignore_undefined=True, default="wsgi") == "asgi":
+            # gunicorn worker class which runs uvicorn
+            c.run(f"pip install uvicorn-worker")
 
         # ensure that the same version of deploymentutils like on the controller-pc is also in the server
         c.deploy_this_package()
@@ -255,10 +258,25 @@ class MainManager:
                 venv_abs_bin_path=f"{self.venv_path}/bin",
                 project_name=self.project_name,
                 port=config("port"),
+                gunicorn_args=self.get_gunicorn_args(),
                 time_stamp=time_stamp,
             ),
         )
 
+        if config("COMMIT_QUEUE", ignore_undefined=True, default=False):
+            # generate the service ini-file for the worker which processes the commit queue
+            tmpl_name = "template_PROJECT_NAME_commitworker.ini"
+            target_name = "PROJECT_NAME_commitworker.ini".replace("PROJECT_NAME", self.project_name)
+            du.render_template(
+                tmpl_path=pjoin(self.asset_dir, tmpl_dir, tmpl_name),
+                target_path=pjoin(self.temp_workdir, tmpl_dir, target_name),
+                context=dict(
+                    venv_abs_bin_path=f"{self.venv_path}/bin",
+                    project_name=self.project_name,
+                    time_stamp=time_stamp,
+                ),
+            )
+
         #
         # ## upload config files to remote $HOME ##
         #
@@ -266,6 +284,53 @@ class MainManager:
         filters = "--exclude='**/README.md' --exclude='**/template_*'"  # these files would be harmless but might be confusing
         c.rsync_upload(srcpath1 + "/", "~", filters=filters, target_spec="remote")
 
+    def get_gunicorn_args(self) -> str:
+        """
+        Return the command line arguments for gunicorn (worker model etc.) from the [gunicorn] section of
+        config.toml (see docs/source/devdocs.md for how to choose the values).
+        """
+
+        def gcfg(key, default):
+            return config(f"gunicorn::{key}", ignore_undefined=True, default=default)
+
+        if config("SERVER_MODE", ignore_undefined=True, default="wsgi") == "asgi":
+            # async views (see base/urls.py); threads are irrelevant for this worker class
+            worker_args = ["--worker-class uvicorn_worker.UvicornWorker"]
+            app = "project.asgi:application"
+        else:
+            worker_args = [
+                f"--worker-class {gcfg('worker_class', 'sync')}",
+                f"--threads {gcfg('threads', 1)}",
+            ]
+            app = "project.wsgi:application"
+
+        # a sync worker which waits for a repo lock must be able to send its 503 before gunicorn kills it
+        timeout = gcfg("timeout", 60)
+        repo_lock_timeout = config("REPO_LOCK_TIMEOUT", ignore_undefined=True, default=30)
+        if timeout <= repo_lock_timeout:
+            msg = (
+                f"gunicorn::timeout ({timeout}) must be larger than REPO_LOCK_TIMEOUT ({repo_lock_timeout}) "
+                "plus the duration of the git operations of a commit (see docs/source/devdocs.md)"
+            )
+            raise ValueError(msg)
+
+        args = [
+            # hooks (e.g. importing the whole app before forking if preload is active)
+            "--config project/gunicorn_conf.py",
+            *worker_args,
+            f"--workers {gcfg('workers', 2)}",
+            f"--keep-alive {gcfg('keepalive', 2)}",
+            f"--timeout {timeout}",
+            f"--graceful-timeout {gcfg('graceful_timeout', 30)}",
+            # restart workers after a number of requests (limits the effect of memory leaks)
+            f"--max-requests {gcfg('max_requests', 1000)}",
+            f"--max-requests-jitter {gcfg('max_requests_jitter', 100)}",
+        ]
+        if gcfg("preload", True):
+            args.append("--preload")
+        args.append(app)
+        return " ".join(args)
+
     def update_supervisorctl(self):
         c = self.c
         c.activate_venv(f"~/{self.venv}/bin/activate")
@@ -322,7 +387,18 @@ class MainManager:
 
         db_file_name = config("DB_FILE_NAME")
 
-        exclude_patterns = [".git/", ".idea/", db_file_name, "content_repos/", ".env", ".aider*"]
+        exclude_patterns = [
+            ".git/",
+            ".idea/",
+            f"{db_file_name}*",
+            "content_repos/",
+            "_metrics/",
+            # local cache entries (cached pages, sessions and users) must not end up on the server
+            "_response_cache/",
+            "_shared_cache/",
+            ".env",
+            ".aider*",
+        ]
         filters = " ".join(f"--exclude='{pat}'" for pat in exclude_patterns)
 
         # filters = f"--exclude='.git/' --exclude='.idea/' --exclude='{db_file_name}' "
@@ -355,6 +431,9 @@ class MainManager:
 
         c.chdir(self.target_deployment_path)
         c.run(f"pip install -r requirements.txt", target_spec="both")
+        if config("DB_BACKEND", ignore_undefined=True, default="sqlite") == "postgresql":
+            # database driver (not in requirements.txt because the default backend is sqlite)
+            c.run(f"pip install 'psycopg[binary]'", target_spec="both")
 
     def perform_backup_if_not_omitted(self):
         c = self.c
@@ -388,12 +467,27 @@ class MainManager:
         # create possible migrations (which are applied below)
         c.run("python manage.py makemigrations", target_spec="both")
 
-        # delete old db
-        c.run("rm -f db.sqlite3", target_spec="both")
+        db_backend = config("DB_BACKEND", ignore_undefined=True, default="sqlite")
+        if db_backend == "sqlite":
+            # delete old db (including the files of the write-ahead log)
+            db_file_name = config("DB_FILE_NAME")
+            c.run(f"rm -f {db_file_name} {db_file_name}-wal {db_file_name}-shm", target_spec="both")
+        else:
+            # the database itself is managed by the database server -> drop all tables (`migrate --run-syncdb`
+            # only creates missing tables, i.e. changed columns, constraints and indexes would not be applied
+            # to existing ones); requires that the database user owns the schema
+            cmd = (
+                'python manage.py shell -c "from django.db import connection; cursor = connection.cursor(); '
+                "cursor.execute('DROP SCHEMA public CASCADE'); cursor.execute('CREATE SCHEMA public')\""
+            )
+            c.run(cmd, target_spec="both")
 
-        # this creates the new database
+        # this creates the new database (tables)
         c.run("python manage.py migrate --run-syncdb", target_spec="both")
 
+        # only relevant for RESPONSE_CACHE_BACKEND = "db" (otherwise this does nothing)
+        c.run("python manage.py createcachetable", target_spec="both")
+
         # this might be obsolete because we have the admin user in the fixtures
         # create superuser with password from config
         c.chdir(self.target_deployment_path)
@@ -424,6 +518,9 @@ class MainManager:
             target_spec="both",
         )
 
+        # ensure that the stored metadata of the debates is consistent with the repos
+        c.run("python manage.py updatedebatemetadata", target_spec="both")
+
     def load_db_data_from_default_fixtures(self):
         c = self.c
 
@@ -473,6 +570,9 @@ class MainManager:
         )
         c.run(cmd)
 
+        c.chdir(self.target_deployment_path)
+        c.run("python manage.py updatedebatemetadata", target_spec="both")
+
     def generate_static_files(self):
         c = self.c
 
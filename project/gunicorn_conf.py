@@ -0,0 +1,35 @@
+"""
+Hooks for gunicorn (`gunicorn --config project/gunicorn_conf.py ...`). The other options (workers, threads,
+timeouts, ...) are rendered from config.toml into the command line (see `get_gunicorn_args` in
+deployment/deploy.py).
+"""
+
+
+def on_starting(server):
+    """
+    With `--preload` the wsgi/asgi application (i.e. django and the models) is already loaded in the master
+    process at this point. Additionally import the url configuration (views, fair_debate_md, bleach, git, ...
+    and the pre-rendered simple pages) such that the forked workers share these modules (copy on write) and
+    the first request of each worker is not slowed down by the imports.
+
+    Note: no database connection must be opened here (it would be shared by all workers).
+    """
+    if not server.cfg.preload_app:
+        return
+
+    from django.urls import get_resolver
+    import fair_debate_md  # noqa: F401
+
+    get_resolver().url_patterns
+    server.log.info("preloaded url configuration and fair_debate_md")
+
+
+def worker_exit(server, worker):
+    """
+    Store the final metrics of the worker (see `base/metrics.py`, the metrics endpoint keeps the counters of
+    terminated workers).
+    """
+    import sys
+
+    if "base.metrics" in sys.modules:
+        sys.modules["base.metrics"].write_snapshot()
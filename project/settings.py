@@ -66,6 +66,55 @@ REPO_HOST_DIR_FOR_TESTS = cfg("REPO_HOST_DIR").replace(
 )
 
 
+# if True, commits are performed by a separate worker process (`python manage.py runcommitworker`)
+# instead of inside the http request (see base/commit_handling.py)
+COMMIT_QUEUE = cfg("COMMIT_QUEUE", ignore_undefined=True, default=False)
+
+# the commit worker waits until the oldest pending job of a debate is this old (seconds) and then commits all
+# pending jobs of the debate together (see base/commit_handling.py)
+COMMIT_BATCH_WINDOW = cfg("COMMIT_BATCH_WINDOW", ignore_undefined=True, default=0.5)
+
+# done and failed jobs of the commit queue are deleted by the worker after this time (seconds)
+COMMIT_JOB_RETENTION = cfg("COMMIT_JOB_RETENTION", ignore_undefined=True, default=3600)
+
+# running jobs are reset to pending by the worker after this time (seconds), i.e. if the process which
+# claimed them has died; must be longer than the slowest commit (REPO_LOCK_TIMEOUT + git operations)
+COMMIT_JOB_LEASE = cfg("COMMIT_JOB_LEASE", ignore_undefined=True, default=600)
+
+# maximum time (in seconds) to wait for the lock of a debate repo (see base/repo_lock.py)
+REPO_LOCK_TIMEOUT = cfg("REPO_LOCK_TIMEOUT", ignore_undefined=True, default=30)
+
+# "wsgi" (gunicorn with sync workers) or "asgi" (gunicorn with uvicorn workers and async views for the
+# read path, see base/urls.py)
+SERVER_MODE = cfg("SERVER_MODE", ignore_undefined=True, default="wsgi")
+
+# number of threads per (asgi) worker process for the git and disk access of the async views
+# (see base/io_pool.py)
+REPO_IO_THREADS = cfg("REPO_IO_THREADS", ignore_undefined=True, default=4)
+
+# debate pages whose debate html is larger than this (number of characters) are sent as streaming response
+# (header first, then the debate level by level, see ShowDebateView.render_result_from_html); 0 means: never
+DEBATE_STREAMING_MIN_SIZE = cfg("DEBATE_STREAMING_MIN_SIZE", ignore_undefined=True, default=0)
+
+# debate pages of debates with at least this number of answers only contain the first contribution levels,
+# deeper levels are fetched by the js api when they are unfolded (see base/render_cache.py); 0 means: never
+DEBATE_LAZY_LOADING_MIN_ANSWERS = cfg("DEBATE_LAZY_LOADING_MIN_ANSWERS", ignore_undefined=True, default=0)
+
+# request metrics (wall, db, template, load_repo and commit time per url name, see base/metrics.py)
+METRICS_ENABLED = cfg("METRICS_ENABLED", ignore_undefined=True, default=True)
+# write one json line per request to the log (BASE_APP_LOGFILE)
+METRICS_LOG_REQUESTS = cfg("METRICS_LOG_REQUESTS", ignore_undefined=True, default=False)
+# the metrics endpoint (`/api/metrics`) requires the header `Authorization: Bearer <token>`;
+# empty: endpoint disabled
+METRICS_TOKEN = cfg("credentials::metrics_token", ignore_undefined=True, default="")
+# every process writes its metrics to this directory (at most every METRICS_SNAPSHOT_INTERVAL seconds), the
+# endpoint serves the sum; empty: the endpoint only serves the metrics of the worker which handles it
+METRICS_DIR = cfg("METRICS_DIR", ignore_undefined=True, default="__BASEDIR__/_metrics").replace(
+    "__BASEDIR__", BASE_DIR
+)
+METRICS_SNAPSHOT_INTERVAL = cfg("METRICS_SNAPSHOT_INTERVAL", ignore_undefined=True, default=5)
+
+
 # Collect static files here (will be copied to correct location by deployment script)
 STATIC_ROOT = cfg("STATIC_ROOT").replace("__BASEDIR__", BASE_DIR)
 
@@ -91,6 +140,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # must be the first entry (measures the time of the other middlewares, too)
+    "base.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -105,7 +156,8 @@ ROOT_URLCONF = "project.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # (measures the render time for the request metrics, see base/metrics.py)
+        "BACKEND": "base.metrics.TimedDjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -114,6 +166,8 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                # must be the last entry (overrides `csrf_token` for cached pages)
+                "base.response_cache.csrf_placeholder",
             ],
         },
     },
@@ -125,13 +179,123 @@ WSGI_APPLICATION = "project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
+# possible values: "sqlite" (default) or "postgresql" (requires `pip install psycopg`)
+DB_BACKEND = cfg("DB_BACKEND", ignore_undefined=True, default="sqlite")
+
+# milliseconds to wait for the write lock of the sqlite database before "database is locked" is raised
+_sqlite_busy_timeout = cfg("DB_SQLITE_BUSY_TIMEOUT", ignore_undefined=True, default=20000)
+
+_database_profiles = {
+    "sqlite": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": Path(BASE_DIR) / cfg("DB_FILE_NAME"),
+        "OPTIONS": {
+            # take the write lock at the begin of each transaction: a deferred transaction which is upgraded
+            # from read to write fails immediately (without waiting) if another connection writes
+            "transaction_mode": "IMMEDIATE",
+            # executed for every new connection
+            # WAL: readers do not block the writer and vice versa (the mode is persisted in the db file)
+            # synchronous=NORMAL: safe in WAL mode, no fsync per commit
+            "init_command": ";".join(
+                [
+                    "PRAGMA journal_mode=WAL",
+                    f"PRAGMA busy_timeout={_sqlite_busy_timeout}",
+                    "PRAGMA synchronous=NORMAL",
+                    "PRAGMA temp_store=MEMORY",
+                ]
+            ),
+        },
+    },
+    "postgresql": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": cfg("DB_NAME", ignore_undefined=True, default="fair_debate"),
+        "USER": cfg("DB_USER", ignore_undefined=True, default=""),
+        "PASSWORD": cfg("credentials::db_pass", ignore_undefined=True, default=""),
+        "HOST": cfg("DB_HOST", ignore_undefined=True, default="localhost"),
+        "PORT": cfg("DB_PORT", ignore_undefined=True, default=""),
+        # persistent connections (seconds); the health check detects connections which were closed by the
+        # server in the meantime
+        "CONN_MAX_AGE": cfg("DB_CONN_MAX_AGE", ignore_undefined=True, default=60),
+        "CONN_HEALTH_CHECKS": True,
+    },
+}
+
+DATABASES = {
+    "default": _database_profiles[DB_BACKEND],
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # rendered committed state of debates (see base/render_cache.py);
+    # entries are validated against the HEAD commit of the repo -> no timeout needed
+    "debate_render": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "debate_render",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 200},
+    },
+}
+
+# full-page cache for anonymous readers (see base/response_cache.py)
+# possible values: "none", "locmem" (per process), "file" or "db" (both shared by all worker processes)
+# note: the entries are purged by the process which commits (web worker or commit worker) -> "locmem" is only
+# suitable for a single process (otherwise the other workers serve outdated pages until the timeout)
+RESPONSE_CACHE_BACKEND = cfg("RESPONSE_CACHE_BACKEND", ignore_undefined=True, default="file")
+RESPONSE_CACHE_TIMEOUT = cfg("RESPONSE_CACHE_TIMEOUT", ignore_undefined=True, default=300)
+
+_response_cache_backends = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "response_cache",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": cfg(
+            "RESPONSE_CACHE_DIR", ignore_undefined=True, default="__BASEDIR__/_response_cache"
+        ).replace("__BASEDIR__", BASE_DIR),
+    },
+    "db": {
+        # table is created by `python manage.py createcachetable`
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "response_cache",
+    },
+}
+
+if RESPONSE_CACHE_BACKEND != "none":
+    CACHES["response_cache"] = {
+        **_response_cache_backends[RESPONSE_CACHE_BACKEND],
+        "TIMEOUT": RESPONSE_CACHE_TIMEOUT,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
     }
+
+# cache which is shared by all worker processes (sessions and user objects, see base/user_cache.py)
+CACHES["shared"] = {
+    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+    "LOCATION": cfg("SHARED_CACHE_DIR", ignore_undefined=True, default="__BASEDIR__/_shared_cache").replace(
+        "__BASEDIR__", BASE_DIR
+    ),
+    "OPTIONS": {"MAX_ENTRIES": 10000},
 }
 
+# possible values: "db" (one query per request of a logged-in user), "cached_db" (read from the shared
+# cache, written to cache and db) or "cache" (shared cache only; sessions are lost if the cache is cleared)
+SESSION_BACKEND = cfg("SESSION_BACKEND", ignore_undefined=True, default="cached_db")
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+}[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = "shared"
+
+# the user object of the session is cached as well (see base/user_cache.py)
+AUTHENTICATION_BACKENDS = ["base.auth_backends.CachedModelBackend"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
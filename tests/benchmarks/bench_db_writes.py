@@ -0,0 +1,158 @@
+"""
+Measure the write throughput of the database under N parallel writer processes (like several gunicorn
+workers saving drafts and sessions).
+
+Each writer performs transactions which read a row and then write (create and update a contribution and
+save a session). The script compares the plain sqlite setup ("legacy") with the tuned sqlite profile of
+`project/settings.py` ("tuned", WAL etc.). Each profile uses a fresh temporary database file.
+
+Usage (from the project root):
+
+    python tests/benchmarks/bench_db_writes.py [-w 8] [-n 100] [--profile legacy tuned]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+
+def get_database_settings(profile: str, db_path: str) -> dict:
+    import project.settings as settings_module
+
+    if profile == "legacy":
+        db_settings = {"ENGINE": "django.db.backends.sqlite3"}
+    elif profile == "tuned":
+        db_settings = dict(settings_module._database_profiles["sqlite"])
+    else:
+        raise ValueError(f"unknown profile: {profile}")
+    db_settings["NAME"] = db_path
+    return db_settings
+
+
+def setup_django(profile: str, db_path: str):
+    """
+    Point the default database to `db_path` (must be called before `django.setup()`).
+    """
+    import project.settings as settings_module
+
+    settings_module.DATABASES = {"default": get_database_settings(profile, db_path)}
+
+    import django
+
+    django.setup()
+
+
+def create_db(profile: str, db_path: str) -> tuple[int, int]:
+    """
+    Create the tables and the objects which are needed by the writers. Return (debate_id, user_id).
+    """
+    setup_django(profile, db_path)
+    from django.core.management import call_command
+    from base.models import Debate, DebateUser
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    user = DebateUser.objects.create(username="bench_user")
+    debate = Debate.objects.create(debate_key="bench-debate", user_a=user)
+    return debate.pk, user.pk
+
+
+def writer(profile: str, db_path: str, debate_id: int, user_id: int, worker_idx: int, n: int, queue):
+    setup_django(profile, db_path)
+    from django.db import transaction, OperationalError
+    from django.contrib.sessions.backends.db import SessionStore
+    from base.models import Contribution
+
+    n_ok = n_errors = 0
+    t_start = time.perf_counter()
+    for i in range(n):
+        try:
+            with transaction.atomic():
+                # read first, then write (the typical pattern of the views)
+                Contribution.objects.filter(debate_id=debate_id, author_id=user_id).count()
+                ctb = Contribution.objects.create(
+                    debate_id=debate_id,
+                    author_id=user_id,
+                    contribution_key=f"a{worker_idx + 1}b{i + 1}a",
+                    body=f"draft {i} of worker {worker_idx}",
+                )
+                ctb.body += " (updated)"
+                ctb.save()
+            session = SessionStore()
+            session["counter"] = i
+            session.save()
+            n_ok += 1
+        except OperationalError:
+            # "database is locked"
+            n_errors += 1
+    queue.put((t_start, time.perf_counter(), n_ok, n_errors))
+
+
+def run_profile(profile: str, n_workers: int, n: int, tmp_dir: str) -> dict:
+    db_path = os.path.join(tmp_dir, f"bench_{profile}.sqlite3")
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+
+    # the schema is created in a separate process (django can only be set up once per process)
+    setup_process = ctx.Process(target=_create_db_in_subprocess, args=(profile, db_path, queue))
+    setup_process.start()
+    debate_id, user_id = queue.get()
+    setup_process.join()
+
+    processes = [
+        ctx.Process(target=writer, args=(profile, db_path, debate_id, user_id, idx, n, queue))
+        for idx in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    t_start = min(res[0] for res in results)
+    t_end = max(res[1] for res in results)
+    n_ok = sum(res[2] for res in results)
+    n_errors = sum(res[3] for res in results)
+    return {
+        "profile": profile,
+        "duration": t_end - t_start,
+        "n_ok": n_ok,
+        "n_errors": n_errors,
+        "throughput": n_ok / (t_end - t_start),
+    }
+
+
+def _create_db_in_subprocess(profile: str, db_path: str, queue):
+    queue.put(create_db(profile, db_path))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--workers", type=int, default=8, help="number of parallel writer processes")
+    parser.add_argument("-n", type=int, default=100, help="number of write transactions per writer")
+    parser.add_argument("--profile", nargs="+", default=["legacy", "tuned"], choices=["legacy", "tuned"])
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_writes_")
+    try:
+        print(f"writers: {args.workers}, transactions per writer: {args.n}")
+        for profile in args.profile:
+            res = run_profile(profile, args.workers, args.n, tmp_dir)
+            print(
+                f"{res['profile']:8s} {res['duration']:7.2f} s  {res['throughput']:8.1f} transactions/s  "
+                f"ok: {res['n_ok']:5d}  errors (database is locked): {res['n_errors']:5d}"
+            )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Measure the render path of a debate page for a synthetic debate of configurable size.
+
+The debate is created with `fdmd.repo_handling.create_repo` and `fdmd.commit_ctb_list` (one commit per
+contribution level) in a temporary REPO_HOST_DIR (with a temporary database). Measured steps:
+
+- `load_repo`: `fdmd.load_repo` of the committed state
+- `bleach`: `bleach.clean` of the complete debate html (uncached)
+- `template`: rendering of `base/main_show_debate.html` (context as created by `ShowDebateView`)
+- `show_debate_cold`: `ShowDebateView.get` via the django test client with empty caches
+- `show_debate_warm`: like `show_debate_cold` but with warm render cache (response cache purged)
+- `show_debate_cached`: like `show_debate_cold` but served from the response cache
+
+The results are written to a json file. Use `--compare` with the file of an earlier run (e.g. of the last
+release) to print the relative change of every step.
+
+Usage (from the project root):
+
+    python tests/benchmarks/bench_render_path.py [-n 50] [-d 3] [-s 10] [-r 10] [-o bench.json]
+    python tests/benchmarks/bench_render_path.py -o bench_new.json --compare bench_old.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from unittest import mock
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+DEBATE_KEY = "bench-debate"
+
+
+def setup_django(tmp_dir: str):
+    """
+    Use a temporary database, repo host dir and shared cache (must be called before `django.setup()`).
+    """
+    import project.settings as settings_module
+
+    settings_module.DATABASES = {
+        "default": {**settings_module.DATABASES["default"], "NAME": os.path.join(tmp_dir, "bench.sqlite3")}
+    }
+    settings_module.REPO_HOST_DIR = os.path.join(tmp_dir, "repos")
+    settings_module.CACHES["shared"]["LOCATION"] = os.path.join(tmp_dir, "_shared_cache")
+    settings_module.METRICS_DIR = ""
+    os.makedirs(settings_module.REPO_HOST_DIR)
+
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+def get_branching_factor(n_contributions: int, max_depth: int, n_segments: int) -> int:
+    """
+    Return the smallest number of answers per contribution such that `n_contributions` fit into `max_depth`
+    levels (at most one answer per segment).
+    """
+    for branching in range(1, n_segments + 1):
+        if sum(branching**level for level in range(max_depth + 1)) >= n_contributions:
+            return branching
+    return n_segments
+
+
+def get_body(ctb_key: str, n_segments: int) -> str:
+    sentences = [
+        f"Statement {idx} of contribution {ctb_key} with *some* **markdown** and `code`."
+        for idx in range(1, n_segments + 1)
+    ]
+    # paragraphs of 5 sentences (every sentence is a segment)
+    paragraphs = [" ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)]
+    return "\n\n".join(paragraphs)
+
+
+def get_synthetic_contributions(n_contributions: int, max_depth: int, n_segments: int) -> list[list]:
+    """
+    Return the contributions level by level (level 0 only contains the root contribution "a").
+    """
+    import fair_debate_md as fdmd
+
+    branching = get_branching_factor(n_contributions, max_depth, n_segments)
+    step = max(n_segments // branching, 1)
+    segment_indices = [1 + k * step for k in range(branching)]
+
+    levels = [[fdmd.DBContribution(ctb_key="a", body=get_body("a", n_segments))]]
+    n = 1
+    while n < n_contributions and len(levels) <= max_depth:
+        level = []
+        for parent in levels[-1]:
+            answer_role = "b" if parent.ctb_key[-1] == "a" else "a"
+            for segment_idx in segment_indices:
+                if n >= n_contributions:
+                    break
+                ctb_key = f"{parent.ctb_key}{segment_idx}{answer_role}"
+                level.append(fdmd.DBContribution(ctb_key=ctb_key, body=get_body(ctb_key, n_segments)))
+                n += 1
+        levels.append(level)
+    return levels
+
+
+def create_debate(n_contributions: int, max_depth: int, n_segments: int):
+    import fair_debate_md as fdmd
+    from django.conf import settings
+    from base.models import Debate, DebateUser
+    from base.commit_handling import get_default_repo_files
+
+    user_a = DebateUser.objects.create(username="bench_user_a")
+    user_b = DebateUser.objects.create(username="bench_user_b")
+    debate_obj = Debate.objects.create(debate_key=DEBATE_KEY, user_a=user_a, user_b=user_b)
+
+    fdmd.repo_handling.create_repo(
+        settings.REPO_HOST_DIR, DEBATE_KEY, initial_files=get_default_repo_files({"debate_slug": DEBATE_KEY})
+    )
+    levels = get_synthetic_contributions(n_contributions, max_depth, n_segments)
+    for level in levels:
+        # all contributions of a level have the same author role
+        fdmd.commit_ctb_list(settings.REPO_HOST_DIR, DEBATE_KEY, level)
+
+    debate_obj.n_committed_contributions = sum(len(level) for level in levels)
+    debate_obj.update_metadata_from_repo(settings.REPO_HOST_DIR)
+    debate_obj.save()
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """
+    Call `func` once (warmup) and then `repeat` times. Return statistics of the durations (seconds).
+    """
+    durations = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        func()
+        if i > 0:
+            durations.append(time.perf_counter() - t0)
+    return {
+        "n": repeat,
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.mean(durations),
+        "max": max(durations),
+        "stdev": statistics.stdev(durations) if repeat > 1 else 0.0,
+    }
+
+
+def run_benchmarks(repeat: int) -> tuple[dict, dict]:
+    import bleach
+    import fair_debate_md as fdmd
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import reverse
+    from django.template.loader import render_to_string
+    from django_bleach.utils import get_bleach_default_options
+    from base import views, render_cache, response_cache
+
+    ddl = fdmd.load_repo(settings.REPO_HOST_DIR, DEBATE_KEY, ctb_list=None, new_debate=False)
+    debate_info = {
+        "num_answers": ddl.num_answers,
+        "deepest_level": len(ddl.level_tree) - 1,
+        "html_size": len(ddl.final_html),
+    }
+
+    client = Client()
+    url = reverse("show_debate", kwargs={"debate_key": DEBATE_KEY})
+
+    def get_page():
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+
+    def clear_all_caches():
+        render_cache.invalidate(DEBATE_KEY)
+        render_cache.get_cache().clear()
+        response_cache.purge_all()
+
+    # capture the arguments of the template rendering of the view
+    response_cache.purge_all()
+    with mock.patch.object(views, "render", wraps=views.render) as render_mock:
+        get_page()
+    request, template_name, context = render_mock.call_args.args
+
+    def load_repo():
+        fdmd.load_repo(settings.REPO_HOST_DIR, DEBATE_KEY, ctb_list=None, new_debate=False)
+
+    bleach_options = get_bleach_default_options()
+    results = {
+        "load_repo": measure(load_repo, repeat),
+        "bleach": measure(lambda: bleach.clean(ddl.final_html, **bleach_options), repeat),
+        "template": measure(lambda: render_to_string(template_name, context, request=request), repeat),
+        "show_debate_cold": measure(get_page, repeat, setup=clear_all_caches),
+        "show_debate_warm": measure(get_page, repeat, setup=response_cache.purge_all),
+        "show_debate_cached": measure(get_page, repeat),
+    }
+    return debate_info, results
+
+
+def get_meta_data() -> dict:
+    import django
+    import fair_debate_md as fdmd
+    from django.conf import settings
+
+    try:
+        git_commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = None
+
+    return {
+        "timestamp": datetime.now(tz=timezone.utc).isoformat(timespec="seconds"),
+        "version": settings.VERSION,
+        "git_commit": git_commit,
+        "fair_debate_md": getattr(fdmd, "__version__", None),
+        "django": django.get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def print_results(results: dict, reference: dict = None):
+    for name, res in results.items():
+        line = f"{name:20s} median {res['median'] * 1000:9.2f} ms  min {res['min'] * 1000:9.2f} ms"
+        if reference is not None and name in reference["results"]:
+            ref_median = reference["results"][name]["median"]
+            line += f"  ({(res['median'] / ref_median - 1) * 100:+6.1f} % vs. reference)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--contributions", type=int, default=50, help="number of contributions")
+    parser.add_argument("-d", "--depth", type=int, default=3, help="maximum nesting depth (answer levels)")
+    parser.add_argument("-s", "--segments", type=int, default=10, help="number of segments per contribution")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="number of measurements per step")
+    parser.add_argument("-o", "--output", default="bench_render_path.json", help="path of the json result")
+    parser.add_argument("--compare", help="json result of an earlier run (printed as reference)")
+    args = parser.parse_args()
+
+    reference = None
+    if args.compare:
+        with open(args.compare) as fp:
+            reference = json.load(fp)
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_render_path_")
+    try:
+        setup_django(tmp_dir)
+        t0 = time.perf_counter()
+        create_debate(args.contributions, args.depth, args.segments)
+        print(f"created synthetic debate in {time.perf_counter() - t0:.1f} s")
+        debate_info, results = run_benchmarks(args.repeat)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    data = {
+        "meta": get_meta_data(),
+        "params": {
+            "contributions": args.contributions,
+            "depth": args.depth,
+            "segments": args.segments,
+            "repeat": args.repeat,
+        },
+        "debate": debate_info,
+        "results": results,
+    }
+    with open(args.output, "w") as fp:
+        json.dump(data, fp, indent=2)
+
+    print(
+        f"answers: {debate_info['num_answers']}, deepest level: {debate_info['deepest_level']}, "
+        f"html: {debate_info['html_size'] / 1000:.0f} kB"
+    )
+    print_results(results, reference)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
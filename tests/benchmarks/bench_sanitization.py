@@ -0,0 +1,62 @@
+"""
+Compare the per-request sanitization of the debate html (`bleach` template filter) with the cached path
+(`render_cache.get_sanitized_html`).
+
+Usage (from the project root, requires `python manage.py initializefixtures --unit-test-mode`):
+
+    python tests/benchmarks/bench_sanitization.py [-n 20]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django_bleach.templatetags.bleach_tags import bleach_value
+import fair_debate_md as fdmd
+
+from base import render_cache
+
+
+def measure(func, n: int) -> float:
+    """
+    return the mean duration in ms
+    """
+    t0 = time.perf_counter()
+    for i in range(n):
+        func()
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=20, help="number of repetitions")
+    parser.add_argument("--debate-key", default=fdmd.TEST_DEBATE_KEY)
+    args = parser.parse_args()
+
+    repo_host_dir = settings.REPO_HOST_DIR_FOR_TESTS
+    cr = render_cache.get_committed_render(repo_host_dir, args.debate_key)
+    html = cr.final_html
+
+    # warm up the cache
+    render_cache.get_sanitized_html(html)
+
+    t_filter = measure(lambda: bleach_value(html), args.n)
+    t_cached = measure(lambda: render_cache.get_sanitized_html(html), args.n)
+
+    print(f"debate: {args.debate_key} ({len(html)} characters of html), n={args.n}")
+    print(f"bleach filter per request: {t_filter:8.3f} ms")
+    print(f"cached sanitization:       {t_cached:8.3f} ms")
+    print(f"speedup:                   {t_filter / t_cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+"""
+Generate concurrent load against a local server (gunicorn with the wsgi app of the project) and report
+throughput, latency percentiles (p50/p95/p99) and error rates per action.
+
+Setup (all data in a temporary directory, see `loadtest_settings.py`): a fresh sqlite database, a
+REPO_HOST_DIR with `--debates` debates (root contribution "a" with `--segments` segments) and two users per
+debate (role a and b). Then the server is started and the virtual users run for `--duration` seconds:
+
+- writers (two per debate): log in and then choose actions with the weights of `--mix`:
+  - `read`: GET of the debate page (logged in, i.e. rendered with the drafts of the user)
+  - `draft`: POST of a new contribution to the debate page (`ShowDebateView.post`); user b answers the
+    segments of the root contribution, user a answers the contributions of user b which were committed
+  - `commit`: POST of one of the own drafts to `commit_contribution` (falls back to `draft` if there is none)
+- readers (`--readers`): anonymous GET of a random debate page (`read_anon`, response cache)
+
+Errors are responses with an unexpected status code (e.g. 503 "Debate busy" after a repo lock timeout or
+500 after a "database is locked" error) and connection errors. After the run the script checks that the
+number of committed contributions (database and repo) matches the successful commits and prints the
+counters of the server processes (sqlite lock wait, repo lock contention, see `base/metrics.py`).
+
+Usage (from the project root, requires `pip install gunicorn`):
+
+    python tests/benchmarks/load_test.py [--debates 4] [--readers 8] [--duration 30] [--workers 4] \
+        [--worker-class gthread --threads 4] [--mix read=60,draft=25,commit=15] [-o load_test.json]
+
+`--server runserver` uses the development server instead of gunicorn (only useful to check the script).
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import Counter
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)
+os.environ["DJANGO_SETTINGS_MODULE"] = "loadtest_settings"
+
+from django.urls import reverse  # noqa: E402
+
+from bench_render_path import get_body, get_meta_data  # noqa: E402
+
+PASSWORD = "load-test-password"
+HOST = "127.0.0.1"
+
+# status codes which are counted as success
+EXPECTED_STATUS = {
+    "login": (302,),
+    "read": (200,),
+    "read_anon": (200,),
+    "draft": (302,),
+    # 202: commit queue (the commit is performed later by the commit worker)
+    "commit": (302, 202),
+}
+
+
+def setup_django(tmp_dir: str, commit_queue: bool):
+    """
+    Create the temporary database (must be called before the server is started). The server processes
+    inherit the environment variables.
+    """
+    os.environ["LOADTEST_DIR"] = tmp_dir
+    os.environ["LOADTEST_COMMIT_QUEUE"] = str(commit_queue)
+    os.makedirs(os.path.join(tmp_dir, "repos"))
+
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+def create_debates(n_debates: int, n_segments: int) -> list[dict]:
+    import fair_debate_md as fdmd
+    from django.conf import settings
+    from django.db import connections
+    from base.models import Debate, DebateUser
+    from base.commit_handling import get_default_repo_files
+
+    debates = []
+    for i in range(n_debates):
+        debate_key = f"load-debate-{i}"
+        user_a = DebateUser.objects.create_user(username=f"load_user_{i}_a", password=PASSWORD)
+        user_b = DebateUser.objects.create_user(username=f"load_user_{i}_b", password=PASSWORD)
+        debate_obj = Debate.objects.create(debate_key=debate_key, user_a=user_a, user_b=user_b)
+
+        initial_files = get_default_repo_files({"debate_slug": debate_key})
+        fdmd.repo_handling.create_repo(settings.REPO_HOST_DIR, debate_key, initial_files=initial_files)
+        root_ctb = fdmd.DBContribution(ctb_key="a", body=get_body("a", n_segments))
+        fdmd.commit_ctb_list(settings.REPO_HOST_DIR, debate_key, [root_ctb])
+
+        debate_obj.n_committed_contributions = 1
+        debate_obj.update_metadata_from_repo(settings.REPO_HOST_DIR)
+        debate_obj.save()
+        debates.append({"debate_key": debate_key, "usernames": {"a": user_a.username, "b": user_b.username}})
+
+    # the server processes must not share the sqlite connection of this process
+    connections.close_all()
+    return debates
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port: int, log_file) -> list[subprocess.Popen]:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([PROJECT_DIR, BENCHMARK_DIR])}
+    if args.server == "gunicorn":
+        # fmt: off
+        cmd = [
+            sys.executable, "-m", "gunicorn", "project.wsgi:application",
+            "--config", "project/gunicorn_conf.py",
+            "--bind", f"{HOST}:{port}",
+            "--workers", str(args.workers),
+            "--worker-class", args.worker_class,
+            "--threads", str(args.threads),
+            "--timeout", "120",
+        ]
+        # fmt: on
+    else:
+        cmd = [sys.executable, "manage.py", "runserver", "--noreload", f"{HOST}:{port}"]
+
+    kwargs = {"cwd": PROJECT_DIR, "env": env, "stdout": log_file, "stderr": subprocess.STDOUT}
+    processes = [subprocess.Popen(cmd, **kwargs)]
+    if args.commit_queue:
+        processes.append(subprocess.Popen([sys.executable, "manage.py", "runcommitworker"], **kwargs))
+    return processes
+
+
+def wait_for_server(port: int, server_process: subprocess.Popen, timeout: float = 60):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout:
+        if server_process.poll() is not None:
+            raise RuntimeError(f"server exited with code {server_process.returncode} (see server.log)")
+        conn = http.client.HTTPConnection(HOST, port, timeout=5)
+        try:
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+        finally:
+            conn.close()
+    raise RuntimeError(f"server did not start within {timeout} s (see server.log)")
+
+
+def stop_server(processes: list[subprocess.Popen]):
+    for process in processes:
+        # gunicorn: graceful shutdown (the workers write their final metrics, see project/gunicorn_conf.py)
+        process.send_signal(signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def get_debate_path(debate_key: str) -> str:
+    return reverse("show_debate", kwargs={"debate_key": debate_key})
+
+
+class HTTPSession:
+    """
+    Keep-alive connection with cookies (session and csrf token) of one virtual user. Redirects are not
+    followed.
+    """
+
+    def __init__(self, port: int):
+        self.conn = http.client.HTTPConnection(HOST, port, timeout=120)
+        self.cookies = {}
+
+    def request(self, method: str, path: str, data: dict = None) -> int:
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{key}={value}" for key, value in self.cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode({**data, "csrfmiddlewaretoken": self.cookies.get("csrftoken", "")})
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # the next request opens a new connection
+            self.conn.close()
+            raise
+
+        for header in response.headers.get_all("Set-Cookie") or []:
+            for key, morsel in SimpleCookie(header).items():
+                self.cookies[key] = morsel.value
+        return response.status
+
+    def close(self):
+        self.conn.close()
+
+
+class DebateState:
+    """
+    State of a debate which is shared by its two writers.
+    """
+
+    def __init__(self, debate_key: str, usernames: dict, n_segments: int):
+        self.debate_key = debate_key
+        self.usernames = usernames
+        self.lock = threading.Lock()
+        # segments of the root contribution which are not yet answered by user b
+        self.free_segments = list(range(1, n_segments + 1))
+        # committed contributions of user b which are not yet answered by user a
+        self.answerable_keys = []
+        self.n_commits = 0
+
+    def get_new_contribution_key(self, role: str) -> str | None:
+        with self.lock:
+            if role == "b" and self.free_segments:
+                return f"a{self.free_segments.pop(0)}b"
+            if role == "a" and self.answerable_keys:
+                return f"{self.answerable_keys.pop(0)}1a"
+        return None
+
+    def add_commit(self, ctb_key: str, queued: bool):
+        with self.lock:
+            self.n_commits += 1
+            # with the commit queue the answer might be processed before the commit of the parent
+            if ctb_key.endswith("b") and not queued:
+                self.answerable_keys.append(ctb_key)
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, port: int, deadline: float, debate_states: list, seed: int, role=None, mix=None):
+        """
+        :param role:    None (anonymous reader) or "a"/"b" (writer of the first debate in `debate_states`)
+        """
+        super().__init__(daemon=True)
+        self.session = HTTPSession(port)
+        self.deadline = deadline
+        self.debate_states = debate_states
+        self.rng = random.Random(seed)
+        self.role = role
+        self.mix = mix
+        self.drafts = []
+        # list of tuples (action, status or None, duration)
+        self.samples = []
+
+    def timed_request(self, action: str, method: str, path: str, data: dict = None) -> int | None:
+        t0 = time.perf_counter()
+        try:
+            status = self.session.request(method, path, data)
+        except (OSError, http.client.HTTPException):
+            status = None
+        self.samples.append((action, status, time.perf_counter() - t0))
+        return status
+
+    def login(self, username: str):
+        login_path = reverse("login")
+        # the login page sets the csrf cookie
+        self.session.request("GET", login_path)
+        self.timed_request("login", "POST", login_path, {"username": username, "password": PASSWORD})
+
+    def run(self):
+        try:
+            if self.role is None:
+                while time.monotonic() < self.deadline:
+                    debate_key = self.rng.choice(self.debate_states).debate_key
+                    self.timed_request("read_anon", "GET", get_debate_path(debate_key))
+            else:
+                self.run_writer()
+        finally:
+            self.session.close()
+
+    def run_writer(self):
+        debate_state = self.debate_states[0]
+        debate_key = debate_state.debate_key
+        debate_path = get_debate_path(debate_key)
+        self.login(debate_state.usernames[self.role])
+
+        actions, weights = zip(*self.mix.items())
+        while time.monotonic() < self.deadline:
+            action = self.rng.choices(actions, weights)[0]
+            if action == "commit" and not self.drafts:
+                action = "draft"
+            if action == "draft":
+                ctb_key = debate_state.get_new_contribution_key(self.role)
+                if ctb_key is None:
+                    action = "read"
+
+            if action == "read":
+                self.timed_request("read", "GET", debate_path)
+            elif action == "draft":
+                data = {
+                    "debate_key": debate_key,
+                    "reference_segment": ctb_key[:-1],
+                    "body": f"Answer {ctb_key} of the load test. It has a second sentence.",
+                }
+                if self.timed_request("draft", "POST", debate_path, data) == 302:
+                    self.drafts.append(ctb_key)
+            else:
+                ctb_key = self.drafts.pop(0)
+                data = {"debate_key": debate_key, "contribution_key": ctb_key}
+                status = self.timed_request("commit", "POST", reverse("commit_contribution"), data)
+                if status in EXPECTED_STATUS["commit"]:
+                    debate_state.add_commit(ctb_key, queued=status == 202)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    idx = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[idx]
+
+
+def evaluate_samples(samples: list, duration: float) -> dict:
+    results = {}
+    for action in sorted({sample[0] for sample in samples}) + ["total"]:
+        action_samples = [sample for sample in samples if action in (sample[0], "total")]
+        latencies = sorted(sample[2] for sample in action_samples)
+        n_errors = sum(1 for name, status, _ in action_samples if status not in EXPECTED_STATUS[name])
+        results[action] = {
+            "n": len(action_samples),
+            "throughput": len(action_samples) / duration,
+            "error_rate": n_errors / len(action_samples),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1],
+            "status": dict(Counter(str(sample[1]) for sample in action_samples)),
+        }
+    return results
+
+
+def check_consistency(debate_states: list, commit_queue: bool) -> list[str]:
+    """
+    Return a list of problems (empty if the committed contributions match the successful commits).
+    """
+    from django.conf import settings
+    from base.models import Debate
+    from base.utils import get_repo_metadata
+
+    if commit_queue:
+        from base.commit_handling import process_pending_jobs
+
+        # jobs which the commit worker did not process before it was stopped
+        process_pending_jobs()
+
+    problems = []
+    for debate_state in debate_states:
+        expected = 1 + debate_state.n_commits
+        debate_obj = Debate.objects.get(debate_key=debate_state.debate_key)
+        n_repo = get_repo_metadata(settings.REPO_HOST_DIR, debate_state.debate_key)["num_answers"] + 1
+        if not debate_obj.n_committed_contributions == n_repo == expected:
+            problems.append(
+                f"{debate_state.debate_key}: {expected} contributions committed, database: "
+                f"{debate_obj.n_committed_contributions}, repo: {n_repo}"
+            )
+    return problems
+
+
+def get_server_counters() -> dict:
+    """
+    Return the counters of the (terminated) server processes (see `base/metrics.py`).
+    """
+    from base import metrics
+
+    # the setup in this process is not part of the measurement
+    metrics.registry.reset()
+    snapshot = metrics.get_aggregated_snapshot()
+    lock_stats = {f"repo_lock_{key}": value for key, value in snapshot["repo_lock"].items()}
+    return {**snapshot["counters"], **lock_stats}
+
+
+def print_results(results: dict):
+    print(
+        f"{'action':10s} {'n':>7s} {'req/s':>8s} {'errors':>7s} "
+        f"{'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}  status"
+    )
+    for action, res in results.items():
+        print(
+            f"{action:10s} {res['n']:7d} {res['throughput']:8.1f} {res['error_rate'] * 100:6.1f}% "
+            f"{res['p50'] * 1000:9.1f} {res['p95'] * 1000:9.1f} {res['p99'] * 1000:9.1f} "
+            f"{res['max'] * 1000:9.1f}  {res['status']}"
+        )
+
+
+def parse_mix(mix_str: str) -> dict:
+    mix = {}
+    for part in mix_str.split(","):
+        action, weight = part.split("=")
+        if action not in ("read", "draft", "commit"):
+            raise ValueError(f"unknown action in --mix: {action}")
+        mix[action] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--debates", type=int, default=4, help="number of debates (two writers per debate)")
+    parser.add_argument("--readers", type=int, default=8, help="number of anonymous readers")
+    parser.add_argument("--duration", type=float, default=30, help="duration of the load (seconds)")
+    parser.add_argument("--segments", type=int, default=200, help="segments of the root contribution")
+    parser.add_argument("--mix", default="read=60,draft=25,commit=15", help="weights of the writer actions")
+    parser.add_argument("--server", choices=["gunicorn", "runserver"], default="gunicorn")
+    parser.add_argument("--workers", type=int, default=4, help="number of gunicorn workers")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class (sync or gthread)")
+    parser.add_argument("--threads", type=int, default=1, help="threads per gunicorn worker (gthread)")
+    parser.add_argument("--commit-queue", action="store_true", help="commit via the commit worker process")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="path of the json result")
+    parser.add_argument("--keep", action="store_true", help="do not delete the temporary directory")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    tmp_dir = tempfile.mkdtemp(prefix="load_test_")
+    processes = []
+    try:
+        setup_django(tmp_dir, args.commit_queue)
+        debates = create_debates(args.debates, args.segments)
+        debate_states = [
+            DebateState(debate["debate_key"], debate["usernames"], args.segments) for debate in debates
+        ]
+
+        port = get_free_port()
+        with open(os.path.join(tmp_dir, "server.log"), "w") as log_file:
+            processes = start_server(args, port, log_file)
+            wait_for_server(port, processes[0])
+
+            deadline = time.monotonic() + args.duration
+            users = []
+            for debate_state in debate_states:
+                for role in ("a", "b"):
+                    seed = args.seed * 1000 + len(users)
+                    users.append(VirtualUser(port, deadline, [debate_state], seed, role=role, mix=mix))
+            for _ in range(args.readers):
+                users.append(VirtualUser(port, deadline, debate_states, args.seed * 1000 + len(users)))
+
+            t0 = time.monotonic()
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            duration = time.monotonic() - t0
+
+            stop_server(processes)
+            processes = []
+
+        samples = [sample for user in users for sample in user.samples]
+        results = evaluate_samples(samples, duration)
+        problems = check_consistency(debate_states, args.commit_queue)
+        server_counters = get_server_counters()
+    except Exception:
+        log_path = os.path.join(tmp_dir, "server.log")
+        if os.path.isfile(log_path):
+            with open(log_path) as fp:
+                print("".join(fp.readlines()[-30:]), file=sys.stderr)
+        raise
+    finally:
+        if processes:
+            stop_server(processes)
+        if args.keep:
+            print(f"temporary data: {tmp_dir}")
+        else:
+            shutil.rmtree(tmp_dir)
+
+    print(f"{len(users)} virtual users, {duration:.1f} s, server: {args.server}")
+    print_results(results)
+    print(
+        f"server: db lock wait {server_counters['db_lock_wait_seconds']:.2f} s, "
+        f"db locked errors {server_counters['db_locked_errors']}, "
+        f"repo lock contended {server_counters['repo_lock_n_contended']}, "
+        f"repo lock timeouts {server_counters['repo_lock_n_timeouts']}"
+    )
+    for problem in problems:
+        print(f"inconsistent: {problem}")
+
+    if args.output:
+        data = {
+            "meta": get_meta_data(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+            "results": results,
+            "server_counters": server_counters,
+            "problems": problems,
+        }
+        with open(args.output, "w") as fp:
+            json.dump(data, fp, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Settings for the server processes of `load_test.py`: the settings of `project/settings.py` (i.e. config.toml)
+but with all data (sqlite database, repos, shared cache, metrics) in the temporary directory `LOADTEST_DIR`.
+"""
+
+import os
+
+from project.settings import *  # noqa: F401,F403
+from project.settings import _database_profiles
+
+LOADTEST_DIR = os.environ["LOADTEST_DIR"]
+
+DEBUG = False
+ALLOWED_HOSTS = [*ALLOWED_HOSTS, "127.0.0.1", "localhost"]  # noqa: F405
+
+# the load test measures the sqlite profile (write contention of several worker processes)
+DATABASES = {
+    "default": {**_database_profiles["sqlite"], "NAME": os.path.join(LOADTEST_DIR, "db.sqlite3")},
+}
+REPO_HOST_DIR = os.path.join(LOADTEST_DIR, "repos")
+COMMIT_QUEUE = os.environ.get("LOADTEST_COMMIT_QUEUE") == "True"
+
+CACHES["shared"]["LOCATION"] = os.path.join(LOADTEST_DIR, "_shared_cache")  # noqa: F405
+if RESPONSE_CACHE_BACKEND == "file":  # noqa: F405
+    CACHES["response_cache"]["LOCATION"] = os.path.join(LOADTEST_DIR, "_response_cache")  # noqa: F405
+
+# the counters of all server processes are summed up after the run (see `load_test.get_server_counters`)
+METRICS_ENABLED = True
+METRICS_DIR = os.path.join(LOADTEST_DIR, "_metrics")
+METRICS_SNAPSHOT_INTERVAL = 1
@@ -1,10 +1,16 @@
 import os
+import sys
+import ast
 import json
+import re
 import time
+import shutil
+import subprocess
 from textwrap import dedent as twdd
 from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from django.urls import reverse
 from django.conf import settings
@@ -15,7 +21,7 @@ from packaging.version import Version
 
 from ipydex import IPS
 import fair_debate_md as fdmd
-from base import models, utils
+from base import models, utils, views, render_cache, commit_handling, repo_lock, response_cache
 
 from .utils import (
     logger,
@@ -32,6 +38,8 @@ from .utils import (
     N_DEBATES_USER_2,
     N_COMMITS_TEST_REPO,
     REPO_HOST_DIR,  # note: this is adapted for unittests
+    TEST_SHARED_CACHE_DIR,
+    TEST_METRICS_DIR,
 )
 
 pjoin = os.path.join
@@ -54,6 +62,8 @@ class TestCore1(RepoResetMixin, FollowRedirectMixin, TestCase):
         # ensure that after each test this variable can be reset
         self.CATCH_EXCEPTIONS_from_settings = settings.CATCH_EXCEPTIONS
         self.set_up()
+        # the (file based) response cache outlives the test database -> start every test with an empty cache
+        response_cache.purge_all()
 
     def tearDown(self):
         settings.CATCH_EXCEPTIONS = self.CATCH_EXCEPTIONS_from_settings
@@ -911,3 +921,1165 @@ class TestCore1(RepoResetMixin, FollowRedirectMixin, TestCase):
         response = self.client.post(c.action_url_delete, c.post_data_a15b)
 
         self.assertEqual(len(models.Contribution.objects.all()), N_CTB_IN_FIXTURES - 1)
+
+    # (these checks concern the rendering of the page -> response cache disabled)
+    @override_settings(RESPONSE_CACHE_BACKEND="none")
+    def test_090__committed_render_cache(self):
+        c = self._07x__common()
+        render_cache.invalidate(fdmd.TEST_DEBATE_KEY)
+        url = reverse("test_show_debate")
+
+        with mock.patch("fair_debate_md.load_repo", wraps=fdmd.load_repo) as load_repo_mock:
+            # anonymous user: first request renders the repo, second request uses the cache
+            response1 = self.client.get(url)
+            response2 = self.client.get(url)
+            self.assertEqual(load_repo_mock.call_count, 1)
+            self.assertEqual(response1.status_code, 200)
+            self.assertEqual(
+                BeautifulSoup(response1.content, "html.parser").find(class_="rendered_content"),
+                BeautifulSoup(response2.content, "html.parser").find(class_="rendered_content"),
+            )
+            self.assertEqual(get_parsed_element_by_id("data-num_answers", res=response2), 6)
+            self.assertEqual(get_parsed_element_by_id("data-deepest_level", res=response2), 3)
+
+            # logged in user without uncommitted contributions also uses the cache
+            self.perform_login(username="testuser_1")
+            response = self.client.get(url)
+            self.assertEqual(load_repo_mock.call_count, 1)
+
+            # commit by testuser_2 -> new HEAD -> cache entry must not be used anymore
+            self.perform_login(username="testuser_2")
+            self.mark_repo_for_reset(c.repo_dir)
+            self.client.post(reverse("commit_contribution"), c.post_data_a15b)
+            self.perform_logout()
+            n_calls = load_repo_mock.call_count
+
+            response = self.client.get(url)
+            self.assertEqual(load_repo_mock.call_count, n_calls + 1)
+            self.assertEqual(get_parsed_element_by_id("data-num_answers", res=response), 7)
+
+            # the cache is also validated against HEAD if the repo is changed outside of the app
+            self.reset_git_repo()
+            self.git_reset_id = None
+            response = self.client.get(url)
+            self.assertEqual(load_repo_mock.call_count, n_calls + 2)
+            self.assertEqual(get_parsed_element_by_id("data-num_answers", res=response), 6)
+
+    def test_091__render_with_drafts(self):
+        render_cache.invalidate(fdmd.TEST_DEBATE_KEY)
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        author = models.DebateUser.objects.get(username="testuser_2")
+
+        ctb_list = [
+            fdmd.DBContribution(ctb_key=ctb_obj.contribution_key, body=ctb_obj.body)
+            for ctb_obj in debate_obj.contribution_set.filter(author=author)
+        ]
+        # add some markup which is sensitive to the html processing
+        ctb_list.append(fdmd.DBContribution(ctb_key="a14b", body="Some `code` and\n\n```\ncode\nblock\n```"))
+        self.assertEqual(len(ctb_list), 3)
+
+        ddl = fdmd.load_repo(REPO_HOST_DIR, fdmd.TEST_DEBATE_KEY, ctb_list=ctb_list, new_debate=False)
+        res = render_cache.get_render_with_drafts(REPO_HOST_DIR, fdmd.TEST_DEBATE_KEY, ctb_list)
+
+        # only the indentation differs (fdmd prettifies the whole document) -> compare the normalized html
+        res_soup = BeautifulSoup(res.final_html, "html.parser")
+        ddl_soup = BeautifulSoup(ddl.final_html, "html.parser")
+        self.assertEqual(res_soup.prettify(), ddl_soup.prettify())
+        self.assertEqual(
+            [elt.text.strip() for elt in res_soup.find_all("code")],
+            [elt.text.strip() for elt in ddl_soup.find_all("code")],
+        )
+        self.assertIn("<code>code</code>", res.final_html)
+        self.assertEqual(len(res_soup.find_all("div", class_="db_ctb")), 3)
+        self.assertEqual(res.num_answers, ddl.num_answers)
+        for level, keys in ddl.level_tree.items():
+            self.assertEqual(sorted(res.level_tree[level]), sorted(keys))
+
+        # the cached committed render must not be affected
+        cr = render_cache.get_committed_render(REPO_HOST_DIR, fdmd.TEST_DEBATE_KEY)
+        self.assertNotIn("db_ctb", cr.final_html)
+        self.assertEqual(cr.num_answers, ddl.num_answers - 3)
+
+        # unknown reference segment -> no result (caller falls back to fdmd.load_repo)
+        ctb_list = [fdmd.DBContribution(ctb_key="a999b", body="answer to nonexisting segment")]
+        self.assertIsNone(render_cache.get_render_with_drafts(REPO_HOST_DIR, fdmd.TEST_DEBATE_KEY, ctb_list))
+
+    def test_092__commit_queue(self):
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+
+        with self.settings(COMMIT_QUEUE=True):
+            response = self.client.post(c.action_url_all, c.post_data_all)
+
+        # the commit is only enqueued
+        self.assertEqual(response.status_code, 202)
+        data = json.loads(response.content)
+        self.assertEqual(data["state"], models.CommitJob.State.PENDING)
+        for fpath in c.fpaths_all:
+            self.assertFalse(os.path.exists(fpath))
+        self.assertEqual(len(models.Contribution.objects.all()), N_CTB_IN_FIXTURES)
+
+        response = self.client.get(data["status_url"])
+        self.assertEqual(json.loads(response.content)["state"], models.CommitJob.State.PENDING)
+
+        # other users cannot see the job
+        self.perform_login(username="testuser_1")
+        response = self.client.get(data["status_url"])
+        self.assertEqual(response.status_code, 404)
+
+        # simulate the worker process
+        self.assertEqual(commit_handling.process_pending_jobs(), 1)
+        self.assertEqual(commit_handling.process_pending_jobs(), 0)
+
+        for fpath in c.fpaths_all:
+            self.assertTrue(os.path.exists(fpath))
+        self.assertEqual(len(models.Contribution.objects.all()), 0)
+
+        self.perform_login(username="testuser_2")
+        response = self.client.get(data["status_url"])
+        self.assertEqual(json.loads(response.content)["state"], models.CommitJob.State.DONE)
+
+    def test_093__repo_lock(self):
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+        repo_lock.stats.reset()
+
+        with self.settings(REPO_LOCK_TIMEOUT=0.2):
+            with repo_lock.debate_lock(fdmd.TEST_DEBATE_KEY):
+                # the repo of another debate can be locked at the same time
+                with repo_lock.debate_lock("d02-test_debate"):
+                    pass
+
+                # concurrent commit to the same debate -> bounded wait
+                response = self.client.post(c.action_url_single, c.post_data_a15b)
+                self.assertEqual(response.status_code, 503)
+                self.assertFalse(os.path.exists(c.fpaths_a15b[0]))
+                self.assertEqual(len(models.Contribution.objects.all()), N_CTB_IN_FIXTURES)
+
+            stats = repo_lock.stats.as_dict()
+            self.assertEqual(stats["n_acquired"], 2)
+            self.assertEqual(stats["n_timeouts"], 1)
+            self.assertGreaterEqual(stats["max_wait_time"], 0.2)
+
+            stale_ctb_objs = list(models.Contribution.objects.filter(contribution_key="a15b"))
+            response = self.client.post(c.action_url_single, c.post_data_a15b)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(os.path.exists(c.fpaths_a15b[0]))
+            self.assertEqual(len(models.Contribution.objects.all()), N_CTB_IN_FIXTURES - 1)
+
+        # the contribution has already been committed by a concurrent request -> nothing happens
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        n = debate_obj.n_committed_contributions
+        commit_handling.commit_contributions(debate_obj, stale_ctb_objs)
+        debate_obj.refresh_from_db()
+        self.assertEqual(debate_obj.n_committed_contributions, n)
+
+    # (these checks concern the rendering of the page -> response cache disabled)
+    @override_settings(RESPONSE_CACHE_BACKEND="none")
+    def test_094__unique_debate_key(self):
+        from django.db import IntegrityError, transaction
+
+        self.assertEqual(models.Debate.get_duplicate_keys(), [])
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                models.Debate.objects.create(debate_key=fdmd.TEST_DEBATE_KEY)
+
+        # the debate is fetched only once (incl. user_a and user_b)
+        url = reverse("test_show_debate")
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse("show_debate", kwargs={"debate_key": "d999-not_existing"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_095__contribution_query_plans(self):
+        from django.db import connection, IntegrityError, transaction
+
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is specific to sqlite")
+
+        def get_query_plan(qs) -> str:
+            sql, params = qs.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                return "\n".join(row[-1] for row in cursor.fetchall())
+
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        author = models.DebateUser.objects.get(username="testuser_2")
+
+        # index search on both columns (no table scan)
+        plan = get_query_plan(debate_obj.contribution_set.filter(author=author))
+        self.assertIn("USING INDEX ctb_debate_author_idx (debate_id=? AND author_id=?)", plan)
+        self.assertNotIn("SCAN", plan)
+
+        # (sqlite implements the unique constraint by an automatic index)
+        plan = get_query_plan(debate_obj.contribution_set.filter(contribution_key="a15b"))
+        self.assertIn("(debate_id=? AND contribution_key=?)", plan)
+        self.assertNotIn("SCAN", plan)
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                models.Contribution.objects.create(
+                    author=author, debate=debate_obj, contribution_key="a15b", body="duplicate"
+                )
+
+    def test_096__debate_feed(self):
+        user1 = models.DebateUser.objects.get(username="testuser_1")
+        user2 = models.DebateUser.objects.get(username="testuser_2")
+
+        # the feed is created while loading the fixtures
+        self.assertEqual(models.DebateFeedEntry.objects.filter(user=None).count(), N_DEBATES_IN_FIXTURES)
+        for user, n in ((user1, N_DEBATES_USER_1), (user2, N_DEBATES_USER_2)):
+            feed_keys = [entry.debate_key for entry in models.DebateFeedEntry.get_for_user(user)]
+            self.assertEqual(len(feed_keys), n)
+            self.assertEqual(feed_keys, [debate.debate_key for debate in models.Debate.get_for_user(user)])
+
+        public_debates = models.Debate.objects.filter(discoverability=models.Debate.Discoverability.PUBLIC)
+        self.assertEqual(
+            [entry.debate_key for entry in models.DebateFeedEntry.get_public(limit=3)],
+            [debate.debate_key for debate in public_debates.order_by("-update_date", "-id")[:3]],
+        )
+
+        # saving a debate moves it to the top of the feed
+        debate_obj = models.Debate.objects.get(debate_key="d02-test_debate")
+        debate_obj.save()
+        self.assertEqual(models.DebateFeedEntry.get_public(limit=1)[0].debate_key, "d02-test_debate")
+        self.assertEqual(models.DebateFeedEntry.get_for_user(user1, limit=1)[0].debate_key, "d02-test_debate")
+
+        # landing page: one query for each list (session and user are taken from the shared cache)
+        self.perform_login(username="testuser_1")
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("landing_page"))
+        self.assertEqual(response.status_code, 200)
+
+        debate_obj.delete()
+        self.assertEqual(models.DebateFeedEntry.objects.filter(debate_key="d02-test_debate").count(), 0)
+
+    def test_097__debate_list_pagination(self):
+        url = reverse("debate_list_json")
+        user1 = models.DebateUser.objects.get(username="testuser_1")
+
+        # make two debates have the same update_date (-> tie broken by debate id)
+        entries = models.DebateFeedEntry.objects.filter(debate_key__in=["d02-test_debate", "d03-test_debate"])
+        entries.update(update_date=entries[0].update_date)
+
+        response = self.client.get(url, {"role": "all"})
+        self.assertEqual(response.status_code, 403)
+
+        self.perform_login(username="testuser_1")
+
+        debate_keys = []
+        params = {"role": "all", "limit": 2}
+        while True:
+            with self.assertNumQueries(1):
+                # feed entries (session and user are taken from the shared cache)
+                response = self.client.get(url, params)
+            data = json.loads(response.content)
+            self.assertLessEqual(len(data["debates"]), 2)
+            debate_keys.extend(debate["debate_key"] for debate in data["debates"])
+            if data["next_cursor"] is None:
+                break
+            params["cursor"] = data["next_cursor"]
+
+        expected_keys = [entry.debate_key for entry in models.DebateFeedEntry.get_for_user(user1)]
+        self.assertEqual(debate_keys, expected_keys)
+        self.assertEqual(len(debate_keys), N_DEBATES_USER_1)
+
+        # filter by discoverability
+        response = self.client.get(url, {"role": "a", "discoverability": "private"})
+        data = json.loads(response.content)
+        self.assertEqual([debate["discoverability"] for debate in data["debates"]], ["private"])
+
+        # public debates (html)
+        response = self.client.get(reverse("debate_list"), {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        soup = BeautifulSoup(response.content, "html.parser")
+        self.assertEqual(len(soup.find(id="debate_list").find_all("li")), 2)
+        response = self.client.get(soup.find(id="next_page_link")["href"])
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_098__debate_metadata(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        # the fixtures do not contain the metadata
+        self.assertEqual(debate_obj.num_answers, 0)
+        self.assertEqual(debate_obj.title, fdmd.TEST_DEBATE_KEY)
+        update_date = debate_obj.update_date
+
+        call_command("updatedebatemetadata", stdout=StringIO())
+        debate_obj.refresh_from_db()
+        self.assertEqual(debate_obj.num_answers, 6)
+        self.assertEqual(debate_obj.deepest_level, 3)
+        self.assertEqual(debate_obj.update_date, update_date)
+        feed_entry = models.DebateFeedEntry.objects.get(debate=debate_obj, user=None)
+        self.assertEqual(feed_entry.num_answers, 6)
+        self.assertEqual(feed_entry.update_date, update_date)
+
+        # the metadata is updated at commit time
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+        self.client.post(c.action_url_all, c.post_data_all)
+        debate_obj.refresh_from_db()
+        self.assertEqual(debate_obj.num_answers, 8)
+        self.assertEqual(debate_obj.deepest_level, 3)
+        self.assertEqual(models.DebateFeedEntry.objects.get(debate=debate_obj, user=None).num_answers, 8)
+
+        # title from data.toml
+        with open(pjoin(c.repo_dir, "data.toml"), "w") as fp:
+            fp.write('title = "Lorem ipsum debate"\n')
+        try:
+            debate_obj.update_metadata_from_repo(REPO_HOST_DIR)
+        finally:
+            os.remove(pjoin(c.repo_dir, "data.toml"))
+        self.assertEqual(debate_obj.title, "Lorem ipsum debate")
+
+    def test_099__prerendered_simple_pages(self):
+        from base import simple_pages_interface, simple_pages_core
+
+        n_keys = len(simple_pages_interface.sp_defdict)
+        sp = simple_pages_interface.get_sp("landing")
+        self.assertIsNotNone(sp._content_html)
+        self.assertEqual(sp.language_list, [None])
+
+        with mock.patch("markdown.markdown", wraps=simple_pages_core.markdown.markdown) as markdown_mock:
+            response = self.client.get(reverse("landing_page"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(markdown_mock.call_count, 0)
+
+            # dynamic content (error messages) is memoized
+            for i in range(2):
+                response = self.client.get("/this/does/not/exist")
+                self.assertEqual(response.status_code, 404)
+            self.assertEqual(markdown_mock.call_count, 1)
+
+        # unknown page types neither modify the shared data nor the content dict
+        sp = simple_pages_interface.get_sp("not_existing_pagetype")
+        self.assertEqual(sp.type, "unknown")
+        self.assertEqual(len(simple_pages_interface.sp_defdict), n_keys)
+
+    # (these checks concern the rendering of the page -> response cache disabled)
+    @override_settings(RESPONSE_CACHE_BACKEND="none")
+    def test_100__cached_sanitization(self):
+        from django_bleach.templatetags.bleach_tags import bleach_value
+
+        render_cache.get_cache().clear()
+        url = reverse("test_show_debate")
+        cr = render_cache.get_committed_render(REPO_HOST_DIR, fdmd.TEST_DEBATE_KEY)
+
+        # same result as the template filter
+        self.assertEqual(render_cache.get_sanitized_html(cr.final_html), bleach_value(cr.final_html))
+
+        def n_debate_html_calls(clean_mock):
+            # note: small snippets (e.g. in base.html) are still sanitized by the template filter
+            return len([call for call in clean_mock.call_args_list if len(call.args[0]) > 1000])
+
+        with mock.patch("bleach.clean", wraps=render_cache.bleach.clean) as clean_mock:
+            response1 = self.client.get(url)
+            response2 = self.client.get(url)
+            self.assertEqual(n_debate_html_calls(clean_mock), 0)
+
+            # changing the policy invalidates the cached result
+            with self.settings(BLEACH_ALLOWED_TAGS=["p"]):
+                response3 = self.client.get(url)
+            self.assertEqual(n_debate_html_calls(clean_mock), 1)
+
+        def get_content(response):
+            return BeautifulSoup(response.content, "html.parser").find(class_="rendered_content")
+
+        self.assertEqual(get_content(response1), get_content(response2))
+        self.assertNotEqual(get_content(response1), get_content(response3))
+
+    # (these checks concern the view itself -> response cache disabled)
+    @override_settings(RESPONSE_CACHE_BACKEND="none")
+    def test_101__conditional_get(self):
+        c = self._07x__common()
+        url = reverse("test_show_debate")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # the second response has the etag for the csrf cookie which was set by the first one
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        with mock.patch("base.render_cache.get_committed_render") as get_committed_render_mock:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        # nothing is rendered
+        get_committed_render_mock.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        # the page of a logged in user is different
+        self.perform_login(username="testuser_1")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag_user1 = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag_user1).status_code, 304)
+
+        # changed drafts -> new etag
+        self.perform_login(username="testuser_2")
+        etag_user2 = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag_user2).status_code, 304)
+        ctb_obj = models.Contribution.objects.get(contribution_key="a15b")
+        ctb_obj.body = "changed body"
+        ctb_obj.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag_user2)
+        self.assertEqual(response.status_code, 200)
+
+        # new commit -> new HEAD -> new etag
+        etag_user2 = response["ETag"]
+        self.mark_repo_for_reset(c.repo_dir)
+        self.client.post(reverse("commit_contribution"), c.post_data_a2b1a1b)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag_user2).status_code, 200)
+
+    def test_102__response_cache(self):
+
+        c = self._07x__common()
+        url = reverse("test_show_debate")
+
+        # (the page was already requested in `_06x__common`)
+        response_cache.purge_all()
+        with mock.patch("base.render_cache.get_committed_render", wraps=render_cache.get_committed_render) as m:
+            response1 = self.client.get(url)
+            response2 = self.client.get(url)
+            self.assertEqual(m.call_count, 1)
+
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response2.status_code, 200)
+
+        # the cached page contains a valid csrf token (for the cookie of the current client)
+        self.assertNotIn(response_cache.CSRF_PLACEHOLDER.encode(), response2.content)
+        csrf_token = get_parsed_element_by_id("data-csrf_token", res=response2)
+        self.assertEqual(len(csrf_token), 64)
+        soup = BeautifulSoup(response2.content, "html.parser")
+        self.assertEqual(soup.find("input", attrs={"name": "csrfmiddlewaretoken"})["value"], csrf_token)
+
+        # conditional GET also works for cached pages
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response2["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        # other (new) clients get their own token
+        response = self.client_class().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(response_cache.CSRF_PLACEHOLDER.encode(), response.content)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+        # the token can be used for a post request (login)
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.get(url)
+        csrf_token = get_parsed_element_by_id("data-csrf_token", res=response)
+        response = client.post(
+            reverse("login"),
+            {"username": "testuser_2", "password": "foo", "csrfmiddlewaretoken": csrf_token},
+        )
+        self.assertNotEqual(response.status_code, 403)
+
+        # logged in users are not affected
+        self.perform_login(username="testuser_2")
+        response = self.client.get(url)
+        self.assertEqual(get_parsed_element_by_id("data-num_db_ctbs", res=response), 2)
+
+        # commit -> purge
+        self.mark_repo_for_reset(c.repo_dir)
+        self.client.post(reverse("commit_contribution"), c.post_data_a15b)
+        self.perform_logout()
+        response = self.client.get(url)
+        self.assertEqual(get_parsed_element_by_id("data-num_answers", res=response), 7)
+
+    def test_103__streaming_response(self):
+
+        self._07x__common()
+        url = reverse("test_show_debate")
+
+        def get_rendered_content(content):
+            return BeautifulSoup(content, "html.parser").find(class_="rendered_content")
+
+        def insert_streamed_levels(rendered_content):
+            # (like `insertStreamedLevels` in core.js)
+            for template in rendered_content.find_all("template", class_=views.STREAMED_LEVEL_CLASS):
+                for contribution_div in template.find_all("div", class_="contribution", recursive=False):
+                    placeholder = rendered_content.find(id=contribution_div["id"])
+                    placeholder.replace_with(contribution_div.extract())
+                template.decompose()
+            return BeautifulSoup(str(rendered_content), "html.parser").prettify()
+
+        self.perform_login(username="testuser_2")
+        response1 = self.client.get(url)
+        self.assertFalse(response1.streaming)
+
+        with override_settings(DEBATE_STREAMING_MIN_SIZE=1):
+            with mock.patch.object(render_cache, "get_level_parts", wraps=render_cache.get_level_parts) as m:
+                response2 = self.client.get(url)
+                self.assertTrue(response2.streaming)
+                self.assertIn("ETag", response2)
+
+                # the header is sent before the debate html is generated
+                chunks = iter(response2.streaming_content)
+                header = next(chunks)
+                self.assertIn(b"second_sticky_bar", header)
+                self.assertEqual(m.call_count, 0)
+                content2 = header + b"".join(chunks)
+                self.assertEqual(m.call_count, 1)
+
+        self.assertNotIn(views.DEBATE_STREAMING_MARKER.encode(), content2)
+        rendered_content2 = get_rendered_content(content2)
+
+        # one template per level (root contribution: placeholders for level 1)
+        templates = rendered_content2.find_all("template", class_=views.STREAMED_LEVEL_CLASS)
+        self.assertEqual([template["data-level"] for template in templates], ["1", "2", "3"])
+        placeholder = rendered_content2.find(id="contribution_a2b")
+        self.assertIn(render_cache.LAZY_PLACEHOLDER_CLASS, placeholder["class"])
+        self.assertEqual(list(placeholder.children), [])
+
+        self.assertEqual(
+            insert_streamed_levels(rendered_content2),
+            BeautifulSoup(str(get_rendered_content(response1.content)), "html.parser").prettify(),
+        )
+        for element_id in ("data-num_db_ctbs", "data-num_answers", "data-deepest_level", "data-api_data"):
+            self.assertEqual(
+                get_parsed_element_by_id(element_id, res=response1),
+                json.loads(BeautifulSoup(content2, "html.parser").find(id=element_id).text),
+            )
+
+        # the debate html is not smaller than the threshold -> no streaming
+        with override_settings(DEBATE_STREAMING_MIN_SIZE=10**9):
+            response = self.client.get(url)
+        self.assertFalse(response.streaming)
+
+        # errors are still reported with the correct status code
+        with override_settings(DEBATE_STREAMING_MIN_SIZE=1):
+            response = self.client.get(reverse("show_debate", kwargs={"debate_key": "unknown"}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.streaming)
+
+        # anonymous users: pages for the response cache are never streamed
+        self.perform_logout()
+        with override_settings(DEBATE_STREAMING_MIN_SIZE=1):
+            response = self.client.get(url)
+        self.assertFalse(response.streaming)
+        self.assertNotIn(response_cache.CSRF_PLACEHOLDER.encode(), response.content)
+
+        with override_settings(DEBATE_STREAMING_MIN_SIZE=1, RESPONSE_CACHE_BACKEND="none"):
+            response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content)
+        self.assertNotIn(response_cache.CSRF_PLACEHOLDER.encode(), content)
+        self.assertEqual(len(BeautifulSoup(content, "html.parser").find(id="data-csrf_token").text), 66)
+
+    @override_settings(RESPONSE_CACHE_BACKEND="none")
+    def test_104__lazy_loading(self):
+        self._07x__common()
+        url = reverse("test_show_debate")
+
+        def get_rendered_content(response):
+            return BeautifulSoup(response.content, "html.parser").find(class_="rendered_content")
+
+        def get_fragment_response(contribution_key, debate_key=fdmd.TEST_DEBATE_KEY):
+            kwargs = {"debate_key": debate_key, "contribution_key": contribution_key}
+            return self.client.get(reverse("contribution_fragment", kwargs=kwargs))
+
+        response1 = self.client.get(url)
+        self.assertEqual(get_parsed_element_by_id("data-lazy_loading", res=response1), False)
+
+        with override_settings(DEBATE_LAZY_LOADING_MIN_ANSWERS=1):
+            response2 = self.client.get(url)
+        self.assertEqual(get_parsed_element_by_id("data-lazy_loading", res=response2), True)
+        self.assertEqual(get_parsed_element_by_id("data-deepest_level", res=response2), 3)
+
+        # level 2 is only a placeholder, level 3 is missing
+        rendered_content = get_rendered_content(response2)
+        placeholder = rendered_content.find(id="contribution_a2b1a")
+        self.assertEqual(placeholder["class"], ["contribution", "level2", render_cache.LAZY_PLACEHOLDER_CLASS])
+        self.assertEqual(list(placeholder.children), [])
+        self.assertIsNone(rendered_content.find(id="contribution_a2b1a3b"))
+        self.assertIsNotNone(rendered_content.find(id="contribution_a7b"))
+
+        # inserting the fragment results in the complete debate
+        response = get_fragment_response("a2b1a")
+        self.assertEqual(response.status_code, 200)
+        fragment_html = response.json()["html"]
+        self.assertIn('id="contribution_a2b1a3b"', fragment_html)
+        placeholder.replace_with(BeautifulSoup(fragment_html, "html.parser"))
+        self.assertEqual(
+            BeautifulSoup(str(rendered_content), "html.parser").prettify(),
+            BeautifulSoup(str(get_rendered_content(response1)), "html.parser").prettify(),
+        )
+
+        # nested contributions and contributions of the initial levels can be fetched as well
+        response = get_fragment_response("a2b1a3b")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["html"].startswith('<div class="contribution level3"'))
+        response = get_fragment_response("a4b")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["html"].startswith('<div class="contribution level1"'))
+
+        self.assertEqual(get_fragment_response("a2b1a5b").status_code, 404)
+        self.assertEqual(get_fragment_response("a", debate_key="unknown").status_code, 404)
+
+        # uncommitted contributions are always sent completely
+        self.perform_login(username="testuser_2")
+        with override_settings(DEBATE_LAZY_LOADING_MIN_ANSWERS=1):
+            response = self.client.get(url)
+        self.assertEqual(get_parsed_element_by_id("data-lazy_loading", res=response), False)
+        self.assertIsNotNone(get_rendered_content(response).find(id="contribution_a2b1a3b"))
+        self.perform_logout()
+
+        # small debates are sent completely
+        with override_settings(DEBATE_LAZY_LOADING_MIN_ANSWERS=7):
+            response = self.client.get(url)
+        self.assertEqual(get_parsed_element_by_id("data-lazy_loading", res=response), False)
+
+    def test_105__sqlite_profile(self):
+        from django.db import connection
+
+        if connection.vendor != "sqlite":
+            return
+
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+        init_command = settings.DATABASES["default"]["OPTIONS"]["init_command"]
+        busy_timeout = int(re.search(r"busy_timeout=(\d+)", init_command).group(1))
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], busy_timeout)
+            cursor.execute("PRAGMA synchronous")
+            # 1 ≙ NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_106__cached_sessions_and_users(self):
+        from django.core.cache import caches
+        from django.contrib.sessions.models import Session
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from base import user_cache
+
+        self.assertEqual(caches["shared"]._dir, os.path.abspath(TEST_SHARED_CACHE_DIR))
+
+        # anonymous requests create no sessions
+        for url in [reverse("landing_page"), reverse("test_show_debate"), reverse("debate_list")]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Session.objects.count(), 0)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+        self.perform_login(username="testuser_2")
+        self.assertEqual(Session.objects.count(), 1)
+
+        def get_tables_of_queries(url):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return " ".join(query["sql"] for query in ctx.captured_queries)
+
+        url = reverse("user_profile")
+        get_tables_of_queries(url)
+        sql = get_tables_of_queries(url)
+        self.assertNotIn("django_session", sql)
+        self.assertNotIn('FROM "base_debateuser"', sql)
+
+        # password change -> cache entry is removed, other sessions become invalid
+        user = models.DebateUser.objects.get(username="testuser_2")
+        self.assertIsNotNone(user_cache.get_cache().get(user_cache.get_cache_key(user.pk)))
+        user.set_password("new_password")
+        user.save()
+        self.assertIsNone(user_cache.get_cache().get(user_cache.get_cache_key(user.pk)))
+
+        response = self.client.get(url)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_107__async_views(self):
+        from importlib import reload
+        from asgiref.sync import async_to_sync, iscoroutinefunction
+        from django.urls import clear_url_caches, resolve
+        import base.urls
+        import project.urls
+        from base import io_pool
+
+        def reload_urls():
+            reload(base.urls)
+            reload(project.urls)
+            clear_url_caches()
+
+        def get_rendered_content(content):
+            return BeautifulSoup(content, "html.parser").find(class_="rendered_content")
+
+        async def aget_streaming_content(response):
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        url = reverse("test_show_debate")
+        response_sync = self.client.get(url)
+        response_cache.purge_all()
+
+        with override_settings(SERVER_MODE="asgi"):
+            reload_urls()
+        try:
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+            self.assertTrue(iscoroutinefunction(resolve(reverse("landing_page")).func))
+            aget = async_to_sync(self.async_client.get)
+
+            # anonymous (via the response cache)
+            with mock.patch("base.io_pool.run", wraps=io_pool.run) as m:
+                response = aget(url)
+                self.assertEqual(m.call_count, 2)  # head commit and repo
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(get_parsed_element_by_id("data-num_answers", res=response), 6)
+            self.assertEqual(get_rendered_content(response.content), get_rendered_content(response_sync.content))
+            # (the first response has set the csrf cookie, which is part of the ETag)
+            response = aget(url)
+            response = aget(url, headers={"If-None-Match": response["ETag"]})
+            self.assertEqual(response.status_code, 304)
+
+            for page_url in (reverse("landing_page"), reverse("about_page")):
+                response = aget(page_url)
+                self.assertEqual(response.status_code, 200)
+
+            response = aget(reverse("show_debate", kwargs={"debate_key": "unknown"}))
+            self.assertEqual(response.status_code, 404)
+
+            # logged in (with uncommitted contributions)
+            self.async_client.force_login(models.DebateUser.objects.get(username="testuser_2"))
+            response = aget(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(get_parsed_element_by_id("data-num_db_ctbs", res=response), 2)
+            self.assertEqual(get_parsed_element_by_id("data-user_role", res=response), "b")
+            response = aget(url, headers={"If-None-Match": response["ETag"]})
+            self.assertEqual(response.status_code, 304)
+
+            response = aget(reverse("landing_page"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context["data"]["recent_user_debate_list"]), 3)
+
+            with override_settings(DEBATE_STREAMING_MIN_SIZE=1):
+                response = aget(url)
+            self.assertTrue(response.streaming)
+            self.assertTrue(response.is_async)
+            content = async_to_sync(aget_streaming_content)(response)
+            self.assertIsNotNone(get_rendered_content(content).find(id="contribution_a15b"))
+        finally:
+            reload_urls()
+
+    def test_108__import_time(self):
+
+        # the debug-only dependency ipydex must not be imported by the app modules (module level)
+        base_dir = pjoin(settings.BASE_DIR, "base")
+        for dirpath, dirnames, filenames in os.walk(base_dir):
+            for fname in filenames:
+                if not fname.endswith(".py"):
+                    continue
+                fpath = pjoin(dirpath, fname)
+                with open(fpath) as fp:
+                    tree = ast.parse(fp.read())
+                for node in tree.body:
+                    if isinstance(node, ast.Import):
+                        names = [alias.name for alias in node.names]
+                    elif isinstance(node, ast.ImportFrom):
+                        names = [node.module or ""]
+                    else:
+                        continue
+                    self.assertFalse(any(name.split(".")[0] == "ipydex" for name in names), msg=fpath)
+
+        # import profile of the worker boot (settings, apps, models, middleware)
+        code = (
+            "import os, sys, json;"
+            "os.environ['DJANGO_SETTINGS_MODULE'] = 'project.settings';"
+            "from django.core.wsgi import get_wsgi_application;"
+            "get_wsgi_application();"
+            "print(json.dumps(sorted(sys.modules)))"
+        )
+        res = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "PYTHONPATH": settings.BASE_DIR},
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(res.returncode, 0, msg=res.stderr[-2000:])
+        module_names = json.loads(res.stdout.strip().splitlines()[-1])
+
+        # the rendering stack is imported by the first request (or by the preload hook of gunicorn)
+        for name in ["fair_debate_md", "markdown", "git", "bs4", "base.views", "base.render_cache"]:
+            self.assertNotIn(name, module_names)
+
+        # sum of the top level entries (note: modules which are imported via importlib (settings, apps,
+        # middleware) are not listed themselves, only the modules they import)
+        total_time_us = 0
+        for line in res.stderr.splitlines():
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+            if match:
+                total_time_us += int(match.group(1))
+        boot_import_time_budget_us = 1.5e6
+        self.assertLess(total_time_us, boot_import_time_budget_us)
+
+    def test_109__request_metrics(self):
+        from base import metrics
+
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        metrics.registry.reset()
+        shutil.rmtree(TEST_METRICS_DIR, ignore_errors=True)
+        response_cache.purge_all()
+        render_cache.invalidate(fdmd.TEST_DEBATE_KEY)
+
+        url = reverse("show_debate", kwargs={"debate_key": fdmd.TEST_DEBATE_KEY})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("landing_page"))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/unknown/path/")
+        self.assertEqual(response.status_code, 404)
+
+        data = metrics.registry.as_dict()
+        self.assertEqual(set(data), {"show_debate", "landing_page", metrics.UNRESOLVED})
+        histograms = data["show_debate"]["histograms"]
+        self.assertEqual(data["show_debate"]["n_requests"], 1)
+        self.assertEqual(histograms["wall"]["count"], 1)
+        self.assertEqual(sum(histograms["wall"]["counts"]), 1)
+        for name in ["db", "template", "load_repo", "n_queries"]:
+            self.assertGreater(histograms[name]["sum"], 0, msg=name)
+        self.assertEqual(histograms["commit"]["sum"], 0)
+        self.assertLess(histograms["load_repo"]["sum"], histograms["wall"]["sum"])
+        self.assertLess(histograms["template"]["sum"], histograms["wall"]["sum"])
+        self.assertEqual(data["landing_page"]["histograms"]["load_repo"]["sum"], 0)
+
+        # commit (the redirect is not followed)
+        self.perform_login(username="testuser_2")
+        response = self.client.post(c.action_url_single, c.post_data_a15b)
+        self.assertEqual(response.status_code, 302)
+        histograms = metrics.registry.as_dict()["commit_contribution"]["histograms"]
+        self.assertGreater(histograms["commit"]["sum"], 0)
+
+        # structured log
+        with override_settings(METRICS_LOG_REQUESTS=True):
+            with self.assertLogs("fair-debate.metrics", level="INFO") as cm:
+                self.client.get(reverse("landing_page"))
+        log_data = json.loads(cm.output[0].split("request_metrics ", 1)[1])
+        self.assertEqual(log_data["view"], "landing_page")
+        self.assertEqual(log_data["status"], 200)
+
+        # metrics endpoint
+        metrics_url = reverse("metrics")
+        self.assertEqual(self.client.get(metrics_url).status_code, 404)
+        with override_settings(METRICS_TOKEN="test-token"):
+            response = self.client.get(metrics_url, headers={"Authorization": "Bearer wrong-token"})
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(
+                metrics_url, {"format": "json"}, headers={"Authorization": "Bearer test-token"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["views"]["show_debate"]["n_requests"], 1)
+        self.assertIn("n_acquired", response.json()["repo_lock"])
+
+    def test_110__prometheus_metrics(self):
+        from base import metrics
+
+        metrics.registry.reset()
+        shutil.rmtree(TEST_METRICS_DIR, ignore_errors=True)
+        response_cache.purge_all()
+
+        url = reverse("show_debate", kwargs={"debate_key": fdmd.TEST_DEBATE_KEY})
+        self.client.get(url)
+        self.client.get(url)
+
+        # snapshots of other worker processes: one is still running, one has terminated (pid does not exist)
+        snapshot = metrics.get_snapshot()
+        os.makedirs(TEST_METRICS_DIR, exist_ok=True)
+        for pid in [os.getppid(), 2**30]:
+            with open(pjoin(TEST_METRICS_DIR, f"pid-{pid}.json"), "w") as fp:
+                json.dump(snapshot, fp)
+
+        metrics_url = reverse("metrics")
+        headers = {"Authorization": "Bearer test-token"}
+        with override_settings(METRICS_TOKEN="test-token"):
+            for i in range(2):
+                # the second request ensures that the archived snapshot is not counted twice
+                response = self.client.get(metrics_url, {"format": "json"}, headers=headers)
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                self.assertEqual(data["views"]["show_debate"]["n_requests"], 3 * 2)
+                self.assertEqual(data["counters"]["response_cache_misses"], 3 * 1)
+                self.assertEqual(data["counters"]["response_cache_hits"], 3 * 1)
+            self.assertFalse(os.path.exists(pjoin(TEST_METRICS_DIR, f"pid-{2**30}.json")))
+            self.assertTrue(os.path.exists(pjoin(TEST_METRICS_DIR, metrics.ARCHIVE_FNAME)))
+
+            self.assertEqual(data["health"]["uncommitted_contributions"], N_CTB_IN_FIXTURES)
+            self.assertEqual(data["health"]["commit_jobs"]["pending"], 0)
+            repo_stats = data["health"]["repos"][fdmd.TEST_DEBATE_KEY]
+            self.assertEqual(repo_stats["n_commits"], N_COMMITS_TEST_REPO)
+            self.assertGreater(repo_stats["size"], 0)
+
+            response = self.client.get(metrics_url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        lines = response.content.decode().splitlines()
+        self.assertIn('fair_debate_requests_total{view="show_debate"} 6', lines)
+        self.assertIn('fair_debate_request_duration_seconds_bucket{view="show_debate",le="+Inf"} 6', lines)
+        self.assertIn(f"fair_debate_uncommitted_contributions {N_CTB_IN_FIXTURES}", lines)
+        expected_line = f'fair_debate_repo_commits{{debate="{fdmd.TEST_DEBATE_KEY}"}} {N_COMMITS_TEST_REPO}'
+        self.assertIn(expected_line, lines)
+        self.assertIn('fair_debate_commit_jobs{state="pending"} 0', lines)
+        self.assertIn("# TYPE fair_debate_db_lock_wait_seconds_total counter", lines)
+
+        # sqlite lock wait (measured at BEGIN IMMEDIATE)
+        metrics.registry.reset()
+        metrics.db_execute_wrapper(lambda *args: time.sleep(0.01), "BEGIN IMMEDIATE", None, False, {})
+        self.assertEqual(metrics.registry.counters["db_transactions"], 1)
+        self.assertGreaterEqual(metrics.registry.counters["db_lock_wait_seconds"], 0.01)
+
+    def test_111__batched_commits(self):
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        user = models.DebateUser.objects.get(username="testuser_2")
+        n_committed = debate_obj.n_committed_contributions
+
+        # a concurrent request is waiting for the repo lock (its job is already stored) -> group commit
+        waiting_job = commit_handling.enqueue(debate_obj, user, "commit", "a2b1a1b")
+        response = self.client.post(c.action_url_single, c.post_data_a15b)
+        self.assertEqual(response.status_code, 302)
+
+        for fpath in c.fpaths_all:
+            self.assertTrue(os.path.exists(fpath))
+        self.assertEqual(fdmd.utils.get_number_of_commits(repo_dir=c.repo_dir), N_COMMITS_TEST_REPO + 1)
+        self.assertEqual(len(models.Contribution.objects.all()), N_CTB_IN_FIXTURES - 2)
+
+        waiting_job.refresh_from_db()
+        self.assertEqual(waiting_job.state, models.CommitJob.State.DONE)
+        # the job of the synchronous request itself has been removed
+        self.assertEqual(list(models.CommitJob.objects.all()), [waiting_job])
+
+        debate_obj.refresh_from_db()
+        self.assertEqual(debate_obj.n_committed_contributions, n_committed + 2)
+        feed_entry = models.DebateFeedEntry.objects.get(debate=debate_obj, user=None)
+        self.assertEqual(feed_entry.n_committed_contributions, n_committed + 2)
+        self.assertEqual(feed_entry.update_date, debate_obj.update_date)
+
+        # the counter is incremented by the database (no lost update with stale objects)
+        stale_debate_obj = models.Debate.objects.get(pk=debate_obj.pk)
+        debate_obj.add_committed_contributions(1, settings.REPO_HOST_DIR)
+        stale_debate_obj.add_committed_contributions(1, settings.REPO_HOST_DIR)
+        self.assertEqual(stale_debate_obj.n_committed_contributions, n_committed + 4)
+
+    def test_112__batched_commit_queue(self):
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+
+        with self.settings(COMMIT_QUEUE=True, COMMIT_BATCH_WINDOW=0):
+            for post_data in (c.post_data_a15b, c.post_data_a2b1a1b, c.post_data_a15b):
+                response = self.client.post(c.action_url_single, post_data)
+                self.assertEqual(response.status_code, 202)
+
+            # all jobs of the debate are processed in one batch (-> one git commit)
+            self.assertEqual(commit_handling.process_pending_jobs(), 3)
+
+        for fpath in c.fpaths_all:
+            self.assertTrue(os.path.exists(fpath))
+        self.assertEqual(fdmd.utils.get_number_of_commits(repo_dir=c.repo_dir), N_COMMITS_TEST_REPO + 1)
+        self.assertEqual(len(models.Contribution.objects.all()), N_CTB_IN_FIXTURES - 2)
+
+        # the duplicate job does not fail because the batch commits its contribution
+        states = models.CommitJob.objects.order_by("pk").values_list("state", flat=True)
+        self.assertEqual(list(states), [models.CommitJob.State.DONE] * 3)
+
+    def test_113__response_cache_purge_from_other_process(self):
+        from base import metrics
+
+        if settings.RESPONSE_CACHE_BACKEND != "file":
+            self.skipTest("requires a response cache which is shared by several processes")
+
+        url = reverse("test_show_debate")
+        response_cache.purge_all()
+        self.client.get(url)
+        metrics.registry.reset()
+        self.client.get(url)
+        self.assertEqual(metrics.registry.counters["response_cache_hits"], 1)
+
+        # e.g. the commit worker or another web worker
+        code = (
+            "import os, django;"
+            "os.environ['DJANGO_SETTINGS_MODULE'] = 'project.settings';"
+            "django.setup();"
+            "from base import response_cache;"
+            f"response_cache.purge_debate('{fdmd.TEST_DEBATE_KEY}')"
+        )
+        res = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "PYTHONPATH": settings.BASE_DIR},
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(res.returncode, 0, msg=res.stderr[-2000:])
+
+        self.client.get(url)
+        self.assertEqual(metrics.registry.counters["response_cache_misses"], 1)
+
+    def test_114__sync_commit_job_cleanup(self):
+        from contextlib import contextmanager
+
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+
+        def get_lock_mock(final_state):
+            @contextmanager
+            def debate_lock(debate_key, *args, **kwargs):
+                # a concurrent request has processed the job while this request was waiting for the lock
+                models.CommitJob.objects.update(state=final_state, error_msg="ValueError()")
+                raise repo_lock.RepoLockTimeout("timeout")
+                yield
+
+            return debate_lock
+
+        with mock.patch.object(repo_lock, "debate_lock", get_lock_mock(models.CommitJob.State.DONE)):
+            response = self.client.post(c.action_url_single, c.post_data_a15b)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(models.CommitJob.objects.count(), 0)
+
+        with mock.patch.object(repo_lock, "debate_lock", get_lock_mock(models.CommitJob.State.FAILED)):
+            response = self.client.post(c.action_url_single, c.post_data_a15b)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn(b"Commit failed", response.content)
+        self.assertEqual(models.CommitJob.objects.count(), 0)
+
+        # finished jobs of the commit queue are pruned by the worker
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        State = models.CommitJob.State
+        for state in (State.DONE, State.FAILED, State.PENDING):
+            job = commit_handling.enqueue(debate_obj, None, "commit_all")
+            models.CommitJob.objects.filter(pk=job.pk).update(
+                state=state, update_date=datetime.now(tz=timezone.utc) - timedelta(hours=2)
+            )
+        commit_handling.enqueue(debate_obj, None, "commit_all")
+        self.assertEqual(commit_handling.prune_finished_jobs(max_age=3600), 2)
+        self.assertEqual(models.CommitJob.objects.count(), 2)
+
+    def test_115__recover_interrupted_jobs(self):
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        State = models.CommitJob.State
+        now = datetime.now(tz=timezone.utc)
+
+        # a running job of another worker and a job of a worker which died 2 hours ago
+        job1 = commit_handling.enqueue(debate_obj, None, "commit_all")
+        job2 = commit_handling.enqueue(debate_obj, None, "commit_all")
+        models.CommitJob.objects.filter(pk=job1.pk).update(state=State.RUNNING, update_date=now)
+        models.CommitJob.objects.filter(pk=job2.pk).update(
+            state=State.RUNNING, update_date=now - timedelta(hours=2)
+        )
+
+        self.assertEqual(commit_handling.recover_interrupted_jobs(lease=3600), 1)
+        job1.refresh_from_db()
+        job2.refresh_from_db()
+        self.assertEqual(job1.state, State.RUNNING)
+        self.assertEqual(job2.state, State.PENDING)
+
+        # claiming a job starts a new lease
+        models.CommitJob.objects.filter(pk=job1.pk).delete()
+        models.CommitJob.objects.filter(pk=job2.pk).update(update_date=now - timedelta(hours=2))
+        job = commit_handling.claim_next_job()
+        self.assertEqual(job.pk, job2.pk)
+        self.assertEqual(commit_handling.recover_interrupted_jobs(lease=3600), 0)
+
+    def test_116__cache_purge_after_commit_transaction(self):
+        c = self._07x__common()
+        self.mark_repo_for_reset(c.repo_dir)
+        self.perform_login(username="testuser_2")
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        n_committed = debate_obj.n_committed_contributions
+
+        db_state_at_purge = []
+
+        def purge_debate(debate_key):
+            # a request in this moment must already see the new data (otherwise it caches the old page)
+            feed_entry = models.DebateFeedEntry.objects.get(debate__debate_key=debate_key, user=None)
+            db_state_at_purge.append(
+                (feed_entry.n_committed_contributions, models.Contribution.objects.filter(pk=ctb_pk).exists())
+            )
+
+        ctb_pk = debate_obj.contribution_set.get(contribution_key="a15b").pk
+        with mock.patch.object(response_cache, "purge_debate", purge_debate):
+            response = self.client.post(c.action_url_single, c.post_data_a15b)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(db_state_at_purge, [(n_committed + 1, False)])
+
+    def test_117__debate_feed_with_stale_objects(self):
+        debate_obj = models.Debate.objects.get(debate_key=fdmd.TEST_DEBATE_KEY)
+        stale_debate_obj = models.Debate.objects.get(pk=debate_obj.pk)
+        n_committed = debate_obj.n_committed_contributions
+
+        def get_feed_entry():
+            return models.DebateFeedEntry.objects.get(debate=debate_obj, user=None)
+
+        # concurrent commit
+        debate_obj.add_committed_contributions(1, settings.REPO_HOST_DIR)
+        self.assertEqual(get_feed_entry().n_committed_contributions, n_committed + 1)
+
+        # e.g. deletion of a contribution: only the update date changes
+        stale_debate_obj.save(update_fields=["update_date"])
+        feed_entry = get_feed_entry()
+        self.assertEqual(feed_entry.n_committed_contributions, n_committed + 1)
+        self.assertEqual(feed_entry.update_date, stale_debate_obj.update_date)
+        self.assertEqual(
+            models.DebateFeedEntry.objects.filter(update_date=stale_debate_obj.update_date).count(),
+            models.DebateFeedEntry.objects.filter(debate=debate_obj).count(),
+        )
+
+        # other fields: the feed is rebuilt from the database row
+        stale_debate_obj.repo_title = "new title"
+        stale_debate_obj.save(update_fields=["repo_title", "update_date"])
+        feed_entry = get_feed_entry()
+        self.assertEqual(feed_entry.title, "new title")
+        self.assertEqual(feed_entry.n_committed_contributions, n_committed + 1)
+
+    def test_118__lazy_fragments_batch_and_etag(self):
+        self._07x__common()
+        url = reverse("contribution_fragments", kwargs={"debate_key": fdmd.TEST_DEBATE_KEY})
+        single_url = reverse(
+            "contribution_fragment", kwargs={"debate_key": fdmd.TEST_DEBATE_KEY, "contribution_key": "a2b1a"}
+        )
+
+        # all placeholders of one level with one request, unknown contributions are omitted
+        response = self.client.get(url, {"keys": "a2b1a,a2b1a3b,a4b,a2b1a5b"})
+        self.assertEqual(response.status_code, 200)
+        fragments = response.json()["fragments"]
+        self.assertEqual(set(fragments), {"a2b1a", "a2b1a3b", "a4b"})
+        self.assertEqual(fragments["a2b1a"], self.client.get(single_url).json()["html"])
+        self.assertTrue(fragments["a4b"].startswith('<div class="contribution level1"'))
+        self.assertEqual(self.client.get(url, {"keys": "a"}).status_code, 200)
+        self.assertEqual(
+            self.client.get(reverse("contribution_fragments", kwargs={"debate_key": "unknown"})).status_code,
+            404,
+        )
+
+        # the fragments are cached -> the committed render is not loaded again
+        with mock.patch("base.render_cache.get_committed_render") as get_committed_render_mock:
+            response = self.client.get(url, {"keys": "a2b1a,a4b"})
+            self.assertEqual(self.client.get(single_url).status_code, 200)
+        self.assertEqual(response.json()["fragments"], {k: fragments[k] for k in ("a2b1a", "a4b")})
+        get_committed_render_mock.assert_not_called()
+
+        # revalidation via ETag (based on the repo HEAD)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertEqual(self.client.get(single_url)["ETag"], etag)
+        with mock.patch("base.render_cache.get_lazy_fragments") as get_lazy_fragments_mock:
+            response = self.client.get(url, {"keys": "a2b1a,a4b"}, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        get_lazy_fragments_mock.assert_not_called()
+
+        # a new commit changes the ETag
+        with mock.patch.object(render_cache, "get_head_commit_id", return_value="0" * 40):
+            response = self.client.get(url, {"keys": "a2b1a,a4b"}, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
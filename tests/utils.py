@@ -22,7 +22,7 @@ from selenium.webdriver.chrome.options import Options
 
 from ipydex import IPS
 import fair_debate_md as fdmd
-from base import models
+from base import models, response_cache
 
 pjoin = os.path.join
 
@@ -62,6 +62,12 @@ settings.REPO_HOST_DIR = settings.REPO_HOST_DIR_FOR_TESTS
 REPO_HOST_DIR = settings.REPO_HOST_DIR
 os.makedirs(settings.REPO_HOST_DIR, exist_ok=True)
 
+# sessions and cached user objects of the tests must not interfere with those of a development server
+TEST_SHARED_CACHE_DIR = pjoin(os.path.dirname(settings.REPO_HOST_DIR_FOR_TESTS), "_shared_cache")
+settings.CACHES["shared"]["LOCATION"] = TEST_SHARED_CACHE_DIR
+TEST_METRICS_DIR = pjoin(os.path.dirname(settings.REPO_HOST_DIR_FOR_TESTS), "_metrics")
+settings.METRICS_DIR = TEST_METRICS_DIR
+
 
 class RepoResetMixin:
     def set_up(self):
@@ -69,6 +75,9 @@ class RepoResetMixin:
         self.git_reset_repo: str = None
         self.dirs_to_remove = []
 
+        # the database is reset for every test but the cached pages would survive
+        response_cache.purge_all()
+
     def tear_down(self):
         if self.git_reset_id is not None:
             self.reset_git_repo()